@@ -3,8 +3,22 @@ from flask_jwt_extended import JWTManager
 from flask_cors import CORS
 from config import Config
 from models import db
+from migrations import upgrade_schema
+from database import engine_options, tune_sqlite
 from auth import auth_bp, login_required
 from file_manager import file_manager_bp
+from chunked_upload import chunked_upload_bp
+from deletion import deletion_bp, start_reaper
+from batch import batch_bp
+from search import search_bp
+from usage import usage_bp
+from archive import archive_bp
+from cache import cache_bp, get_cache
+from previews import previews_bp
+from metrics import metrics_bp, init_metrics
+from ingest import IngestRequest
+from storage import get_storage
+from compression import available_encodings
 import os
 
 def create_app(config_class=Config):
@@ -12,21 +26,63 @@ def create_app(config_class=Config):
     app = Flask(__name__)
     app.config.from_object(config_class)
     
+    # Stream uploaded files straight into hashed staging files
+    app.request_class = IngestRequest
+    
     # Initialize extensions
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(app.config))
     db.init_app(app)
+    with app.app_context():
+        tune_sqlite(db.engine, app.config)
+        init_metrics(app, db.engine)
     jwt = JWTManager(app)
     CORS(app, origins=app.config['CORS_ORIGINS'])
     
     # Register blueprints
     app.register_blueprint(auth_bp)
     app.register_blueprint(file_manager_bp)
+    app.register_blueprint(chunked_upload_bp)
+    app.register_blueprint(deletion_bp)
+    app.register_blueprint(batch_bp)
+    app.register_blueprint(search_bp)
+    app.register_blueprint(usage_bp)
+    app.register_blueprint(archive_bp)
+    app.register_blueprint(cache_bp)
+    app.register_blueprint(previews_bp)
+    app.register_blueprint(metrics_bp)
+    
+    # Fail at startup on an unknown or uninstalled at-rest compression codec
+    if app.config['STORAGE_COMPRESSION'] not in ('none',) + available_encodings():
+        raise ValueError(f"STORAGE_COMPRESSION '{app.config['STORAGE_COMPRESSION']}' is not available "
+                         f"(expected one of none, {', '.join(available_encodings())})")
+    
+    # /metrics exposes traffic, error counts and pool state, so it is never served without a token
+    if app.config['METRICS_ENABLED'] and not app.config['METRICS_TOKEN']:
+        raise ValueError("METRICS_ENABLED requires METRICS_TOKEN to be set")
+    
+    if app.config['DOWNLOAD_OFFLOAD'] not in ('none', 'x-accel-redirect', 'x-sendfile'):
+        raise ValueError(f"Unknown DOWNLOAD_OFFLOAD '{app.config['DOWNLOAD_OFFLOAD']}' "
+                         f"(expected one of none, x-accel-redirect, x-sendfile)")
     
     # Create upload folder if it doesn't exist
     os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
     
-    # Create database tables
+    # Create database tables and upgrade existing ones
     with app.app_context():
+        get_storage()  # Fail at startup on a misconfigured storage backend
+        get_cache()  # Likewise for the metadata cache backend
         db.create_all()
+        upgrade_schema()
+    
+    # Reap soft-deleted folders and files in the background
+    if app.config['DELETION_REAPER_THREAD']:
+        start_reaper(app)
+    
+    @app.after_request
+    def advertise_encodings(response):
+        """Tell clients which Content-Encodings request bodies may use (RFC 7694)"""
+        response.headers.setdefault('Accept-Encoding', ', '.join(available_encodings()))
+        return response
     
     # Web routes (for UI)
     @app.route('/')
@@ -89,9 +145,16 @@ def create_app(config_class=Config):
     
     return app
 
-app = create_app()
+def __getattr__(name):
+    # `gunicorn app:app` builds the default app on first access, so importing create_app alone boots nothing
+    if name == 'app':
+        global app
+        app = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 if __name__ == '__main__':
+    app = create_app()
     print("File Manager System starting...")
     # Run the application
     port = int(os.environ.get('PORT', 5000))
@@ -0,0 +1,251 @@
+import os
+import calendar
+import tarfile
+import zipfile
+from flask import Blueprint, request, jsonify, current_app, stream_with_context
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from models import db, User, File, Folder, Blob
+from blobstore import open_blob
+from compression import is_compressible, compressor
+from utils import content_disposition
+
+archive_bp = Blueprint('archive', __name__, url_prefix='/api')
+
+ARCHIVE_FORMATS = ('zip', 'tar')
+
+# 'auto' deflates only compressible types in a zip (a tar is gzipped as a whole)
+ARCHIVE_COMPRESSION_MODES = ('auto', 'store', 'deflate')
+
+# File rows loaded per query while an archive streams
+ARCHIVE_PAGE_SIZE = 500
+
+# Size of the blocks copied from storage into the archive
+ARCHIVE_BUFFER_SIZE = 256 * 1024
+
+class ArchiveBuffer:
+    """
+    Write-only file object collecting archive output between yields
+
+    It can tell() but not seek(), so zipfile writes each member's sizes
+    in a data descriptor after its content instead of going back for them.
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b''.join(self.chunks)
+        self.chunks.clear()
+        return data
+
+def member_name(name):
+    """Make a stored name safe to use as one path component of an archive member"""
+    name = name.replace('/', '_').replace('\\', '_').strip()
+    return '_' if name in ('', '.', '..') else name
+
+def claim_name(used, directory, name, item_id):
+    """Reserve a unique member name within a directory, suffixing the ID on a clash"""
+    taken = used.setdefault(directory, set())
+    if name in taken:
+        stem, extension = os.path.splitext(name)
+        name = f'{stem}_{item_id}{extension}'
+    taken.add(name)
+    return name
+
+def archive_entries(user_id, folder):
+    """
+    Yield (path, None) for every folder and (path, row) for every live file of a subtree
+
+    Paths are relative to `folder` (the whole tree for None), folders come
+    first and file rows are read a page at a time, so only names and paths
+    are held in memory, never content.
+    """
+    folder_filter = [Folder.user_id == user_id, Folder.deleted_at.is_(None)]
+    file_filter = [File.user_id == user_id, File.deleted_at.is_(None)]
+    if folder:
+        subtree_ids = db.select(folder.subtree_cte().c.id)
+        folder_filter += [Folder.id.in_(subtree_ids), Folder.id != folder.id]
+        file_filter.append(File.folder_id.in_(subtree_ids))
+
+    children = {}
+    for folder_id, parent_id, name in db.session.execute(
+        db.select(Folder.id, Folder.parent_folder_id, Folder.folder_name).where(*folder_filter).order_by(Folder.id)
+    ):
+        children.setdefault(parent_id, []).append((folder_id, name))
+
+    # Walk down from the archived folder so parents are listed before their children
+    used = {}
+    paths = {folder.id if folder else None: ''}
+    pending = [folder.id if folder else None]
+    while pending:
+        parent_id = pending.pop()
+        for folder_id, name in children.pop(parent_id, []):
+            name = claim_name(used, paths[parent_id], member_name(name), folder_id)
+            paths[folder_id] = f'{paths[parent_id]}/{name}' if paths[parent_id] else name
+            pending.append(folder_id)
+            yield paths[folder_id], None
+
+    columns = (File.id, File.folder_id, File.original_filename, File.mime_type, File.updated_at,
+               Blob.content_hash, Blob.size, Blob.encoding, Blob.stored_size)
+    last_id = 0
+    while True:
+        page = db.session.execute(
+            db.select(*columns).join(Blob, Blob.content_hash == File.content_hash)
+            .where(*file_filter, File.id > last_id).order_by(File.id).limit(ARCHIVE_PAGE_SIZE)
+        ).all()
+        # Don't hold a transaction open while the page streams
+        db.session.commit()
+
+        for row in page:
+            directory = paths.get(row.folder_id)
+            if directory is None:
+                continue  # In a folder deleted since the folders were read
+            name = claim_name(used, directory, member_name(row.original_filename), row.id)
+            yield (f'{directory}/{name}' if directory else name), row
+
+        if len(page) < ARCHIVE_PAGE_SIZE:
+            return
+        last_id = page[-1].id
+
+def open_member(row):
+    """Open a file's content for archiving (None if it vanished since it was listed)"""
+    try:
+        return open_blob(row)
+    except FileNotFoundError:
+        current_app.logger.warning(f"Skipping file {row.id} in archive: content not found")
+        return None
+
+def copy_member(source, row, write):
+    """Copy a file's content block by block, yielding after each block is written"""
+    copied = 0
+    with source:
+        while True:
+            block = source.read(ARCHIVE_BUFFER_SIZE)
+            if not block:
+                break
+            copied += len(block)
+            yield write(block)
+
+    # A short member would shift everything after it; better to fail the download
+    if copied != row.size:
+        raise IOError(f"File {row.id} changed size while being archived")
+
+def stream_zip(entries, compression):
+    """Generate a zip archive of the entries"""
+    buffer = ArchiveBuffer()
+
+    with zipfile.ZipFile(buffer, 'w', allowZip64=True) as archive:
+        for path, row in entries:
+            if row is None:
+                archive.writestr(zipfile.ZipInfo(path + '/'), b'')
+                continue
+
+            source = open_member(row)
+            if source is None:
+                continue
+
+            info = zipfile.ZipInfo(path, date_time=row.updated_at.timetuple()[:6])
+            info.file_size = row.size  # Lets zipfile decide up front whether the member needs zip64
+            info.external_attr = 0o644 << 16
+            deflate = compression == 'deflate' or (compression == 'auto' and is_compressible(row.mime_type))
+            info.compress_type = zipfile.ZIP_DEFLATED if deflate else zipfile.ZIP_STORED
+
+            with archive.open(info, 'w') as member:
+                for _ in copy_member(source, row, member.write):
+                    yield buffer.take()
+            yield buffer.take()
+
+    yield buffer.take()
+
+def stream_tar(entries, compression):
+    """Generate a tar archive of the entries, gzipped unless `compression` is 'store'"""
+    encoder = compressor('gzip') if compression != 'store' else None
+
+    def encode(data):
+        return encoder.compress(data) if encoder else data
+
+    for path, row in entries:
+        info = tarfile.TarInfo(path)
+        if row is None:
+            info.type = tarfile.DIRTYPE
+            info.mode = 0o755
+            yield encode(info.tobuf(tarfile.PAX_FORMAT))
+            continue
+
+        source = open_member(row)
+        if source is None:
+            continue
+
+        info.size = row.size
+        info.mode = 0o644
+        info.mtime = calendar.timegm(row.updated_at.timetuple())
+        yield encode(info.tobuf(tarfile.PAX_FORMAT))
+        yield from copy_member(source, row, encode)
+        yield encode(b'\0' * (-row.size % tarfile.BLOCKSIZE))
+
+    # End-of-archive marker: two empty blocks
+    yield encode(b'\0' * 2 * tarfile.BLOCKSIZE)
+    if encoder:
+        yield encoder.flush()
+
+@archive_bp.route('/folders/<int:folder_id>/archive', methods=['GET'])
+@archive_bp.route('/archive', methods=['GET'])
+@jwt_required()
+def download_archive(folder_id=None):
+    """
+    Download a folder and everything below it as one archive
+
+    `/archive` archives the user's whole tree. `format` is `zip` (default)
+    or `tar`; `compression` is `auto` (default), `store` or `deflate`. The
+    archive is generated while it is sent, so it is never held in memory
+    or written to disk.
+    """
+    user_id = get_jwt_identity()
+    archive_format = request.args.get('format', 'zip')
+    compression = request.args.get('compression', 'auto')
+
+    if archive_format not in ARCHIVE_FORMATS:
+        return jsonify({'error': "Format must be 'zip' or 'tar'"}), 400
+    if compression not in ARCHIVE_COMPRESSION_MODES:
+        return jsonify({'error': "Compression must be 'auto', 'store' or 'deflate'"}), 400
+
+    folder = None
+    if folder_id:
+        folder = Folder.query.filter_by(id=folder_id, user_id=user_id, deleted_at=None).first()
+        if not folder:
+            return jsonify({'error': 'Folder not found or access denied'}), 404
+        name, total_size, file_count = folder.folder_name, folder.total_size, folder.file_count
+    else:
+        user = db.session.get(User, user_id)
+        name, total_size, file_count = current_app.config['APP_NAME'], user.storage_used, user.file_count
+
+    entries = archive_entries(user_id, folder)
+    if archive_format == 'zip':
+        body, mimetype, extension = stream_zip(entries, compression), 'application/zip', '.zip'
+    elif compression == 'store':
+        body, mimetype, extension = stream_tar(entries, compression), 'application/x-tar', '.tar'
+    else:
+        body, mimetype, extension = stream_tar(entries, compression), 'application/gzip', '.tar.gz'
+
+    response = current_app.response_class(
+        stream_with_context(data for data in body if data), mimetype=mimetype
+    )
+    response.headers['Content-Disposition'] = content_disposition(member_name(name) + extension)
+    # Totals of the archived content, for progress reporting (the archive size is not known up front)
+    response.headers['X-Archive-Files'] = str(file_count)
+    response.headers['X-Archive-Size'] = str(total_size)
+    response.cache_control.private = True
+    response.cache_control.no_store = True
+    return response
@@ -0,0 +1,196 @@
+import io
+import sys
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.exceptions import RequestEntityTooLarge, ClientDisconnected
+from werkzeug.wsgi import FileWrapper
+from app import create_app
+
+class RequestBody(io.RawIOBase):
+    """
+    wsgi.input reading the request body from the ASGI receive channel
+
+    Reads run on the handler's thread and wait for the event loop to
+    receive the next message, so the view ingests an upload (hashing and
+    staging it) while it streams in, and the client is only read as fast
+    as the view consumes the body.
+    """
+
+    def __init__(self, receive, loop):
+        self.receive = receive
+        self.loop = loop
+        self.pending = b''
+        self.more_body = True
+        self.detached = False
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self.pending and self.more_body and not self.detached:
+            message = asyncio.run_coroutine_threadsafe(self.receive(), self.loop).result()
+            if message['type'] == 'http.disconnect':
+                self.more_body = False
+                raise ClientDisconnected()
+            self.pending = message.get('body', b'')
+            self.more_body = message.get('more_body', False)
+
+        size = min(len(buffer), len(self.pending))
+        buffer[:size] = self.pending[:size]
+        self.pending = self.pending[size:]
+        return size
+
+    def stop_reading(self):
+        """Leave the channel to the disconnect watch; what remains of the body reads as empty"""
+        self.detached = True
+
+class ASGIApp:
+    """
+    Serve the app over ASGI without tying a thread to each download
+
+    Run with `uvicorn asgi:app`. Under a sync server a worker is held for
+    as long as the client takes to read a download. Here the Flask view
+    runs on a thread, reading the request body straight from the
+    connection as it arrives, and the response is pumped to the client
+    one chunk at a time, each chunk read (from a file, archive stream or
+    object store) on a thread. A slow reader only holds a coroutine and
+    an open file, so one process can serve thousands of them while the
+    metadata endpoints keep answering. An upload holds its thread for as
+    long as its body takes to arrive, so ASGI_THREADS bounds concurrent
+    uploads per process.
+    """
+
+    def __init__(self, wsgi_app, config):
+        self.wsgi_app = wsgi_app
+        self.chunk_size = config['ASGI_CHUNK_SIZE']
+        self.max_body = config['MAX_CONTENT_LENGTH']
+        self.executor = ThreadPoolExecutor(max_workers=config['ASGI_THREADS'], thread_name_prefix='asgi')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self.http(scope, receive, send)
+        # Websockets are not served; returning without accepting rejects them
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=False, cancel_futures=True)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def file_wrapper(self, file, block_size=8192):
+        """wsgi.file_wrapper reading files in large chunks, so a download takes few thread hops"""
+        return FileWrapper(file, max(block_size, self.chunk_size))
+
+    async def http(self, scope, receive, send):
+        loop = asyncio.get_running_loop()
+        # Every step runs in one context, so a streamed response can pop the request context it pushed
+        context = contextvars.copy_context()
+
+        def run(func, *args):
+            return loop.run_in_executor(self.executor, context.run, func, *args)
+
+        handler = self.wsgi_app
+        declared = dict(scope['headers']).get(b'content-length', b'')
+        if self.max_body is not None and declared.isdigit() and int(declared) > self.max_body:
+            handler = RequestEntityTooLarge()  # Answered the way Flask would, without reading the body
+
+        body = RequestBody(receive, loop)
+        environ = self.environ(scope, io.BufferedReader(body, buffer_size=self.chunk_size))
+        await self.respond(handler, environ, body, send, receive, run)
+
+    async def wait_for_disconnect(self, receive):
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+    def environ(self, scope, body):
+        """Build the WSGI environ of a request whose body is read from the connection"""
+        server = scope.get('server') or ('localhost', 80)
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+            'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+            'QUERY_STRING': scope['query_string'].decode('latin-1'),
+            'SERVER_NAME': server[0],
+            'SERVER_PORT': str(server[1] or 80),
+            'SERVER_PROTOCOL': f"HTTP/{scope['http_version']}",
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': body,
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': True,
+            'wsgi.run_once': False,
+            'wsgi.file_wrapper': self.file_wrapper,
+            'wsgi.input_terminated': True,  # The body ends where the ASGI messages say, with or without a length
+        }
+        if scope.get('client'):
+            environ['REMOTE_ADDR'], environ['REMOTE_PORT'] = scope['client'][0], str(scope['client'][1])
+
+        for name, value in scope['headers']:
+            name = name.decode('latin-1').upper().replace('-', '_')
+            value = value.decode('latin-1')
+            if name == 'TRANSFER_ENCODING':
+                continue  # The server has already undone any chunked encoding
+            key = name if name in ('CONTENT_TYPE', 'CONTENT_LENGTH') else f'HTTP_{name}'
+            if key in environ:
+                value = environ[key] + ('; ' if key == 'HTTP_COOKIE' else ', ') + value
+            environ[key] = value
+        return environ
+
+    async def respond(self, handler, environ, body, send, receive, run):
+        """Run a WSGI handler on a thread and send its response, one chunk per step"""
+        response = {}
+        written = []
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info and response.get('sent'):
+                raise exc_info[1].with_traceback(exc_info[2])
+            response['status'] = int(status.split(' ', 1)[0])
+            response['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                                   for name, value in headers]
+            # Data passed to the legacy write() callable goes out ahead of the iterable's next chunk
+            return written.append
+
+        async def send_body(chunk):
+            if chunk:
+                await send({'type': 'http.response.body', 'body': bytes(chunk), 'more_body': True})
+
+        iterable = await run(handler, environ, start_response)
+        disconnected = None
+        try:
+            iterator = iter(iterable)
+            # Apps may call start_response as late as when the first chunk is produced
+            chunk = await run(next, iterator, None)
+            response['sent'] = True
+            await send({'type': 'http.response.start', 'status': response['status'],
+                        'headers': response['headers']})
+
+            # Whatever the view left of the body is no longer read; the channel now only reports a disconnect
+            body.stop_reading()
+            disconnected = asyncio.ensure_future(self.wait_for_disconnect(receive))
+
+            # send() waits while the client's buffer is full, so a slow client is never read ahead of
+            while not disconnected.done():
+                while written:
+                    await send_body(written.pop(0))
+                if chunk is None:
+                    break
+                await send_body(chunk)
+                chunk = await run(next, iterator, None)
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            if disconnected is not None:
+                disconnected.cancel()
+            close = getattr(iterable, 'close', None)
+            if close is not None:
+                await run(close)
+
+flask_app = create_app()
+app = ASGIApp(flask_app, flask_app.config)
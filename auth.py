@@ -1,6 +1,7 @@
 from flask import Blueprint, request, jsonify, session
 from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
 from models import db, User
+from cache import cached_user
 from functools import wraps
 
 auth_bp = Blueprint('auth', __name__, url_prefix='/api/auth')
@@ -41,11 +42,6 @@ def register():
     db.session.add(user)
     db.session.commit()
     
-    # Create user folder
-    from utils import create_user_directory
-    from flask import current_app
-    create_user_directory(current_app.config['UPLOAD_FOLDER'], user.id)
-    
     # Create access token
     access_token = create_access_token(identity=user.id)
     
@@ -98,12 +94,12 @@ def logout():
 def get_current_user():
     """Get current user information"""
     user_id = get_jwt_identity()
-    user = User.query.get(user_id)
+    user = cached_user(user_id)
     
     if not user:
         return jsonify({'error': 'User not found'}), 404
     
-    return jsonify({'user': user.to_dict()}), 200
+    return jsonify({'user': user}), 200
 
 @auth_bp.route('/session', methods=['GET'])
 def get_session_user():
@@ -111,9 +107,9 @@ def get_session_user():
     if 'user_id' not in session:
         return jsonify({'error': 'Not authenticated'}), 401
     
-    user = User.query.get(session['user_id'])
+    user = cached_user(session['user_id'])
     
     if not user:
         return jsonify({'error': 'User not found'}), 404
     
-    return jsonify({'user': user.to_dict()}), 200
+    return jsonify({'user': user}), 200
@@ -0,0 +1,247 @@
+from flask import Blueprint, request, jsonify
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from sqlalchemy.exc import IntegrityError
+from models import db, File, Folder
+from utils import secure_filename_custom, get_mime_type
+from file_manager import allocate_display_name, folder_name_taken
+from deletion import soft_delete_file, soft_delete_folder, reaper_wakeup
+from usage import charge_folder, folder_totals
+
+batch_bp = Blueprint('batch', __name__, url_prefix='/api')
+
+# Maximum number of operations accepted by one /batch call
+BATCH_OPERATION_LIMIT = 1000
+
+def preload_targets(user_id, operations):
+    """
+    Load every file and folder the operations refer to with one query each
+
+    Later lookups go through the session's identity map, so per-operation
+    checks don't issue their own SELECTs.
+    """
+    file_ids, folder_ids = set(), set()
+
+    for op in operations:
+        if not isinstance(op, dict):
+            continue
+        target_ids = file_ids if op.get('type') == 'file' else folder_ids
+        if isinstance(op.get('id'), int):
+            target_ids.add(op['id'])
+        for key in ('folder_id', 'parent_folder_id'):
+            if isinstance(op.get(key), int):
+                folder_ids.add(op[key])
+
+    files = File.query.filter(
+        File.id.in_(file_ids), File.user_id == user_id, File.deleted_at.is_(None)
+    ).all() if file_ids else []
+    folders = Folder.query.filter(
+        Folder.id.in_(folder_ids), Folder.user_id == user_id, Folder.deleted_at.is_(None)
+    ).all() if folder_ids else []
+
+    return {f.id: f for f in files}, {f.id: f for f in folders}
+
+def get_target(op, files, folders):
+    """Get the file or folder an operation acts on; raises LookupError if missing"""
+    if op.get('type') == 'file':
+        file = files.get(op.get('id'))
+        if not file or file.deleted_at:
+            raise LookupError('File not found or access denied')
+        return file
+
+    if op.get('type') == 'folder':
+        folder = folders.get(op.get('id'))
+        if not folder or folder.deleted_at:
+            raise LookupError('Folder not found or access denied')
+        return folder
+
+    raise ValueError("Type must be 'file' or 'folder'")
+
+def get_folder(folders, folder_id):
+    """Get a target folder (None for root); raises LookupError if missing"""
+    if not folder_id:
+        return None
+
+    folder = folders.get(folder_id)
+    if not folder or folder.deleted_at:
+        raise LookupError('Target folder not found')
+    return folder
+
+def batch_delete(user_id, op, files, folders):
+    """Soft-delete a file or folder tree"""
+    target = get_target(op, files, folders)
+
+    if isinstance(target, Folder):
+        job = soft_delete_folder(target)
+    else:
+        job = soft_delete_file(target)
+    db.session.flush()
+
+    # The bulk UPDATE of a folder tree bypasses preloaded objects; reload them on next access
+    if isinstance(target, Folder):
+        db.session.expire_all()
+
+    return {'job': job.to_dict()}
+
+def batch_move(user_id, op, files, folders):
+    """Move a file (to `folder_id`) or folder (to `parent_folder_id`)"""
+    target = get_target(op, files, folders)
+
+    if isinstance(target, File):
+        new_folder = get_folder(folders, op.get('folder_id'))
+        new_folder_id = new_folder.id if new_folder else None
+        target.filename = allocate_display_name(user_id, new_folder_id, target.filename,
+                                                exclude_file_id=target.id)
+        charge_folder(target.folder_id, -target.file_size, -1)
+        charge_folder(new_folder_id, target.file_size, 1)
+        target.folder_id = new_folder_id
+        return {'file': target.to_dict()}
+
+    new_parent = get_folder(folders, op.get('parent_folder_id'))
+    new_parent_id = new_parent.id if new_parent else None
+    if new_parent and target.id in new_parent.get_ancestor_ids():
+        raise ValueError('Cannot move a folder into itself')
+    if folder_name_taken(user_id, new_parent_id, target.folder_name, exclude_folder_id=target.id):
+        raise ValueError('Folder already exists')
+
+    size, count = folder_totals(target)
+    charge_folder(target.parent_folder_id, -size, -count)
+    charge_folder(new_parent_id, size, count)
+    target.parent_folder_id = new_parent_id
+    return {'folder': target.to_dict()}
+
+def batch_rename(user_id, op, files, folders):
+    """Rename a file or folder to `new_name`"""
+    if not op.get('new_name'):
+        raise ValueError('New name is required')
+
+    target = get_target(op, files, folders)
+
+    if isinstance(target, File):
+        new_name = secure_filename_custom(op['new_name'])
+        target.filename = allocate_display_name(user_id, target.folder_id, new_name,
+                                                exclude_file_id=target.id)
+        target.original_filename = op['new_name']
+        target.mime_type = get_mime_type(new_name)
+        return {'file': target.to_dict()}
+
+    if folder_name_taken(user_id, target.parent_folder_id, op['new_name'], exclude_folder_id=target.id):
+        raise ValueError('Folder already exists')
+
+    target.folder_name = op['new_name']
+    return {'folder': target.to_dict()}
+
+def batch_mkdir(user_id, op, files, folders):
+    """Create a folder `name` under `parent_folder_id`"""
+    if not op.get('name'):
+        raise ValueError('Folder name is required')
+
+    parent = get_folder(folders, op.get('parent_folder_id'))
+    parent_id = parent.id if parent else None
+    if folder_name_taken(user_id, parent_id, op['name']):
+        raise ValueError('Folder already exists')
+
+    folder = Folder(user_id=user_id, folder_name=op['name'], parent_folder_id=parent_id)
+    db.session.add(folder)
+    db.session.flush()
+    folders[folder.id] = folder
+    return {'folder': folder.to_dict()}
+
+BATCH_HANDLERS = {
+    'delete': batch_delete,
+    'move': batch_move,
+    'rename': batch_rename,
+    'mkdir': batch_mkdir,
+}
+
+@batch_bp.route('/batch', methods=['POST'])
+@jwt_required()
+def run_batch():
+    """
+    Run several file/folder operations in one request and one transaction
+
+    Each operation is {op: delete|move|rename|mkdir, type: file|folder, id, ...}
+    with the same fields as the single-item endpoints. Operations are
+    validated before they change anything, so a failing one is simply
+    reported in `results` while the rest are committed together. With
+    `atomic`, any failure rolls back the whole batch instead.
+    """
+    user_id = get_jwt_identity()
+    data = request.get_json()
+
+    if not data or not isinstance(data.get('operations'), list):
+        return jsonify({'error': 'Operations are required'}), 400
+
+    operations = data['operations']
+    if len(operations) > BATCH_OPERATION_LIMIT:
+        return jsonify({'error': f'At most {BATCH_OPERATION_LIMIT} operations per request'}), 400
+
+    atomic = bool(data.get('atomic', False))
+    files, folders = preload_targets(user_id, operations)
+
+    results = []
+    failed = 0
+    deleted = False
+
+    for index, op in enumerate(operations):
+        name = op.get('op') if isinstance(op, dict) else None
+        handler = BATCH_HANDLERS.get(name)
+        result = {'index': index, 'op': name}
+
+        try:
+            if not handler:
+                raise ValueError('Unknown operation')
+            result.update(handler(user_id, op, files, folders))
+            result['status'] = 'ok'
+            deleted = deleted or name == 'delete'
+        except (LookupError, ValueError) as e:
+            result.update(status='error', error=str(e))
+        except IntegrityError:
+            # Lost a race with a concurrent request for the same name
+            db.session.rollback()
+            return jsonify({
+                'error': 'Conflicting concurrent change; no changes were made',
+                'committed': False
+            }), 409
+
+        results.append(result)
+
+        if result['status'] == 'error':
+            failed += 1
+            if atomic:
+                break
+
+    if atomic and failed:
+        db.session.rollback()
+        results = [
+            {'index': result['index'], 'op': result['op'], 'status': 'rolled_back'}
+            if result['status'] == 'ok' else result
+            for result in results
+        ]
+        results.extend({'index': index, 'op': op.get('op') if isinstance(op, dict) else None,
+                        'status': 'skipped'}
+                       for index, op in enumerate(operations[len(results):], start=len(results)))
+
+        return jsonify({
+            'error': 'Batch failed; no changes were made',
+            'committed': False,
+            'results': results
+        }), 400
+
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({
+            'error': 'Conflicting concurrent change; no changes were made',
+            'committed': False
+        }), 409
+
+    if deleted:
+        reaper_wakeup.set()
+
+    return jsonify({
+        'committed': True,
+        'succeeded': len(results) - failed,
+        'failed': failed,
+        'results': results
+    }), 200
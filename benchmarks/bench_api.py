@@ -0,0 +1,324 @@
+"""
+API benchmark suite
+
+Boots the app against a scratch database and upload folder, seeds
+synthetic users with folder trees, then drives each workload from a pool
+of concurrent clients: uploads of several sizes, listings at each tree
+depth, file renames, folder moves, folder tree deletes and a login storm.
+Every workload reports p50/p99 latency, throughput and the process's RSS.
+
+Results can be saved as JSON (tagged with the git commit) and compared
+with a run from another commit.
+
+Usage:
+    python benchmarks/bench_api.py [--users 10] [--depth 3] [--fanout 3] [--files 20]
+                                   [--concurrency 8] [--ops 200] [--upload-sizes 1024,1048576]
+                                   [--cache none] [--database URI] [--workloads upload,list,...]
+                                   [--json] [--output results.json] [--compare baseline.json]
+"""
+import io
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import resource
+import tempfile
+import threading
+import statistics
+import subprocess
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import insert, select
+from werkzeug.security import generate_password_hash
+from flask_jwt_extended import create_access_token
+from config import Config
+from models import db, User, Folder, File, Blob
+from usage import recalculate_usage
+from app import create_app
+
+WORKLOADS = ('upload', 'list', 'rename', 'move', 'delete', 'login')
+
+BENCH_HASH = '0' * 64
+BENCH_PASSWORD = 'bench'
+
+# Rows per bulk insert statement
+INSERT_BATCH = 50000
+
+def make_config(workdir, database_uri, cache_backend):
+    """Build a config class pointing at a scratch database and upload folder"""
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = database_uri or f'sqlite:///{os.path.join(workdir, "bench.db")}'
+        UPLOAD_FOLDER = os.path.join(workdir, 'uploads')
+        UPLOAD_STAGING_FOLDER = os.path.join(workdir, 'uploads', '.staging')
+        BLOB_FOLDER = os.path.join(workdir, 'uploads', 'blobs')
+        PREVIEW_FOLDER = os.path.join(workdir, 'uploads', 'previews')
+        CACHE_BACKEND = cache_backend
+        DELETION_REAPER_THREAD = False
+        PREVIEWS_ENABLED = False
+        DEFAULT_STORAGE_QUOTA = None
+    return BenchConfig
+
+def bulk_insert(model, rows):
+    """Insert rows in batches with core INSERTs (bypassing the ORM)"""
+    for start in range(0, len(rows), INSERT_BATCH):
+        db.session.execute(insert(model), rows[start:start + INSERT_BATCH])
+
+def seed(users, depth, fanout, files_per_folder):
+    """
+    Create users, each with a full folder tree and files in every folder
+    
+    Returns ({user_id: [folder ids at depth 1, depth 2, ...]}, {folder id: parent id},
+    folder count, file count).
+    """
+    now = datetime.utcnow()
+    password_hash = generate_password_hash(BENCH_PASSWORD)
+    bulk_insert(User, [{'username': f'user{i}', 'email': f'user{i}@bench', 'password_hash': password_hash,
+                        'created_at': now} for i in range(users)])
+    user_ids = db.session.execute(select(User.id).order_by(User.id)).scalars().all()
+    
+    trees = {user_id: [] for user_id in user_ids}
+    parent_ids = {}
+    level = [(user_id, None) for user_id in user_ids]
+    for _ in range(depth):
+        # Names are unique per user, so subtrees can be moved anywhere in their tree
+        rows = [{'user_id': user_id, 'parent_folder_id': parent_id, 'folder_name': f'folder{parent_id or 0}-{i}',
+                 'created_at': now} for user_id, parent_id in level for i in range(fanout)]
+        created = db.session.execute(
+            insert(Folder).returning(Folder.user_id, Folder.id, Folder.parent_folder_id), rows
+        ).all()
+        parent_ids.update((folder_id, parent_id) for _, folder_id, parent_id in created)
+        level = [(user_id, folder_id) for user_id, folder_id, _ in created]
+        for user_id in user_ids:
+            trees[user_id].append([folder_id for owner, folder_id, _ in created if owner == user_id])
+    
+    folder_ids = [folder_id for tree in trees.values() for level in tree for folder_id in level]
+    files = [{'user_id': user_id, 'folder_id': folder_id, 'filename': f'file{i}.txt',
+              'original_filename': f'file{i}.txt', 'file_path': BENCH_HASH, 'content_hash': BENCH_HASH,
+              'file_size': 1024 + i, 'mime_type': 'text/plain', 'created_at': now, 'updated_at': now}
+             for user_id, tree in trees.items() for level in tree for folder_id in level
+             for i in range(files_per_folder)]
+    db.session.add(Blob(content_hash=BENCH_HASH, size=1, ref_count=len(files)))
+    bulk_insert(File, files)
+    db.session.commit()
+    recalculate_usage()
+    
+    return trees, parent_ids, len(folder_ids), len(files)
+
+def rss_mb():
+    """Current resident set size in MB (peak on platforms without /proc)"""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except OSError:
+        return peak_rss_mb()
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 1024
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+def run_workload(app, name, operations, concurrency):
+    """Run callables taking a test client from `concurrency` threads and summarize them"""
+    local = threading.local()
+    
+    def timed(operation):
+        if not hasattr(local, 'client'):
+            local.client = app.test_client()
+        start = time.perf_counter()
+        response = operation(local.client)
+        return (time.perf_counter() - start) * 1000, response.status_code
+    
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        samples = list(pool.map(timed, operations))
+    elapsed = time.perf_counter() - started
+    
+    latencies = [ms for ms, status in samples if status < 400]
+    return {
+        'workload': name,
+        'ops': len(samples),
+        'errors': sum(1 for _, status in samples if status >= 400),
+        'throughput_ops': round(len(samples) / elapsed, 1) if elapsed else None,
+        'p50_ms': round(statistics.median(latencies), 2) if latencies else None,
+        'p99_ms': round(percentile(latencies, 0.99), 2) if latencies else None,
+        'rss_mb': round(rss_mb(), 1),
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+    }
+
+def build_workloads(app, args, trees, parent_ids):
+    """Yield (name, operations) for every selected workload, in an order that keeps the trees usable"""
+    rng = random.Random(args.seed)
+    with app.app_context():
+        headers = {user_id: {'Authorization': f'Bearer {create_access_token(identity=user_id)}'}
+                   for user_id in trees}
+        files_by_user = {user_id: db.session.execute(
+            select(File.id).where(File.user_id == user_id).order_by(File.id)
+        ).scalars().all() for user_id in trees}
+    user_ids = list(trees)
+    
+    def upload(user_id, folder_id, size, i):
+        content = os.urandom(size)
+        return lambda client: client.post(
+            '/api/files/upload', headers=headers[user_id], content_type='multipart/form-data',
+            data={'file': (io.BytesIO(content), f'upload{i}.txt'), 'folder_id': str(folder_id)}
+        )
+    
+    if 'upload' in args.workloads:
+        for size in args.upload_sizes:
+            operations = []
+            for i in range(args.ops):
+                user_id = rng.choice(user_ids)
+                operations.append(upload(user_id, rng.choice(trees[user_id][-1]), size, i))
+            yield f'upload-{size}', operations
+    
+    if 'list' in args.workloads:
+        for depth in range(args.depth + 1):
+            operations = []
+            for _ in range(args.ops):
+                user_id = rng.choice(user_ids)
+                query = f'?folder_id={rng.choice(trees[user_id][depth - 1])}' if depth else ''
+                operations.append(lambda client, url=f'/api/files/list{query}', h=headers[user_id]:
+                                  client.get(url, headers=h))
+            yield f'list-depth-{depth}', operations
+    
+    if 'rename' in args.workloads:
+        operations = []
+        for i in range(args.ops):
+            user_id = user_ids[i % len(user_ids)]
+            file_id = files_by_user[user_id][(i // len(user_ids)) % len(files_by_user[user_id])]
+            operations.append(lambda client, url=f'/api/files/{file_id}/rename', h=headers[user_id], i=i:
+                              client.put(url, json={'new_name': f'renamed{i}.txt'}, headers=h))
+        yield 'rename', operations
+    
+    if 'move' in args.workloads and args.depth >= 2:
+        # Move second-level subtrees to the next top-level folder, one move per subtree
+        operations = []
+        for user_id, tree in trees.items():
+            for folder_id in tree[1]:
+                target = tree[0][(tree[0].index(parent_ids[folder_id]) + 1) % len(tree[0])]
+                operations.append(lambda client, url=f'/api/folders/{folder_id}/move', h=headers[user_id], t=target:
+                                  client.put(url, json={'parent_folder_id': t}, headers=h))
+        rng.shuffle(operations)
+        yield 'move', operations[:args.ops]
+    
+    if 'delete' in args.workloads:
+        # Whole top-level trees; these are gone afterwards
+        operations = [lambda client, url=f'/api/folders/{folder_id}', h=headers[user_id]: client.delete(url, headers=h)
+                      for user_id, tree in trees.items() for folder_id in tree[0]]
+        rng.shuffle(operations)
+        yield 'delete-tree', operations[:args.ops]
+    
+    if 'login' in args.workloads:
+        operations = []
+        for _ in range(args.ops):
+            email = f'user{rng.randrange(len(user_ids))}@bench'
+            operations.append(lambda client, email=email: client.post(
+                '/api/auth/login', json={'email': email, 'password': BENCH_PASSWORD}
+            ))
+        yield 'login', operations
+
+def git_commit():
+    """Get the commit the benchmarked tree is at (None outside a git checkout)"""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(results, baseline):
+    """Print how each workload changed against a saved run"""
+    previous = {result['workload']: result for result in baseline['results']}
+    print(f"\nCompared with {baseline.get('commit') or 'baseline'}:")
+    for result in results:
+        before = previous.get(result['workload'])
+        if not before:
+            continue
+        changes = []
+        for key in ('p50_ms', 'p99_ms', 'throughput_ops', 'peak_rss_mb'):
+            if before.get(key) and result.get(key) is not None:
+                changes.append(f'{key} {(result[key] - before[key]) / before[key] * 100:+6.1f}%')
+        print(f"{result['workload']:>16}  {'  '.join(changes)}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the FileVault API under concurrent workloads')
+    parser.add_argument('--users', type=int, default=10, help='Seeded users')
+    parser.add_argument('--depth', type=int, default=3, help='Folder tree depth per user')
+    parser.add_argument('--fanout', type=int, default=3, help='Subfolders per folder')
+    parser.add_argument('--files', type=int, default=20, help='Files per folder')
+    parser.add_argument('--concurrency', type=int, default=8, help='Concurrent clients')
+    parser.add_argument('--ops', type=int, default=200, help='Requests per workload (at most)')
+    parser.add_argument('--upload-sizes', default='1024,1048576',
+                        help='Comma-separated upload sizes in bytes')
+    parser.add_argument('--workloads', default=','.join(WORKLOADS),
+                        help=f"Comma-separated workloads to run ({', '.join(WORKLOADS)})")
+    parser.add_argument('--cache', default='none', choices=('none', 'memory'),
+                        help='Listing cache backend (none measures the database path)')
+    parser.add_argument('--database', help='Scratch database URI instead of a temporary SQLite file '
+                                           '(its tables are dropped)')
+    parser.add_argument('--seed', type=int, default=1, help='Random seed for the workload mix')
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+    parser.add_argument('--output', help='Also write the JSON results to this file')
+    parser.add_argument('--compare', help='JSON results of an earlier run to compare against')
+    args = parser.parse_args()
+    args.upload_sizes = [int(size) for size in args.upload_sizes.split(',')]
+    args.workloads = args.workloads.split(',')
+    
+    workdir = tempfile.mkdtemp(prefix='filevault-bench-')
+    try:
+        app = create_app(make_config(workdir, args.database, args.cache))
+        with app.app_context():
+            if args.database:
+                db.drop_all()
+                db.create_all()
+            seed_started = time.perf_counter()
+            trees, parent_ids, folder_count, file_count = seed(args.users, args.depth, args.fanout, args.files)
+            seed_seconds = time.perf_counter() - seed_started
+        
+        results = []
+        for name, operations in build_workloads(app, args, trees, parent_ids):
+            result = run_workload(app, name, operations, args.concurrency)
+            results.append(result)
+            if not args.json:
+                print(f"{result['workload']:>16}  {result['ops']:>5} ops  {result['throughput_ops'] or 0:8.1f} ops/s  "
+                      f"p50 {result['p50_ms'] or 0:8.2f}ms  p99 {result['p99_ms'] or 0:8.2f}ms  "
+                      f"errors {result['errors']:>4}  rss {result['rss_mb']:7.1f}MB")
+        
+        if args.database:
+            with app.app_context():
+                db.drop_all()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    
+    report = {
+        'commit': git_commit(),
+        'timestamp': datetime.utcnow().isoformat(),
+        'python': platform.python_version(),
+        'database': app.config['SQLALCHEMY_DATABASE_URI'].split(':', 1)[0],
+        'scale': {'users': args.users, 'folders': folder_count, 'files': file_count,
+                  'seed_seconds': round(seed_seconds, 2)},
+        'concurrency': args.concurrency,
+        'cache': args.cache,
+        'results': results,
+    }
+    
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    if args.compare:
+        with open(args.compare) as baseline:
+            compare(results, json.load(baseline))
+
+if __name__ == '__main__':
+    main()
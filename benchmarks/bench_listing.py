@@ -0,0 +1,226 @@
+"""
+Listing / folder-creation latency benchmark
+
+Seeds a scratch SQLite database with an increasing number of files and
+folders spread over many users, then times the hot endpoints for one user
+whose folder size stays constant. With the composite indexes in place the
+timings should stay flat as the tables grow.
+
+Usage:
+    python benchmarks/bench_listing.py [--scales 1000,10000,100000,1000000]
+                                       [--repeat 50] [--explain] [--json]
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import statistics
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import insert, text
+from config import Config
+from models import db, User, Folder, File, Blob
+from app import create_app
+
+# Items in the folder being listed, independent of the table size
+HOT_FOLDER_FILES = 500
+HOT_FOLDER_SUBFOLDERS = 50
+
+# Rows per bulk insert statement
+INSERT_BATCH = 50000
+
+# Files per folder when padding the tables for other users
+FILES_PER_FOLDER = 100
+
+BENCH_HASH = '0' * 64
+
+def make_config(workdir):
+    """Build a config class pointing at a scratch database and upload folder"""
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = f'sqlite:///{os.path.join(workdir, "bench.db")}'
+        UPLOAD_FOLDER = os.path.join(workdir, 'uploads')
+        UPLOAD_STAGING_FOLDER = os.path.join(workdir, 'uploads', '.staging')
+        BLOB_FOLDER = os.path.join(workdir, 'uploads', 'blobs')
+    return BenchConfig
+
+def bulk_insert(model, rows):
+    """Insert rows in batches with core INSERTs (bypassing the ORM)"""
+    for start in range(0, len(rows), INSERT_BATCH):
+        db.session.execute(insert(model), rows[start:start + INSERT_BATCH])
+    db.session.commit()
+
+def seed(total_files):
+    """Fill the tables with other users' data, then the benchmarked user's folder"""
+    now = datetime.utcnow()
+    db.session.add(Blob(content_hash=BENCH_HASH, size=1, ref_count=total_files))
+    db.session.commit()
+    
+    padding = max(total_files - HOT_FOLDER_FILES, 0)
+    folder_count = max(padding // FILES_PER_FOLDER, 1)
+    user_count = max(folder_count // 10, 1)
+    
+    users = [{'username': f'user{i}', 'email': f'user{i}@bench', 'password_hash': 'x', 'created_at': now}
+             for i in range(user_count)]
+    bulk_insert(User, users)
+    first_user = db.session.execute(text('SELECT min(id) FROM users')).scalar()
+    
+    folders = [{'user_id': first_user + i % user_count, 'folder_name': f'folder{i}',
+                'created_at': now} for i in range(folder_count)]
+    bulk_insert(Folder, folders)
+    first_folder = db.session.execute(text('SELECT min(id) FROM folders')).scalar()
+    
+    files = []
+    for i in range(padding):
+        folder_index = i % folder_count
+        files.append({
+            'user_id': first_user + folder_index % user_count,
+            'folder_id': first_folder + folder_index,
+            'filename': f'file{i}.txt',
+            'original_filename': f'file{i}.txt',
+            'file_path': BENCH_HASH,
+            'content_hash': BENCH_HASH,
+            'file_size': i,
+            'mime_type': 'text/plain',
+            'created_at': now,
+            'updated_at': now
+        })
+    bulk_insert(File, files)
+
+def seed_hot_folder(user_id):
+    """Create the benchmarked user's folder with a fixed number of items"""
+    now = datetime.utcnow()
+    hot = Folder(user_id=user_id, folder_name='hot')
+    db.session.add(hot)
+    db.session.commit()
+    
+    bulk_insert(Folder, [{'user_id': user_id, 'parent_folder_id': hot.id, 'folder_name': f'sub{i}',
+                          'created_at': now}
+                         for i in range(HOT_FOLDER_SUBFOLDERS)])
+    bulk_insert(File, [{'user_id': user_id, 'folder_id': hot.id, 'filename': f'hot{i}.txt',
+                        'original_filename': f'hot{i}.txt', 'file_path': BENCH_HASH,
+                        'content_hash': BENCH_HASH, 'file_size': i, 'mime_type': 'text/plain',
+                        'created_at': now, 'updated_at': now}
+                       for i in range(HOT_FOLDER_FILES)])
+    return hot.id
+
+def time_request(call, repeat):
+    """Run a request `repeat` times and return the median latency in milliseconds"""
+    samples = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        response = call(i)
+        samples.append((time.perf_counter() - start) * 1000)
+        if response.status_code >= 400:
+            raise RuntimeError(f'{response.status_code}: {response.get_data(as_text=True)}')
+    return statistics.median(samples)
+
+def explain(statement):
+    """Get SQLite's query plan for a statement"""
+    rows = db.session.execute(text('EXPLAIN QUERY PLAN ' + statement)).fetchall()
+    return [row[-1] for row in rows]
+
+def run_scale(total_files, repeat, show_plans):
+    """Seed a fresh database with total_files rows and time the hot endpoints"""
+    workdir = tempfile.mkdtemp(prefix='filevault-bench-')
+    try:
+        app = create_app(make_config(workdir))
+        client = app.test_client()
+        
+        with app.app_context():
+            seed_started = time.perf_counter()
+            seed(total_files)
+            seed_seconds = time.perf_counter() - seed_started
+        
+        response = client.post('/api/auth/register',
+                               json={'username': 'bench', 'email': 'bench@bench', 'password': 'bench'})
+        token = response.get_json()['access_token']
+        headers = {'Authorization': f'Bearer {token}'}
+        user_id = response.get_json()['user']['id']
+        
+        with app.app_context():
+            hot_id = seed_hot_folder(user_id)
+            db.session.execute(text('ANALYZE'))
+            db.session.commit()
+        
+        first_page = client.get(f'/api/files/list?folder_id={hot_id}&limit=100', headers=headers).get_json()
+        deep_cursor = first_page['next_cursor']
+        for _ in range(3):
+            page = client.get(f'/api/files/list?folder_id={hot_id}&limit=100&cursor={deep_cursor}',
+                              headers=headers).get_json()
+            deep_cursor = page['next_cursor']
+        
+        result = {
+            'rows': total_files,
+            'seed_seconds': round(seed_seconds, 2),
+            'list_first_page_ms': time_request(
+                lambda i: client.get(f'/api/files/list?folder_id={hot_id}&limit=100', headers=headers),
+                repeat),
+            'list_deep_page_ms': time_request(
+                lambda i: client.get(f'/api/files/list?folder_id={hot_id}&limit=100&cursor={deep_cursor}',
+                                     headers=headers),
+                repeat),
+            'list_by_size_ms': time_request(
+                lambda i: client.get(f'/api/files/list?folder_id={hot_id}&limit=100&sort=size&order=desc',
+                                     headers=headers),
+                repeat),
+            'create_folder_ms': time_request(
+                lambda i: client.post('/api/folders/create',
+                                      json={'name': f'new{i}', 'parent_folder_id': hot_id}, headers=headers),
+                repeat),
+        }
+        
+        if show_plans:
+            with app.app_context():
+                result['plans'] = {
+                    'list_folders': explain(
+                        f'SELECT * FROM folders WHERE user_id = {user_id} AND parent_folder_id = {hot_id} '
+                        f'ORDER BY folder_name, id LIMIT 101'),
+                    'list_files': explain(
+                        f'SELECT * FROM files WHERE user_id = {user_id} AND folder_id = {hot_id} '
+                        f"AND (original_filename > 'hot5' OR (original_filename = 'hot5' AND id > 1)) "
+                        f'ORDER BY original_filename, id LIMIT 101'),
+                    'duplicate_folder_check': explain(
+                        f"SELECT * FROM folders WHERE user_id = {user_id} AND folder_name = 'new1' "
+                        f'AND parent_folder_id = {hot_id} LIMIT 1'),
+                    'duplicate_file_check': explain(
+                        f"SELECT * FROM files WHERE user_id = {user_id} AND folder_id = {hot_id} "
+                        f"AND filename = 'hot1.txt' LIMIT 1"),
+                }
+        
+        return result
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark listing and folder creation as tables grow')
+    parser.add_argument('--scales', default='1000,10000,100000',
+                        help='Comma-separated table sizes (files) to benchmark, e.g. 1000,1000000')
+    parser.add_argument('--repeat', type=int, default=50, help='Requests per measurement')
+    parser.add_argument('--explain', action='store_true', help='Include SQLite query plans')
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+    args = parser.parse_args()
+    
+    results = []
+    for scale in [int(value) for value in args.scales.split(',')]:
+        result = run_scale(scale, args.repeat, args.explain)
+        results.append(result)
+        
+        if not args.json:
+            print(f"{result['rows']:>9} rows  seed {result['seed_seconds']:>7.2f}s  "
+                  f"list {result['list_first_page_ms']:6.2f}ms  "
+                  f"deep page {result['list_deep_page_ms']:6.2f}ms  "
+                  f"by size {result['list_by_size_ms']:6.2f}ms  "
+                  f"create folder {result['create_folder_ms']:6.2f}ms")
+            for name, plan in result.get('plans', {}).items():
+                print(f'    {name}: {" / ".join(plan)}')
+    
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,270 @@
+import os
+import hashlib
+from flask import current_app
+from sqlalchemy import case
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.dialects import postgresql, sqlite
+from models import db, Blob
+from storage import blob_relpath, get_storage
+from compression import is_compressible, compress_file, decoding_reader
+
+# Size of the blocks read while hashing files
+HASH_BUFFER_SIZE = 1024 * 1024
+
+# Hashes looked up per query by store_blobs
+BLOB_QUERY_BATCH = 500
+
+# INSERT constructs supporting ON CONFLICT, by database dialect; others take references row by row
+UPSERT_INSERTS = {'sqlite': sqlite.insert, 'postgresql': postgresql.insert}
+
+def hash_file(path):
+    """Compute the SHA-256 hex digest and size of a file"""
+    digest = hashlib.sha256()
+    size = 0
+
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(HASH_BUFFER_SIZE)
+            if not block:
+                break
+            digest.update(block)
+            size += len(block)
+
+    return digest.hexdigest(), size
+
+def compress_for_storage(source_path, content_hash, size, mime_type):
+    """
+    Compress a new blob's file in place if the at-rest compression policy applies
+
+    Only content not stored yet, of a compressible type and above
+    STORAGE_COMPRESSION_MIN_SIZE, is tried, and the compressed form is kept
+    only if it meets the configured ratio. Call it before the transaction
+    takes any write lock. Returns (encoding, stored size) for store_blob;
+    encoding is None if the file was left as is.
+    """
+    config = current_app.config
+    encoding = config['STORAGE_COMPRESSION']
+    if encoding == 'none' or size < config['STORAGE_COMPRESSION_MIN_SIZE'] or not is_compressible(mime_type):
+        return None, size
+    if db.session.query(Blob.content_hash).filter_by(content_hash=content_hash).first():
+        return None, size
+
+    compressed_path = f'{source_path}.{encoding}'
+    stored_size = compress_file(source_path, compressed_path, encoding,
+                                config['STORAGE_COMPRESSION_LEVEL'], config['STORAGE_COMPRESSION_MAX_RATIO'])
+    if stored_size is None:
+        return None, size
+
+    os.replace(compressed_path, source_path)
+    return encoding, stored_size
+
+def reference_blobs_statement(dialect):
+    """
+    INSERT ... ON CONFLICT statement taking `ref_count` references to a blob, creating its row if missing
+
+    Concurrent uploads of the same new content each add their references
+    to one row instead of both inserting it. A row left unreferenced (and
+    waiting for collect_garbage) takes the new content's encoding, as that
+    content is about to be put back in storage.
+    """
+    blobs = Blob.__table__
+    statement = UPSERT_INSERTS[dialect](blobs)
+    unreferenced = blobs.c.ref_count <= 0
+    return statement.on_conflict_do_update(index_elements=[blobs.c.content_hash], set_={
+        'ref_count': blobs.c.ref_count + statement.excluded.ref_count,
+        'encoding': case((unreferenced, statement.excluded.encoding), else_=blobs.c.encoding),
+        'stored_size': case((unreferenced, statement.excluded.stored_size), else_=blobs.c.stored_size),
+    })
+
+def reference_blob_row(row):
+    """
+    Take one row's references without ON CONFLICT: UPDATE, then INSERT if no row matched
+
+    An INSERT losing the race to a concurrent one fails on the unique hash
+    and is undone by its savepoint; the UPDATE is then tried again.
+    """
+    blobs = Blob.__table__
+    unreferenced = blobs.c.ref_count <= 0
+    # Some databases (MySQL) evaluate SET left to right, so ref_count is read before it is changed
+    statement = blobs.update().where(blobs.c.content_hash == row['content_hash']).ordered_values(
+        (blobs.c.encoding, case((unreferenced, row['encoding']), else_=blobs.c.encoding)),
+        (blobs.c.stored_size, case((unreferenced, row['stored_size']), else_=blobs.c.stored_size)),
+        (blobs.c.ref_count, blobs.c.ref_count + row['ref_count']),
+    )
+    while True:
+        if db.session.execute(statement).rowcount:
+            return
+        try:
+            with db.session.begin_nested():
+                db.session.execute(db.insert(Blob), row)
+            return
+        except IntegrityError:
+            continue
+
+def reference_blobs(rows):
+    """Take the references described by blob_row() rows, creating the blob rows that are missing"""
+    dialect = db.session.get_bind().dialect.name
+    if dialect in UPSERT_INSERTS:
+        db.session.execute(reference_blobs_statement(dialect), rows)
+        return
+    for row in rows:
+        reference_blob_row(row)
+
+def blob_row(content_hash, size, count, compressed):
+    encoding, stored_size = compressed
+    return {'content_hash': content_hash, 'size': size, 'ref_count': count,
+            'encoding': encoding, 'stored_size': stored_size if encoding else None}
+
+def store_blob(source_path, content_hash=None, size=None, mime_type=None, compressed=None):
+    """
+    Move a finished file into the blob store and take a reference to it
+
+    If a blob with the same content already exists the source file is
+    discarded instead, so identical content is only kept once. New content
+    of a compressible `mime_type` may be compressed at rest; pass the result
+    of an earlier compress_for_storage call as `compressed` if it was done.
+    The caller is responsible for committing the session.
+    """
+    if content_hash is None or size is None:
+        content_hash, size = hash_file(source_path)
+    if compressed is None:
+        compressed = compress_for_storage(source_path, content_hash, size, mime_type)
+
+    reference_blobs([blob_row(content_hash, size, 1, compressed)])
+    ref_count = db.session.execute(
+        db.select(Blob.ref_count).where(Blob.content_hash == content_hash)
+    ).scalar()
+
+    storage = get_storage()
+    if ref_count > 1 and storage.exists(content_hash):
+        os.remove(source_path)
+        return content_hash
+
+    storage.put(content_hash, source_path)
+    if ref_count > 1:
+        # The row outlived its content; it now describes the file just put back
+        encoding, stored_size = compressed
+        Blob.query.filter_by(content_hash=content_hash).update(
+            {'encoding': encoding, 'stored_size': stored_size if encoding else None}
+        )
+
+    return content_hash
+
+def store_blobs(entries):
+    """
+    Bulk form of store_blob for many (source_path, content_hash, size, compressed) entries
+
+    The blob rows are upserted with one batched statement and read back
+    with one query per BLOB_QUERY_BATCH hashes, instead of a round of
+    statements per file. Entries may repeat a hash. The caller commits.
+    """
+    references = {}
+    rows = {}
+    for _, content_hash, size, compressed in entries:
+        references[content_hash] = references.get(content_hash, 0) + 1
+        rows.setdefault(content_hash, (size, compressed))
+    if not references:
+        return
+
+    reference_blobs([
+        blob_row(content_hash, size, references[content_hash], compressed)
+        for content_hash, (size, compressed) in rows.items()
+    ])
+
+    hashes = list(references)
+    ref_counts = {}
+    for start in range(0, len(hashes), BLOB_QUERY_BATCH):
+        ref_counts.update(db.session.execute(
+            db.select(Blob.content_hash, Blob.ref_count).where(Blob.content_hash.in_(hashes[start:start + BLOB_QUERY_BATCH]))
+        ).all())
+
+    storage = get_storage()
+    stored = set()
+    for source_path, content_hash, size, (encoding, stored_size) in entries:
+        # Rows holding more than our references were referenced before
+        existed = ref_counts[content_hash] > references[content_hash]
+        if content_hash in stored or (existed and storage.exists(content_hash)):
+            stored.add(content_hash)
+            os.remove(source_path)
+            continue
+
+        storage.put(content_hash, source_path)
+        stored.add(content_hash)
+        if existed:
+            Blob.query.filter_by(content_hash=content_hash).update(
+                {'encoding': encoding, 'stored_size': stored_size if encoding else None}, synchronize_session=False
+            )
+
+def open_blob(blob):
+    """Open a blob's content for reading, decompressing it if it is stored compressed"""
+    stream = get_storage().open(blob.content_hash, size=blob.stored_size or blob.size)
+    if blob.encoding:
+        return decoding_reader(stream, blob.encoding)
+    return stream
+
+def add_blob_reference(content_hash, count=1):
+    """Take extra references to an existing blob (e.g. when copying a file)"""
+    Blob.query.filter_by(content_hash=content_hash).update(
+        {'ref_count': Blob.ref_count + count}
+    )
+
+def release_blob(content_hash, count=1):
+    """Drop references to a blob; unreferenced blobs are removed by collect_garbage"""
+    if content_hash:
+        Blob.query.filter_by(content_hash=content_hash).update(
+            {'ref_count': Blob.ref_count - count}
+        )
+
+def claim_removed_blob(content_hash, size):
+    """
+    Insert an unreferenced row for a blob whose row was deleted, while its content is removed
+
+    An upload of the same content still in progress makes this wait for it,
+    and a later one waits for our commit, so the content is only removed
+    when nothing uses it. Returns False when an upload re-created the row.
+    """
+    row = {'content_hash': content_hash, 'size': size, 'ref_count': 0}
+    dialect = db.session.get_bind().dialect.name
+    if dialect in UPSERT_INSERTS:
+        statement = UPSERT_INSERTS[dialect](Blob.__table__).on_conflict_do_nothing()
+        return db.session.execute(statement, row).rowcount == 1
+    try:
+        with db.session.begin_nested():
+            db.session.execute(db.insert(Blob), row)
+    except IntegrityError:
+        return False
+    return True
+
+def collect_garbage(content_hashes=None, on_delete=None):
+    """
+    Delete blobs that are no longer referenced by any file
+
+    Call after the releasing transaction has been committed. The rows are
+    deleted and committed first, then the content is removed from storage;
+    `on_delete` is called with each removed hash (e.g. to drop previews).
+    If removing content fails it is only orphaned: no row points at it.
+    """
+    blobs = Blob.__table__
+    statement = blobs.delete().where(blobs.c.ref_count <= 0)
+    if content_hashes is not None:
+        if not content_hashes:
+            return 0
+        statement = statement.where(blobs.c.content_hash.in_(list(content_hashes)))
+
+    # References taken since the caller released them keep the row
+    removed = db.session.execute(statement.returning(blobs.c.content_hash, blobs.c.size)).all()
+    db.session.commit()
+    if not removed:
+        return 0
+
+    storage = get_storage()
+    for content_hash, size in removed:
+        if not claim_removed_blob(content_hash, size):
+            continue
+        storage.delete(content_hash)
+        if on_delete:
+            on_delete(content_hash)
+        db.session.execute(blobs.delete().where(blobs.c.content_hash == content_hash, blobs.c.ref_count <= 0))
+
+    db.session.commit()
+    return len(removed)
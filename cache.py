@@ -0,0 +1,275 @@
+import os
+import sys
+import json
+import time
+import shlex
+import uuid
+import threading
+from collections import OrderedDict
+from flask import Blueprint, jsonify, current_app, has_app_context
+from flask_jwt_extended import jwt_required
+from sqlalchemy import event
+from models import db, User, File, Folder
+from metrics import CACHE_LOOKUPS
+
+try:
+    import redis
+except ImportError:  # Only needed for CACHE_BACKEND=redis
+    redis = None
+
+cache_bp = Blueprint('cache', __name__, url_prefix='/api/cache')
+
+CACHE_BACKENDS = ('memory', 'redis', 'none')
+
+class CacheBackend:
+    """
+    Where cached metadata is kept
+
+    Values are strings. A missing or expired key reads as None; backends
+    may drop entries at any time, so a miss must always be safe.
+    """
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def set(self, key, value, ttl=None):
+        """Store a value, expiring after `ttl` seconds (None keeps it until evicted)"""
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+class NullCache(CacheBackend):
+    """Caching disabled: every read misses"""
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value, ttl=None):
+        pass
+
+    def delete(self, key):
+        pass
+
+class MemoryCache(CacheBackend):
+    """
+    LRU cache with per-entry expiry in the process's memory
+
+    Each worker process would have its own and miss the changes made
+    through the others, so it is refused when several workers run.
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires is not None and expires <= time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires = time.monotonic() + ttl if ttl is not None else None
+        with self.lock:
+            self.entries[key] = (value, expires)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+class RedisCache(CacheBackend):
+    """
+    Cache shared by every worker through a Redis server
+
+    A failing server is logged and treated as a miss, so the API keeps
+    answering from the database.
+    """
+
+    def __init__(self, url, prefix=''):
+        if redis is None:
+            raise RuntimeError('The redis cache backend requires redis (pip install redis)')
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, key):
+        try:
+            value = self.client.get(self.prefix + key)
+        except redis.RedisError as e:
+            current_app.logger.warning(f"Cache read failed: {e}")
+            return None
+        return value.decode() if value is not None else None
+
+    def set(self, key, value, ttl=None):
+        try:
+            self.client.set(self.prefix + key, value, ex=ttl)
+        except redis.RedisError as e:
+            current_app.logger.warning(f"Cache write failed: {e}")
+
+    def delete(self, key):
+        try:
+            self.client.delete(self.prefix + key)
+        except redis.RedisError as e:
+            current_app.logger.error(f"Cache invalidation failed: {e}")
+
+class MetadataCache:
+    """A cache backend with namespaced keys, a default TTL and hit/miss counters for this process"""
+
+    def __init__(self, backend, ttl):
+        self.backend = backend
+        self.ttl = ttl
+        self.counts = {}
+        self.lock = threading.Lock()
+
+    def record(self, namespace, outcome):
+        with self.lock:
+            counts = self.counts.setdefault(namespace, {'hits': 0, 'misses': 0})
+            counts[outcome] = counts.get(outcome, 0) + 1
+        CACHE_LOOKUPS.inc(namespace=namespace, result='hit' if outcome == 'hits' else 'miss')
+
+    def get(self, namespace, key):
+        value = self.backend.get(f'{namespace}:{key}')
+        self.record(namespace, 'hits' if value is not None else 'misses')
+        return value
+
+    def set(self, namespace, key, value):
+        self.backend.set(f'{namespace}:{key}', value, self.ttl)
+
+    def delete(self, namespace, key):
+        self.backend.delete(f'{namespace}:{key}')
+
+    def stats(self):
+        with self.lock:
+            return {namespace: dict(counts) for namespace, counts in self.counts.items()}
+
+def server_workers(argv=None, environ=None):
+    """
+    Find how many worker processes the server was told to run (1 if it doesn't say)
+
+    Reads gunicorn's and uvicorn's -w/--workers option, GUNICORN_CMD_ARGS
+    and WEB_CONCURRENCY. Workers set in a gunicorn config file are not seen.
+    """
+    argv = sys.argv if argv is None else argv
+    environ = os.environ if environ is None else environ
+    args = list(argv[1:]) + shlex.split(environ.get('GUNICORN_CMD_ARGS', ''))
+
+    workers = environ.get('WEB_CONCURRENCY')
+    for i, arg in enumerate(args):
+        if arg in ('-w', '--workers') and i + 1 < len(args):
+            workers = args[i + 1]
+        elif arg.startswith('--workers='):
+            workers = arg.split('=', 1)[1]
+        elif arg.startswith('-w') and arg[2:].isdigit():
+            workers = arg[2:]
+    try:
+        return int(workers) if workers else 1
+    except ValueError:
+        return 1
+
+def create_cache(config):
+    """Build the cache selected by CACHE_BACKEND"""
+    backend = config['CACHE_BACKEND']
+    ttl = int(config['CACHE_TTL'].total_seconds())
+
+    if backend == 'memory':
+        # Each worker would serve its own stale listings after a change made through another
+        workers = server_workers()
+        if workers > 1:
+            raise ValueError(f"CACHE_BACKEND 'memory' cannot be shared by {workers} workers; "
+                             f"use 'redis' or 'none'")
+        return MetadataCache(MemoryCache(config['CACHE_MAX_ENTRIES']), ttl)
+    if backend == 'redis':
+        return MetadataCache(RedisCache(config['CACHE_REDIS_URL'], prefix=config['CACHE_KEY_PREFIX']), ttl)
+    if backend == 'none':
+        return MetadataCache(NullCache(), ttl)
+
+    raise ValueError(f"Unknown CACHE_BACKEND '{backend}' (expected one of {', '.join(CACHE_BACKENDS)})")
+
+def get_cache():
+    """Get the app's metadata cache (created on first use)"""
+    cache = current_app.extensions.get('cache')
+    if cache is None:
+        cache = create_cache(current_app.config)
+        current_app.extensions['cache'] = cache
+    return cache
+
+def listing_version(user_id):
+    """
+    Get the token identifying the current state of a user's folder tree
+
+    Listings are cached under this token. Any committed change to the
+    user's files or folders replaces it, so older entries are never read
+    again and simply expire. A token lost to eviction is replaced too.
+    """
+    cache = get_cache()
+    version = cache.backend.get(f'version:{user_id}')
+    if version is None:
+        version = uuid.uuid4().hex
+        cache.backend.set(f'version:{user_id}', version)
+    return version
+
+def mark_user_changed(user_id, session=None):
+    """Note that the current transaction changes a user's files or folders (applied on commit)"""
+    session = session or db.session
+    session.info.setdefault('cache_listings', set()).add(user_id)
+
+@event.listens_for(db.session, 'after_flush')
+def track_flushed_changes(session, flush_context):
+    """Mark the users whose files, folders or accounts were written through the ORM"""
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, (File, Folder)):
+            mark_user_changed(obj.user_id, session)
+        elif isinstance(obj, User):
+            session.info.setdefault('cache_users', set()).add(obj.id)
+
+@event.listens_for(db.session, 'after_commit')
+def invalidate_committed_changes(session):
+    """
+    Drop cached metadata made stale by the transaction that just committed
+
+    Only committed changes invalidate; marks left by a rolled back
+    transaction go away with the request's session.
+    """
+    listings = session.info.pop('cache_listings', set())
+    users = session.info.pop('cache_users', set())
+    if not (listings or users) or not has_app_context():
+        return
+
+    cache = get_cache()
+    for user_id in listings:
+        cache.backend.set(f'version:{user_id}', uuid.uuid4().hex)
+    for user_id in users:
+        cache.delete('user', user_id)
+
+def cached_user(user_id):
+    """Get a user's serialized account details (None if there is no such user)"""
+    cache = get_cache()
+    data = cache.get('user', user_id)
+    if data is not None:
+        return json.loads(data)
+
+    user = db.session.get(User, user_id)
+    if not user:
+        return None
+    data = user.to_dict()
+    cache.set('user', user_id, json.dumps(data))
+    return data
+
+@cache_bp.route('/stats', methods=['GET'])
+@jwt_required()
+def cache_stats():
+    """Get this worker's cache hit/miss counters"""
+    return jsonify({
+        'backend': current_app.config['CACHE_BACKEND'],
+        'stats': get_cache().stats()
+    }), 200
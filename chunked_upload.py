@@ -0,0 +1,290 @@
+import os
+import re
+import uuid
+from datetime import datetime
+from flask import Blueprint, request, jsonify, current_app
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from models import db, Folder, UploadSession
+from utils import allowed_file, split_relative_path, secure_filename_custom
+from file_manager import (store_uploaded_file, resolve_folder_path, parse_conflict_policy, display_name_taken,
+                          extraction_response)
+from usage import QuotaExceededError, check_quota
+
+chunked_upload_bp = Blueprint('chunked_upload', __name__, url_prefix='/api/uploads')
+
+# Size of the blocks copied from the request body to the staging file
+COPY_BUFFER_SIZE = 64 * 1024
+
+CONTENT_RANGE_RE = re.compile(r'^bytes (\d+)-(\d+)/(\d+|\*)$')
+
+def get_staging_path(upload_id):
+    """Get on-disk staging path for an upload session"""
+    return os.path.join(current_app.config['UPLOAD_STAGING_FOLDER'], upload_id)
+
+def get_session_or_none(upload_id, user_id):
+    """Get an upload session owned by the user"""
+    return UploadSession.query.filter_by(id=upload_id, user_id=user_id).first()
+
+def session_response(upload):
+    """Serialize an upload session with the server's chunking hints"""
+    data = upload.to_dict()
+    data['chunk_size'] = current_app.config['UPLOAD_CHUNK_SIZE']
+    return data
+
+def discard_session(upload):
+    """Remove an upload session and its staging file"""
+    staging_path = get_staging_path(upload.id)
+    if os.path.exists(staging_path):
+        os.remove(staging_path)
+    db.session.delete(upload)
+
+def purge_expired_sessions():
+    """Drop upload sessions that have been idle for too long"""
+    cutoff = datetime.utcnow() - current_app.config['UPLOAD_SESSION_LIFETIME']
+    expired = UploadSession.query.filter(UploadSession.updated_at < cutoff).all()
+
+    for upload in expired:
+        discard_session(upload)
+
+    if expired:
+        db.session.commit()
+
+def parse_chunk_offset():
+    """
+    Read the chunk's starting offset from the request
+    Accepts an `offset` query parameter or a `Content-Range` header
+    """
+    offset = request.args.get('offset', type=int)
+    if offset is not None:
+        return offset
+
+    content_range = request.headers.get('Content-Range')
+    if content_range:
+        match = CONTENT_RANGE_RE.match(content_range.strip())
+        if match:
+            return int(match.group(1))
+
+    return None
+
+@chunked_upload_bp.route('', methods=['POST'])
+@jwt_required()
+def create_upload():
+    """Start a resumable chunked upload"""
+    user_id = get_jwt_identity()
+    data = request.get_json()
+
+    if not data or not data.get('filename'):
+        return jsonify({'error': 'Filename is required'}), 400
+
+    total_size = data.get('size')
+    if not isinstance(total_size, int) or total_size < 0:
+        return jsonify({'error': 'File size is required'}), 400
+
+    original_filename = data['filename']
+    folder_id = data.get('folder_id')
+
+    # Validate folder ownership if specified
+    folder = None
+    if folder_id:
+        folder = Folder.query.filter_by(id=folder_id, user_id=user_id, deleted_at=None).first()
+        if not folder:
+            return jsonify({'error': 'Folder not found or access denied'}), 404
+
+    # Check allowed extensions before accepting any bytes
+    if not allowed_file(original_filename, current_app.config['ALLOWED_EXTENSIONS']):
+        return jsonify({'error': 'File type not allowed'}), 400
+
+    # Optional relative folder path below the target folder (created on completion)
+    try:
+        path_parts = split_relative_path(data.get('path', ''))
+    except ValueError:
+        return jsonify({'error': 'Invalid path'}), 400
+
+    try:
+        on_conflict = parse_conflict_policy(data.get('on_conflict'), overwrite=bool(data.get('overwrite', False)))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # Refuse a rejected name before any bytes are sent (checked again on completion)
+    if on_conflict == 'reject':
+        try:
+            target = resolve_folder_path(user_id, folder, path_parts, create=False)
+        except LookupError:
+            target = False
+        if target is not False and display_name_taken(
+            user_id, target.id if target else None, secure_filename_custom(original_filename)
+        ):
+            return jsonify({'error': 'File already exists'}), 409
+
+    # Refuse a file that cannot fit in the quota before any chunk is sent
+    try:
+        check_quota(user_id, total_size)
+    except QuotaExceededError:
+        return jsonify({'error': 'Storage quota exceeded'}), 413
+
+    purge_expired_sessions()
+
+    upload = UploadSession(
+        id=uuid.uuid4().hex,
+        user_id=user_id,
+        folder_id=folder_id,
+        original_filename=original_filename,
+        target_path='/'.join(path_parts) or None,
+        on_conflict=on_conflict,
+        extract=bool(data.get('extract', False)),
+        total_size=total_size,
+        received_size=0
+    )
+
+    # Create an empty staging file that chunks are written into
+    os.makedirs(current_app.config['UPLOAD_STAGING_FOLDER'], exist_ok=True)
+    open(get_staging_path(upload.id), 'wb').close()
+
+    db.session.add(upload)
+    db.session.commit()
+
+    return jsonify({
+        'message': 'Upload session created',
+        'upload': session_response(upload)
+    }), 201
+
+@chunked_upload_bp.route('/<upload_id>', methods=['GET'])
+@jwt_required()
+def get_upload(upload_id):
+    """Get upload session status (used to resume)"""
+    user_id = get_jwt_identity()
+    upload = get_session_or_none(upload_id, user_id)
+
+    if not upload:
+        return jsonify({'error': 'Upload session not found'}), 404
+
+    return jsonify({'upload': session_response(upload)}), 200
+
+@chunked_upload_bp.route('/<upload_id>', methods=['PUT'])
+@jwt_required()
+def upload_chunk(upload_id):
+    """Append a chunk to an upload session at the given offset"""
+    user_id = get_jwt_identity()
+    upload = get_session_or_none(upload_id, user_id)
+
+    if not upload:
+        return jsonify({'error': 'Upload session not found'}), 404
+
+    offset = parse_chunk_offset()
+    if offset is None:
+        return jsonify({'error': 'Chunk offset is required'}), 400
+
+    # Chunks must be sent in order; tell the client where to resume from
+    if offset != upload.received_size:
+        return jsonify({
+            'error': 'Offset does not match upload progress',
+            'upload': session_response(upload)
+        }), 409
+
+    staging_path = get_staging_path(upload.id)
+    if not os.path.exists(staging_path):
+        return jsonify({'error': 'Upload staging file is missing'}), 410
+
+    remaining = upload.total_size - offset
+    written = 0
+
+    # Stream the body straight into the staging file with a fixed-size buffer
+    with open(staging_path, 'r+b') as f:
+        f.seek(offset)
+        while True:
+            block = request.stream.read(COPY_BUFFER_SIZE)
+            if not block:
+                break
+            written += len(block)
+            if written > remaining:
+                f.truncate(offset)
+                return jsonify({'error': 'Chunk exceeds declared file size'}), 413
+            f.write(block)
+        # Drop any bytes left over from an unacknowledged earlier attempt
+        f.truncate()
+
+    # Only advance if nobody else acknowledged this offset concurrently
+    updated = UploadSession.query.filter_by(id=upload.id, received_size=offset).update({
+        'received_size': offset + written,
+        'updated_at': datetime.utcnow()
+    })
+    db.session.commit()
+
+    if not updated:
+        db.session.refresh(upload)
+        return jsonify({
+            'error': 'Offset does not match upload progress',
+            'upload': session_response(upload)
+        }), 409
+
+    db.session.refresh(upload)
+    return jsonify({'upload': session_response(upload)}), 200
+
+@chunked_upload_bp.route('/<upload_id>/complete', methods=['POST'])
+@jwt_required()
+def complete_upload(upload_id):
+    """Finalize an upload session into a stored file"""
+    user_id = get_jwt_identity()
+    upload = get_session_or_none(upload_id, user_id)
+
+    if not upload:
+        return jsonify({'error': 'Upload session not found'}), 404
+
+    if upload.received_size != upload.total_size:
+        return jsonify({
+            'error': 'Upload is incomplete',
+            'upload': session_response(upload)
+        }), 400
+
+    # The target folder may have been removed while the upload was running
+    folder = None
+    if upload.folder_id:
+        folder = Folder.query.filter_by(id=upload.folder_id, user_id=user_id, deleted_at=None).first()
+        if not folder:
+            return jsonify({'error': 'Folder not found or access denied'}), 404
+
+    staging_path = get_staging_path(upload.id)
+    if not os.path.exists(staging_path):
+        return jsonify({'error': 'Upload staging file is missing'}), 410
+
+    folder = resolve_folder_path(user_id, folder, split_relative_path(upload.target_path))
+
+    db.session.delete(upload)
+
+    if upload.extract:
+        return extraction_response(user_id, folder, staging_path, upload.on_conflict)
+
+    try:
+        new_file = store_uploaded_file(
+            user_id,
+            folder,
+            upload.original_filename,
+            staging_path,
+            on_conflict=upload.on_conflict
+        )
+    except FileExistsError:
+        db.session.commit()
+        return jsonify({'error': 'File already exists'}), 409
+    except QuotaExceededError:
+        db.session.commit()
+        return jsonify({'error': 'Storage quota exceeded'}), 413
+
+    return jsonify({
+        'message': 'File uploaded successfully',
+        'file': new_file.to_dict()
+    }), 201
+
+@chunked_upload_bp.route('/<upload_id>', methods=['DELETE'])
+@jwt_required()
+def abort_upload(upload_id):
+    """Abort an upload session and discard received chunks"""
+    user_id = get_jwt_identity()
+    upload = get_session_or_none(upload_id, user_id)
+
+    if not upload:
+        return jsonify({'error': 'Upload session not found'}), 404
+
+    discard_session(upload)
+    db.session.commit()
+
+    return jsonify({'message': 'Upload aborted'}), 200
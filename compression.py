@@ -0,0 +1,96 @@
+import os
+import gzip
+import zlib
+
+try:
+    import zstandard
+except ImportError:  # zstd is offered only when the package is installed
+    zstandard = None
+
+# Non-text types that compress well; every text/* type does too
+COMPRESSIBLE_MIME_TYPES = {
+    'application/json', 'application/xml', 'application/javascript', 'application/x-javascript',
+    'application/sql', 'application/x-sh', 'application/x-python', 'application/x-yaml',
+    'application/csv', 'image/svg+xml',
+}
+
+# Leading bytes compressed to judge whether the rest of a file is worth compressing
+COMPRESSION_SAMPLE_SIZE = 256 * 1024
+
+# Size of the blocks read while compressing
+COMPRESSION_BUFFER_SIZE = 1024 * 1024
+
+DEFAULT_LEVELS = {'gzip': 6, 'zstd': 3}
+
+def available_encodings():
+    """Content codings this server can produce and decode, most preferred first"""
+    return ('zstd', 'gzip') if zstandard else ('gzip',)
+
+def is_compressible(mime_type):
+    """Check whether content of a MIME type is likely to compress well"""
+    if not mime_type:
+        return False
+    mime_type = mime_type.split(';')[0].strip().lower()
+    return (mime_type.startswith('text/') or mime_type in COMPRESSIBLE_MIME_TYPES
+            or mime_type.endswith(('+json', '+xml')))
+
+def negotiate_encoding(accept_encodings):
+    """Pick a response coding from a parsed Accept-Encoding header (None for identity)"""
+    return accept_encodings.best_match(available_encodings())
+
+def compressor(encoding, level=None):
+    """Create a streaming compressor with zlib's compress()/flush() interface"""
+    level = level or DEFAULT_LEVELS[encoding]
+    if encoding == 'zstd':
+        return zstandard.ZstdCompressor(level=level).compressobj()
+    return zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)  # gzip container
+
+def decoding_reader(stream, encoding):
+    """Wrap a binary stream of compressed data in a reader of the decoded bytes"""
+    if encoding == 'zstd':
+        return zstandard.ZstdDecompressor().stream_reader(stream, read_across_frames=True, closefd=True)
+    return gzip.GzipFile(fileobj=stream, mode='rb')
+
+def compress_stream(stream, encoding, level=None):
+    """Yield the compressed form of a binary stream block by block, closing it at the end"""
+    try:
+        encoder = compressor(encoding, level)
+        while True:
+            block = stream.read(COMPRESSION_BUFFER_SIZE)
+            if not block:
+                break
+            data = encoder.compress(block)
+            if data:
+                yield data
+        yield encoder.flush()
+    finally:
+        stream.close()
+
+def compress_file(source_path, target_path, encoding, level=None, max_ratio=1.0):
+    """
+    Compress a file if it shrinks to at most `max_ratio` of its size
+
+    A sample from the start is tried first, so incompressible content is
+    turned down without compressing the whole file. Returns the compressed
+    size, or None (leaving no target file) if compression did not pay off.
+    """
+    source_size = os.path.getsize(source_path)
+
+    with open(source_path, 'rb') as source:
+        sample = source.read(COMPRESSION_SAMPLE_SIZE)
+        if not sample:
+            return None
+        encoder = compressor(encoding, level)
+        if len(encoder.compress(sample) + encoder.flush()) > len(sample) * max_ratio:
+            return None
+
+        source.seek(0)
+        with open(target_path, 'wb') as target:
+            for block in compress_stream(source, encoding, level):
+                target.write(block)
+
+    compressed_size = os.path.getsize(target_path)
+    if compressed_size > source_size * max_ratio:
+        os.remove(target_path)
+        return None
+    return compressed_size
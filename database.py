@@ -0,0 +1,46 @@
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+def engine_options(config):
+    """
+    Build SQLAlchemy engine options for the configured database
+
+    Server databases (PostgreSQL, ...) get a pool sized for the app's
+    threads, with connections checked before use and replaced after
+    DB_POOL_RECYCLE so ones dropped by the server or a proxy are never handed out.
+    """
+    if make_url(config['SQLALCHEMY_DATABASE_URI']).get_backend_name() == 'sqlite':
+        return {}  # One file, no server connections to pool; see tune_sqlite
+
+    return {
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': config['DB_POOL_PRE_PING'],
+    }
+
+def tune_sqlite(engine, config):
+    """
+    Apply the SQLite settings to every new connection of an engine
+
+    WAL lets readers carry on while a write is committing instead of
+    waiting for it, and synchronous=NORMAL only syncs at checkpoints,
+    which WAL keeps safe against corruption. busy_timeout makes a writer
+    wait for the lock instead of failing with "database is locked".
+    """
+    if engine.dialect.name != 'sqlite':
+        return
+
+    pragmas = {
+        'journal_mode': config['SQLITE_JOURNAL_MODE'],
+        'synchronous': config['SQLITE_SYNCHRONOUS'],
+        'busy_timeout': int(config['SQLITE_BUSY_TIMEOUT'] * 1000),
+    }
+
+    @event.listens_for(engine, 'connect')
+    def apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name}={value}')
+        cursor.close()
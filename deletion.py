@@ -0,0 +1,244 @@
+import os
+import threading
+from datetime import datetime
+from flask import Blueprint, jsonify, current_app
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from models import db, File, Folder, UploadSession, NameCounter, DeletionJob
+from blobstore import release_blob, collect_garbage
+from previews import delete_previews
+from usage import charge_user, charge_folder, folder_totals
+
+deletion_bp = Blueprint('deletion', __name__, url_prefix='/api/jobs')
+
+# Set to wake the in-process reaper as soon as a job is queued
+reaper_wakeup = threading.Event()
+
+def soft_delete_folder(folder):
+    """
+    Hide a folder tree and queue it for background deletion
+
+    Marks every folder and file in the subtree with one UPDATE each; the
+    rows and blob references are removed later by the reaper, but the
+    subtree stops counting towards the user's usage right away.
+    The caller is responsible for committing the session.
+    """
+    now = datetime.utcnow()
+    size, count = folder_totals(folder)
+    charge_user(folder.user_id, -size, -count, enforce=False)
+    charge_folder(folder.parent_folder_id, -size, -count)
+    subtree_ids = db.select(folder.subtree_cte().c.id)
+
+    Folder.query.filter(Folder.id.in_(subtree_ids)).update(
+        {'deleted_at': now}, synchronize_session=False
+    )
+    File.query.filter(File.folder_id.in_(subtree_ids)).update(
+        {'deleted_at': now}, synchronize_session=False
+    )
+
+    job = DeletionJob(user_id=folder.user_id, folder_id=folder.id)
+    db.session.add(job)
+    return job
+
+def soft_delete_file(file):
+    """Hide a file and queue it for background deletion (caller commits)"""
+    charge_user(file.user_id, -file.file_size, -1, enforce=False)
+    charge_folder(file.folder_id, -file.file_size, -1)
+    file.deleted_at = datetime.utcnow()
+    job = DeletionJob(user_id=file.user_id, file_id=file.id)
+    db.session.add(job)
+    return job
+
+def claim_next_job():
+    """
+    Take ownership of the oldest queued job
+
+    Running jobs whose reaper stopped updating them (e.g. the process died)
+    are claimed again after DELETION_JOB_LEASE, and failed jobs once their
+    retry is due.
+    """
+    now = datetime.utcnow()
+    stalled = now - current_app.config['DELETION_JOB_LEASE']
+
+    while True:
+        job = DeletionJob.query.filter(db.or_(
+            DeletionJob.status == 'pending',
+            db.and_(DeletionJob.status == 'running', DeletionJob.updated_at < stalled),
+            db.and_(DeletionJob.status == 'failed', DeletionJob.next_attempt_at <= now)
+        )).order_by(DeletionJob.updated_at).first()
+
+        if not job:
+            return None
+
+        # Only one reaper may win the job
+        claimed = DeletionJob.query.filter_by(id=job.id, status=job.status, updated_at=job.updated_at).update({
+            'status': 'running',
+            'updated_at': datetime.utcnow()
+        })
+        db.session.commit()
+
+        if claimed:
+            db.session.refresh(job)
+            return job
+
+def delete_file_rows(file_query, batch_size):
+    """Delete matching file rows in batches, releasing their blobs; yields each batch's size"""
+    while True:
+        rows = file_query.with_entities(File.id, File.content_hash).limit(batch_size).all()
+        if not rows:
+            return
+
+        hash_counts = {}
+        for _, content_hash in rows:
+            if content_hash:
+                hash_counts[content_hash] = hash_counts.get(content_hash, 0) + 1
+
+        for content_hash, count in hash_counts.items():
+            release_blob(content_hash, count)
+
+        File.query.filter(File.id.in_([file_id for file_id, _ in rows])).delete(synchronize_session=False)
+        db.session.commit()
+        collect_garbage(hash_counts.keys(), delete_previews)
+
+        yield len(rows)
+
+def reap_folder(job, batch_size):
+    """Delete a soft-deleted folder tree: files first, then folders deepest first"""
+    folder = db.session.get(Folder, job.folder_id)
+    if not folder:
+        return
+
+    subtree = folder.subtree_cte()
+    folder_rows = db.session.execute(
+        db.select(subtree.c.id).order_by(subtree.c.depth.desc())
+    ).scalars().all()
+
+    for start in range(0, len(folder_rows), batch_size):
+        folder_ids = folder_rows[start:start + batch_size]
+
+        file_query = File.query.filter(File.folder_id.in_(folder_ids))
+        for count in delete_file_rows(file_query, batch_size):
+            job.files_deleted += count
+            db.session.commit()
+
+        # Drop unfinished uploads into the deleted folders
+        for upload in UploadSession.query.filter(UploadSession.folder_id.in_(folder_ids)).all():
+            staging_path = os.path.join(current_app.config['UPLOAD_STAGING_FOLDER'], upload.id)
+            if os.path.exists(staging_path):
+                os.remove(staging_path)
+            db.session.delete(upload)
+
+        NameCounter.query.filter(NameCounter.folder_key.in_(folder_ids)).delete(synchronize_session=False)
+        Folder.query.filter(Folder.id.in_(folder_ids)).delete(synchronize_session=False)
+        job.folders_deleted += len(folder_ids)
+        db.session.commit()
+
+def reap_file(job, batch_size):
+    """Delete a single soft-deleted file"""
+    file_query = File.query.filter_by(id=job.file_id).filter(File.deleted_at.isnot(None))
+    for count in delete_file_rows(file_query, batch_size):
+        job.files_deleted += count
+        db.session.commit()
+
+def retry_delay(attempts):
+    """Get how long to wait before retrying a job that has failed `attempts` times"""
+    config = current_app.config
+    return min(config['DELETION_RETRY_DELAY'] * 2 ** min(attempts - 1, 20), config['DELETION_RETRY_MAX_DELAY'])
+
+def run_pending_jobs():
+    """Process queued deletion jobs until none are left; returns the number processed"""
+    batch_size = current_app.config['DELETION_BATCH_SIZE']
+    processed = 0
+
+    while True:
+        job = claim_next_job()
+        if not job:
+            return processed
+
+        try:
+            if job.folder_id:
+                reap_folder(job, batch_size)
+            else:
+                reap_file(job, batch_size)
+            job.status = 'done'
+            job.error = None
+            job.next_attempt_at = None
+            job.finished_at = datetime.utcnow()
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.exception(f"Deletion job {job.id} failed")
+            # Batches already deleted stay deleted; the retry carries on from there
+            job.status = 'failed'
+            job.error = str(e)
+            job.attempts = (job.attempts or 0) + 1
+            job.next_attempt_at = datetime.utcnow() + retry_delay(job.attempts)
+
+        db.session.commit()
+        processed += 1
+
+def reaper_loop(app):
+    """Run deletion jobs forever, waking on new jobs or every poll interval"""
+    while True:
+        with app.app_context():
+            try:
+                run_pending_jobs()
+            except Exception:
+                app.logger.exception("Deletion reaper failed")
+            finally:
+                db.session.remove()
+
+        reaper_wakeup.wait(app.config['DELETION_POLL_INTERVAL'])
+        reaper_wakeup.clear()
+
+def start_reaper(app):
+    """Start the background reaper thread for this process"""
+    thread = threading.Thread(target=reaper_loop, args=(app,), name='deletion-reaper', daemon=True)
+    thread.start()
+    return thread
+
+@deletion_bp.route('', methods=['GET'])
+@jwt_required()
+def list_jobs():
+    """List the user's recent deletion jobs"""
+    user_id = get_jwt_identity()
+    jobs = DeletionJob.query.filter_by(user_id=user_id).order_by(DeletionJob.id.desc()).limit(50).all()
+
+    return jsonify({'jobs': [job.to_dict() for job in jobs]}), 200
+
+@deletion_bp.route('/<int:job_id>', methods=['GET'])
+@jwt_required()
+def get_job(job_id):
+    """Get deletion job status"""
+    user_id = get_jwt_identity()
+    job = DeletionJob.query.filter_by(id=job_id, user_id=user_id).first()
+
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+
+    return jsonify({'job': job.to_dict()}), 200
+
+@deletion_bp.route('/<int:job_id>/retry', methods=['POST'])
+@jwt_required()
+def retry_job(job_id):
+    """Retry a failed deletion job now instead of waiting for its next attempt"""
+    user_id = get_jwt_identity()
+    job = DeletionJob.query.filter_by(id=job_id, user_id=user_id).first()
+
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    if job.status != 'failed':
+        return jsonify({'error': 'Only failed jobs can be retried'}), 409
+
+    job.next_attempt_at = datetime.utcnow()
+    db.session.commit()
+    reaper_wakeup.set()
+
+    return jsonify({'job': job.to_dict()}), 202
+
+if __name__ == '__main__':
+    # Standalone reaper process (set DELETION_REAPER_THREAD=false for the web workers)
+    os.environ['DELETION_REAPER_THREAD'] = 'false'
+    from app import create_app
+
+    app = create_app()
+    app.logger.info("Deletion reaper started")
+    reaper_loop(app)
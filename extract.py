@@ -0,0 +1,320 @@
+import os
+import zlib
+import zipfile
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+from models import db, File, Folder
+from utils import secure_filename_custom, sniff_mime_type, allowed_file, validate_path
+from blobstore import blob_relpath, compress_for_storage, store_blobs, collect_garbage
+from ingest import StagedUpload
+from usage import charge_user, charge_folder
+from file_manager import allocate_display_name, set_file_content
+from previews import queue_previews, delete_previews
+
+# Notional directory members are resolved against; a member whose path leaves it is refused
+EXTRACT_ROOT = os.path.join(os.sep, 'archive')
+
+# Size of the blocks copied out of archive members
+EXTRACT_BUFFER_SIZE = 1024 * 1024
+
+# Metadata some archivers add next to the real content
+IGNORED_PREFIXES = ('__MACOSX/',)
+
+class ExtractionError(Exception):
+    """Raised when an uploaded archive is refused or cannot be read"""
+
+def is_symlink(info):
+    """Check whether a zip member was stored as a symbolic link (Unix mode bits)"""
+    return (info.external_attr >> 16) & 0o170000 == 0o120000
+
+def member_parts(name):
+    """Split a member's name into its path components; raises ValueError if it escapes the archive"""
+    target = validate_path(EXTRACT_ROOT, name.replace('\\', '/'))
+    relative = os.path.relpath(target, EXTRACT_ROOT)
+    if relative == os.curdir:
+        return ()
+    return tuple(relative.split(os.sep))
+
+def plan_members(archive, archive_size):
+    """
+    Check an archive against the extraction limits and sort out its members
+
+    Returns (directories, members, skipped): every folder path needed as a
+    tuple of names, (folder path, file name, ZipInfo) for each file to
+    extract, and {'path', 'error'} for each member left out. The sizes in
+    the central directory are trusted here because zipfile never inflates
+    a member past its recorded size.
+    """
+    config = current_app.config
+    infos = archive.infolist()
+
+    if len(infos) > config['EXTRACT_MAX_MEMBERS']:
+        raise ExtractionError(f"Archive has more than {config['EXTRACT_MAX_MEMBERS']} entries")
+
+    total_size = sum(info.file_size for info in infos)
+    if total_size > config['EXTRACT_MAX_SIZE']:
+        raise ExtractionError('Archive expands beyond the extraction size limit')
+    if total_size > max(archive_size, 1) * config['EXTRACT_MAX_RATIO']:
+        raise ExtractionError('Archive compression ratio is too high')
+
+    directories, members, skipped = set(), [], []
+
+    for info in infos:
+        if info.filename.startswith(IGNORED_PREFIXES):
+            continue
+
+        try:
+            parts = member_parts(info.filename)
+        except ValueError:
+            skipped.append({'path': info.filename, 'error': 'Invalid path'})
+            continue
+        if not parts:
+            continue
+
+        if info.is_dir():
+            directories.update(parts[:depth] for depth in range(1, len(parts) + 1))
+            continue
+
+        if is_symlink(info):
+            skipped.append({'path': info.filename, 'error': 'Links are not extracted'})
+            continue
+        if info.flag_bits & 0x1:
+            skipped.append({'path': info.filename, 'error': 'Encrypted entries are not supported'})
+            continue
+        if not allowed_file(parts[-1], config['ALLOWED_EXTENSIONS']):
+            skipped.append({'path': info.filename, 'error': 'File type not allowed'})
+            continue
+
+        directories.update(parts[:depth] for depth in range(1, len(parts)))
+        members.append((parts[:-1], parts[-1], info))
+
+    return directories, members, skipped
+
+def stage_member(archive, info):
+    """Copy one member into a staging file, hashing it on the way"""
+    staged = StagedUpload()
+    try:
+        with archive.open(info) as source:
+            while True:
+                block = source.read(EXTRACT_BUFFER_SIZE)
+                if not block:
+                    break
+                staged.write(block)
+        staged.finish()
+    except BaseException:
+        staged.close()
+        raise
+    return staged
+
+def create_folders(user_id, root, directories, create=True):
+    """
+    Find or create every folder path below `root`, one level at a time
+
+    Each level costs one lookup query and one multi-row INSERT, however
+    many folders it has. Returns ({path: folder id}, number of folders created).
+    With `create=False` nothing is written and only existing paths are returned.
+    """
+    ids = {(): root.id if root else None}
+    created = 0
+
+    for depth in range(1, max(map(len, directories), default=0) + 1):
+        level = sorted(path for path in directories if len(path) == depth and path[:-1] in ids)
+        if not level:
+            break
+
+        while True:
+            parent_ids = {ids[path[:-1]] for path in level}
+            parent_filter = Folder.parent_folder_id.in_([p for p in parent_ids if p is not None])
+            if None in parent_ids:
+                parent_filter = db.or_(parent_filter, Folder.parent_folder_id.is_(None))
+
+            found = {(parent_id, name): folder_id for folder_id, parent_id, name in db.session.execute(
+                db.select(Folder.id, Folder.parent_folder_id, Folder.folder_name).where(
+                    Folder.user_id == user_id, Folder.deleted_at.is_(None), parent_filter,
+                    Folder.folder_name.in_({path[-1] for path in level})
+                )
+            )}
+
+            missing = [{'user_id': user_id, 'folder_name': path[-1], 'parent_folder_id': ids[path[:-1]]}
+                       for path in level if (ids[path[:-1]], path[-1]) not in found] if create else []
+            if not create:
+                break
+
+            # A concurrent request may create one of the siblings first; look the level up again
+            try:
+                with db.session.begin_nested():
+                    if missing:
+                        found.update(((parent_id, name), folder_id) for folder_id, parent_id, name in db.session.execute(
+                            db.insert(Folder).returning(Folder.id, Folder.parent_folder_id, Folder.folder_name), missing
+                        ))
+            except IntegrityError:
+                continue
+            break
+
+        for path in level:
+            if (ids[path[:-1]], path[-1]) in found:
+                ids[path] = found[(ids[path[:-1]], path[-1])]
+        created += len(missing)
+
+    return ids, created
+
+def insert_files(rows):
+    """Insert gathered File rows with one executemany (without reading back their ids) and clear the list"""
+    if rows:
+        db.session.execute(db.insert(File), rows)
+        rows.clear()
+
+def apply_folder_usage(root, usage, folder_ids):
+    """
+    Add each extracted file's size to its folder and every folder above it
+
+    `usage` maps folder paths inside the archive to (size, count) changes and
+    `folder_ids` maps those paths to folder ids. Folders inside the
+    archive are updated in one executemany; `root` and its ancestors once.
+    """
+    totals = {}
+    for path, (size, count) in usage.items():
+        for depth in range(1, len(path) + 1):
+            folder_total = totals.setdefault(path[:depth], [0, 0])
+            folder_total[0] += size
+            folder_total[1] += count
+
+    rows = [{'folder_id': folder_ids[path], 'size': size, 'count': count}
+            for path, (size, count) in totals.items() if size or count]
+    if rows:
+        folders = Folder.__table__
+        db.session.execute(
+            folders.update().where(folders.c.id == db.bindparam('folder_id')).values(
+                total_size=folders.c.total_size + db.bindparam('size'),
+                file_count=folders.c.file_count + db.bindparam('count')
+            ), rows
+        )
+
+    root_size = sum(size for size, _ in usage.values())
+    root_count = sum(count for _, count in usage.values())
+    charge_folder(root.id if root else None, root_size, root_count)
+
+def extract_archive(user_id, folder, archive_path, on_conflict='rename'):
+    """
+    Unpack an uploaded zip archive into the folder tree below `folder`
+
+    Members are first copied into staging files (hashing and compressing
+    them) without touching the database. Folders, blobs and File rows are
+    then written in bulk in one transaction, so an extraction is all or
+    nothing. `on_conflict` applies to each file as in store_uploaded_file,
+    except that 'reject' skips the clashing file instead of failing. The
+    archive file is consumed. Returns a summary of what was extracted.
+    """
+    staged = []
+
+    try:
+        try:
+            with zipfile.ZipFile(archive_path) as archive:
+                directories, members, skipped = plan_members(archive, os.path.getsize(archive_path))
+
+                for dir_parts, name, info in members:
+                    try:
+                        entry = stage_member(archive, info)
+                    except NotImplementedError:
+                        skipped.append({'path': info.filename, 'error': 'Unsupported compression method'})
+                        continue
+                    mime_type = sniff_mime_type(entry.head, name)
+                    compressed = compress_for_storage(entry.path, entry.content_hash, entry.size, mime_type)
+                    staged.append((dir_parts, name, entry, mime_type, compressed))
+        except (zipfile.BadZipFile, zipfile.LargeZipFile, EOFError, zlib.error, NotImplementedError) as e:
+            raise ExtractionError(f'Archive could not be read: {e}')
+        finally:
+            os.remove(archive_path)
+
+        # Only folders that already exist can hold clashing names; the rest are created after the charge
+        existing_ids, _ = create_folders(user_id, folder, directories, create=False)
+
+        # Names already used in the target folders, with one query
+        taken = {(folder_id, filename): file_id for file_id, folder_id, filename in db.session.execute(
+            db.select(File.id, File.folder_id, File.filename).where(
+                File.user_id == user_id, File.deleted_at.is_(None),
+                db.or_(File.folder_id.in_([i for i in existing_ids.values() if i is not None]),
+                       File.folder_id.is_(None) if None in existing_ids.values() else db.false()),
+                File.filename.in_({secure_filename_custom(name) for _, name, *_ in staged})
+            )
+        )}
+
+        # Decide what happens to each file before anything is written
+        plan, overwritten = [], set()
+        for dir_parts, name, entry, mime_type, compressed in staged:
+            key = (existing_ids[dir_parts], secure_filename_custom(name)) if dir_parts in existing_ids else None
+            existing = None
+
+            if key in taken:
+                if on_conflict == 'reject':
+                    skipped.append({'path': '/'.join(dir_parts + (name,)), 'error': 'File already exists'})
+                    entry.close()
+                    continue
+                if on_conflict == 'overwrite' and key not in overwritten:
+                    existing = db.session.get(File, taken[key])
+                    overwritten.add(key)
+
+            plan.append((dir_parts, name, entry, mime_type, compressed, existing))
+
+        # The archive counts against the quota once, net of skipped files and replaced content
+        charge_user(user_id, sum(entry.size - (existing.file_size if existing else 0)
+                                 for _, _, entry, _, _, existing in plan),
+                    sum(1 for *_, existing in plan if not existing))
+
+        folder_ids, folders_created = create_folders(user_id, folder, directories)
+
+        store_blobs([(entry.path, entry.content_hash, entry.size, compressed)
+                     for _, _, entry, _, compressed, _ in plan])
+
+        usage, released, claimed, new_files = {}, [], set(), []
+        for dir_parts, name, entry, mime_type, compressed, existing in plan:
+            folder_usage = usage.setdefault(dir_parts, [0, 0])
+
+            if existing:
+                folder_usage[0] += entry.size - existing.file_size
+                released.append(set_file_content(existing, entry.content_hash, entry.size))
+                existing.original_filename = name
+                existing.mime_type = mime_type
+                continue
+
+            folder_id = folder_ids[dir_parts]
+            filename = secure_filename_custom(name)
+            # Later copies of a name (in the folder or earlier in the archive) get a `name_<n>` name;
+            # rows gathered so far are inserted first so the allocation sees them
+            if (folder_id, filename) in taken or (folder_id, filename) in claimed:
+                insert_files(new_files)
+                filename = allocate_display_name(user_id, folder_id, filename)
+            claimed.add((folder_id, filename))
+
+            folder_usage[0] += entry.size
+            folder_usage[1] += 1
+            new_files.append({
+                'user_id': user_id,
+                'folder_id': folder_id,
+                'filename': filename,
+                'original_filename': name,
+                'file_path': blob_relpath(entry.content_hash),
+                'content_hash': entry.content_hash,
+                'file_size': entry.size,
+                'mime_type': mime_type
+            })
+
+        insert_files(new_files)
+        apply_folder_usage(folder, usage, folder_ids)
+        db.session.commit()
+    except BaseException:
+        db.session.rollback()
+        for _, _, entry, _, _ in staged:
+            entry.close()
+        raise
+
+    collect_garbage(released, delete_previews)
+    queue_previews((entry.content_hash, mime_type) for _, _, entry, mime_type, _, _ in plan)
+
+    return {
+        'files': len(claimed),
+        'updated': len(plan) - len(claimed),
+        'folders': folders_created,
+        'size': sum(entry.size for _, _, entry, _, _, _ in plan),
+        'skipped': skipped
+    }
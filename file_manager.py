@@ -1,18 +1,266 @@
 import os
-from flask import Blueprint, request, jsonify, send_file, current_app
+import json
+import base64
+import zipfile
+from datetime import datetime
+from flask import Blueprint, request, jsonify, send_file, redirect, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from werkzeug.utils import secure_filename
-from models import db, User, File, Folder
-from utils import (secure_filename_custom, get_mime_type, validate_path,
-                   create_user_directory, allowed_file, get_unique_filename)
+from werkzeug.wsgi import wrap_file
+from models import db, User, Blob, File, Folder, NameCounter
+from utils import (secure_filename_custom, get_mime_type, sniff_mime_type, allowed_file,
+                   split_relative_path, str_to_bool, content_disposition)
+from blobstore import (blob_relpath, hash_file, compress_for_storage, store_blob, open_blob,
+                       add_blob_reference, release_blob, collect_garbage)
+from storage import get_storage
+from compression import is_compressible, negotiate_encoding, compress_stream
+from ingest import StagedUpload, new_staging_path, MIME_SNIFF_BYTES
+from deletion import soft_delete_file, soft_delete_folder, reaper_wakeup
+from usage import QuotaExceededError, check_quota, charge_user, charge_folder, folder_totals
 from auth import login_required
-from sqlalchemy import or_
+from cache import get_cache, listing_version
+from previews import queue_previews, delete_previews
+from sqlalchemy import or_, and_
+from sqlalchemy.exc import IntegrityError
 
 file_manager_bp = Blueprint('file_manager', __name__, url_prefix='/api')
 
-def get_user_base_path(user_id):
-    """Get base path for user's files"""
-    return os.path.join(current_app.config['UPLOAD_FOLDER'], f'user_{user_id}')
+# Maximum number of manifest entries accepted by one /files/sync call
+SYNC_BATCH_LIMIT = 1000
+
+# Upload policies for a display name that is already used in the target folder
+CONFLICT_POLICIES = ('rename', 'overwrite', 'reject')
+
+# Request bytes allowed for multipart framing when checking an upload's size against the quota
+MULTIPART_OVERHEAD = 16 * 1024
+
+# Tries at storing an upload under a fresh name before a concurrent upload wins
+NAME_ALLOCATION_ATTEMPTS = 5
+
+# Sort keys accepted by /files/list, mapped to (file column, folder column).
+# Folder sizes change with every upload below them, so folders sort by name instead.
+LIST_SORT_COLUMNS = {
+    'name': (File.original_filename, Folder.folder_name),
+    'size': (File.file_size, Folder.folder_name),
+    'date': (File.created_at, Folder.created_at),
+}
+
+def display_name_taken(user_id, folder_id, filename, exclude_file_id=None):
+    """Check whether a live file in the folder already uses the display name"""
+    query = File.query.filter_by(user_id=user_id, folder_id=folder_id, filename=filename, deleted_at=None)
+    if exclude_file_id:
+        query = query.filter(File.id != exclude_file_id)
+    return query.first() is not None
+
+def live_file_named(user_id, folder_id, filename):
+    """Get the live file using a display name in the folder, if any"""
+    return File.query.filter_by(user_id=user_id, folder_id=folder_id, filename=filename, deleted_at=None).first()
+
+def highest_name_suffix(user_id, folder_id, filename):
+    """Get the highest n of the live `name_<n>` variants of a display name (0 if none)"""
+    base, extension = os.path.splitext(filename)
+    names = db.session.execute(
+        db.select(File.filename).filter_by(user_id=user_id, folder_id=folder_id, deleted_at=None).filter(
+            File.filename.startswith(f'{base}_', autoescape=True),
+            File.filename.endswith(extension, autoescape=True)
+        )
+    ).scalars()
+    
+    suffixes = [name[len(base) + 1:len(name) - len(extension)] for name in names]
+    return max((int(suffix) for suffix in suffixes if suffix.isdigit()), default=0)
+
+def allocate_display_name(user_id, folder_id, filename, exclude_file_id=None):
+    """
+    Pick a display name that is not yet used in the folder
+    
+    A free `filename` is kept. Otherwise the next `name_<n>` suffix comes from
+    the folder's NameCounter row, so the cost doesn't grow with the number of
+    same-named files; the counter is seeded from existing names on first use.
+    The caller commits; the unique name index rejects concurrent duplicates.
+    """
+    if not display_name_taken(user_id, folder_id, filename, exclude_file_id):
+        return filename
+    
+    base, extension = os.path.splitext(filename)
+    key = {'user_id': user_id, 'folder_key': folder_id or 0, 'filename': filename}
+    
+    while True:
+        bumped = NameCounter.query.filter_by(**key).update({'last_suffix': NameCounter.last_suffix + 1})
+        if not bumped:
+            db.session.add(NameCounter(last_suffix=highest_name_suffix(user_id, folder_id, filename) + 1, **key))
+            db.session.flush()
+        
+        suffix = db.session.query(NameCounter.last_suffix).filter_by(**key).scalar()
+        candidate = f"{base}_{suffix}{extension}"
+        # Only a file explicitly given a `name_<n>` name can still be in the way
+        if not display_name_taken(user_id, folder_id, candidate, exclude_file_id):
+            return candidate
+
+def parse_conflict_policy(on_conflict, overwrite=False):
+    """
+    Read an upload's name conflict policy; raises ValueError if unknown
+    The older boolean `overwrite` option is accepted as on_conflict=overwrite
+    """
+    if on_conflict is None:
+        return 'overwrite' if overwrite else 'rename'
+    
+    if on_conflict not in CONFLICT_POLICIES:
+        raise ValueError(f"on_conflict must be one of: {', '.join(CONFLICT_POLICIES)}")
+    return on_conflict
+
+def folder_name_taken(user_id, parent_folder_id, folder_name, exclude_folder_id=None):
+    """Check whether a live sibling folder already uses the name"""
+    query = Folder.query.filter_by(
+        user_id=user_id,
+        parent_folder_id=parent_folder_id,
+        folder_name=folder_name,
+        deleted_at=None
+    )
+    if exclude_folder_id:
+        query = query.filter(Folder.id != exclude_folder_id)
+    return query.first() is not None
+
+def resolve_folder_path(user_id, parent_folder, parts, create=True):
+    """
+    Walk a chain of named subfolders below parent_folder (None for root)
+    Missing folders are created, or LookupError is raised if create is False
+    """
+    folder = parent_folder
+    
+    for name in parts:
+        parent_id = folder.id if folder else None
+        child = Folder.query.filter_by(
+            user_id=user_id,
+            folder_name=name,
+            parent_folder_id=parent_id,
+            deleted_at=None
+        ).first()
+        
+        if not child:
+            if not create:
+                raise LookupError(name)
+            child = Folder(
+                user_id=user_id,
+                folder_name=name,
+                parent_folder_id=parent_id
+            )
+            # A concurrent request may create the same sibling first
+            try:
+                with db.session.begin_nested():
+                    db.session.add(child)
+            except IntegrityError:
+                child = Folder.query.filter_by(
+                    user_id=user_id,
+                    folder_name=name,
+                    parent_folder_id=parent_id,
+                    deleted_at=None
+                ).one()
+        
+        folder = child
+    
+    return folder
+
+def set_file_content(file, content_hash, file_size):
+    """
+    Point a file at new content, releasing its previous blob
+    Returns the released hash so the caller can collect garbage after commit
+    """
+    old_hash = file.content_hash
+    file.content_hash = content_hash
+    file.file_path = blob_relpath(content_hash)
+    file.file_size = file_size
+    release_blob(old_hash)
+    return old_hash
+
+def store_uploaded_file(user_id, folder, original_filename, staging_path, on_conflict='rename',
+                        content_hash=None, file_size=None, mime_type=None):
+    """
+    Move a staged upload into the blob store and record it
+    
+    Pass `content_hash`, `file_size` and `mime_type` when they were computed
+    while the upload was received; otherwise the staging file is read for them.
+    `on_conflict` handles a file of the same name in the folder: 'rename'
+    stores the upload as `name_<n>`, 'overwrite' updates that file in place
+    and 'reject' raises FileExistsError.
+    """
+    # Secure the filename
+    filename = secure_filename_custom(original_filename)
+    folder_id = folder.id if folder else None
+    
+    if on_conflict == 'reject' and display_name_taken(user_id, folder_id, filename):
+        os.remove(staging_path)
+        raise FileExistsError(filename)
+    
+    # Get file info
+    if content_hash is None or file_size is None:
+        content_hash, file_size = hash_file(staging_path)
+    if mime_type is None:
+        with open(staging_path, 'rb') as f:
+            mime_type = sniff_mime_type(f.read(MIME_SNIFF_BYTES), original_filename)
+    
+    # Compress for storage before the quota update takes the database write lock
+    compressed = compress_for_storage(staging_path, content_hash, file_size, mime_type)
+    
+    # Count the upload against the quota before it is stored; an overwrite only adds the difference in size
+    existing = live_file_named(user_id, folder_id, filename) if on_conflict == 'overwrite' else None
+    size_change = file_size - (existing.file_size if existing else 0)
+    try:
+        charge_user(user_id, size_change, 0 if existing else 1)
+    except QuotaExceededError:
+        os.remove(staging_path)
+        raise
+    charge_folder(folder_id, size_change, 0 if existing else 1)
+    
+    # Atomically rename the staged content into the content-addressed store
+    store_blob(staging_path, content_hash, file_size, compressed=compressed)
+    
+    for _ in range(NAME_ALLOCATION_ATTEMPTS):
+        if existing:
+            released_hash = set_file_content(existing, content_hash, file_size)
+            existing.original_filename = original_filename
+            existing.mime_type = mime_type
+            db.session.commit()
+            collect_garbage([released_hash], delete_previews)
+            queue_previews([(content_hash, mime_type)])
+            return existing
+        
+        # Create database entry; the unique name index rejects a concurrent upload of the same name
+        try:
+            with db.session.begin_nested():
+                new_file = File(
+                    user_id=user_id,
+                    folder_id=folder_id,
+                    filename=filename if on_conflict == 'reject' else
+                    allocate_display_name(user_id, folder_id, filename),
+                    original_filename=original_filename,
+                    file_path=blob_relpath(content_hash),
+                    content_hash=content_hash,
+                    file_size=file_size,
+                    mime_type=mime_type
+                )
+                db.session.add(new_file)
+        except IntegrityError:
+            if on_conflict == 'reject':
+                break
+            if on_conflict == 'overwrite':
+                # A concurrent upload created the file first; replace its content instead
+                existing = live_file_named(user_id, folder_id, filename)
+                if existing:
+                    charge_user(user_id, -existing.file_size, -1, enforce=False)
+                    charge_folder(folder_id, -existing.file_size, -1)
+            continue
+        
+        db.session.commit()
+        queue_previews([(content_hash, mime_type)])
+        return new_file
+    
+    # Lost the name to concurrent uploads; give the content reference and usage back
+    release_blob(content_hash)
+    charge_user(user_id, -file_size, -1, enforce=False)
+    charge_folder(folder_id, -file_size, -1)
+    db.session.commit()
+    collect_garbage([content_hash], delete_previews)
+    raise FileExistsError(filename)
 
 @file_manager_bp.route('/files/upload', methods=['POST'])
 @jwt_required()
@@ -20,6 +268,12 @@ def upload_file():
     """Upload a file to the system"""
     user_id = get_jwt_identity()
     
+    # Refuse an upload that cannot fit in the quota before any of the body is read
+    try:
+        check_quota(user_id, max((request.content_length or 0) - MULTIPART_OVERHEAD, 0))
+    except QuotaExceededError:
+        return jsonify({'error': 'Storage quota exceeded'}), 413
+    
     # Check if file is in request
     if 'file' not in request.files:
         return jsonify({'error': 'No file provided'}), 400
@@ -35,7 +289,7 @@ def upload_file():
     # Validate folder ownership if specified
     folder = None
     if folder_id:
-        folder = Folder.query.filter_by(id=folder_id, user_id=user_id).first()
+        folder = Folder.query.filter_by(id=folder_id, user_id=user_id, deleted_at=None).first()
         if not folder:
             return jsonify({'error': 'Folder not found or access denied'}), 404
     
@@ -43,54 +297,293 @@ def upload_file():
     if not allowed_file(file.filename, current_app.config['ALLOWED_EXTENSIONS']):
         return jsonify({'error': 'File type not allowed'}), 400
     
-    # Secure the filename
-    original_filename = file.filename
-    filename = secure_filename_custom(original_filename)
-    
-    # Create user directory if it doesn't exist
-    user_folder = create_user_directory(current_app.config['UPLOAD_FOLDER'], user_id)
+    # Optional relative folder path below the target folder (created as needed)
+    try:
+        path_parts = split_relative_path(request.form.get('path', ''))
+    except ValueError:
+        return jsonify({'error': 'Invalid path'}), 400
     
-    # If uploading to a specific folder, use that path
-    if folder:
-        upload_path = os.path.join(user_folder, folder.folder_path.lstrip('/'))
-    else:
-        upload_path = user_folder
+    try:
+        on_conflict = parse_conflict_policy(
+            request.form.get('on_conflict'),
+            overwrite=str_to_bool(request.form.get('overwrite', 'false'))
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    os.makedirs(upload_path, exist_ok=True)
+    folder = resolve_folder_path(user_id, folder, path_parts)
     
-    # Get unique filename to avoid conflicts
-    filename = get_unique_filename(upload_path, filename)
-    file_path = os.path.join(upload_path, filename)
+    if str_to_bool(request.form.get('extract', 'false')):
+        return upload_archive(user_id, folder, file, on_conflict)
     
-    # Save the file
-    file.save(file_path)
+    try:
+        # The body was streamed straight into a staging file while it was parsed
+        stream = file.stream
+        if isinstance(stream, StagedUpload):
+            stream.finish()
+            new_file = store_uploaded_file(
+                user_id, folder, file.filename, stream.path, on_conflict,
+                content_hash=stream.content_hash,
+                file_size=stream.size,
+                mime_type=sniff_mime_type(stream.head, file.filename)
+            )
+        else:
+            staging_path = new_staging_path()
+            file.save(staging_path)
+            new_file = store_uploaded_file(user_id, folder, file.filename, staging_path, on_conflict)
+    except FileExistsError:
+        db.session.commit()  # Keep any folders created for `path`
+        return jsonify({'error': 'File already exists'}), 409
+    except QuotaExceededError:
+        db.session.commit()
+        return jsonify({'error': 'Storage quota exceeded'}), 413
     
-    # Get file info
-    file_size = os.path.getsize(file_path)
-    mime_type = get_mime_type(original_filename)
+    return jsonify({
+        'message': 'File uploaded successfully',
+        'file': new_file.to_dict()
+    }), 201
+
+def extraction_response(user_id, folder, staging_path, on_conflict):
+    """Unpack a staged zip upload into `folder` and describe the result"""
+    # Imported here: extract builds on the naming helpers of this module
+    from extract import ExtractionError, extract_archive
     
-    # Store relative path from user folder
-    relative_path = os.path.relpath(file_path, user_folder)
+    # Keep any folders created for `path`, and don't hold the write lock while the archive is unpacked
+    db.session.commit()
     
-    # Create database entry
-    new_file = File(
-        user_id=user_id,
-        folder_id=folder_id,
-        filename=filename,
-        original_filename=original_filename,
-        file_path=relative_path,
-        file_size=file_size,
-        mime_type=mime_type
-    )
+    if not zipfile.is_zipfile(staging_path):
+        os.remove(staging_path)
+        return jsonify({'error': 'Only zip archives can be extracted'}), 400
     
-    db.session.add(new_file)
-    db.session.commit()
+    try:
+        summary = extract_archive(user_id, folder, staging_path, on_conflict)
+    except ExtractionError as e:
+        return jsonify({'error': str(e)}), 400
+    except QuotaExceededError:
+        return jsonify({'error': 'Storage quota exceeded'}), 413
     
     return jsonify({
-        'message': 'File uploaded successfully',
-        'file': new_file.to_dict()
+        'message': 'Archive extracted successfully',
+        'folder': folder.to_dict() if folder else None,
+        'extracted': summary
     }), 201
 
+def upload_archive(user_id, folder, file, on_conflict):
+    """Handle an upload sent with extract=true"""
+    stream = file.stream
+    if isinstance(stream, StagedUpload):
+        stream.finish()
+        staging_path = stream.path
+    else:
+        staging_path = new_staging_path()
+        file.save(staging_path)
+    
+    return extraction_response(user_id, folder, staging_path, on_conflict)
+
+@file_manager_bp.route('/files/sync', methods=['POST'])
+@jwt_required()
+def sync_files():
+    """
+    Compare a client manifest with stored files in one batched call
+    
+    Each entry is {"path": "dir/name.ext", "hash": <sha256>, "size": <bytes>},
+    relative to `folder_id`. Up-to-date files are reported as 'unchanged',
+    content the user already stores elsewhere is linked in place without
+    an upload ('linked'), and everything else is reported as 'upload'.
+    Folders on the manifest's paths are created, ready for the uploads.
+    """
+    user_id = get_jwt_identity()
+    data = request.get_json()
+    
+    if not data or not isinstance(data.get('files'), list):
+        return jsonify({'error': 'File manifest is required'}), 400
+    
+    entries = data['files']
+    if len(entries) > SYNC_BATCH_LIMIT:
+        return jsonify({'error': f'At most {SYNC_BATCH_LIMIT} files per request'}), 400
+    
+    # Validate root folder ownership if specified
+    root_folder = None
+    folder_id = data.get('folder_id')
+    if folder_id:
+        root_folder = Folder.query.filter_by(id=folder_id, user_id=user_id, deleted_at=None).first()
+        if not root_folder:
+            return jsonify({'error': 'Folder not found or access denied'}), 404
+    
+    # Only content this user already owns may be linked without uploading it
+    hashes = {entry.get('hash') for entry in entries
+              if isinstance(entry, dict) and isinstance(entry.get('hash'), str)}
+    owned = {row.content_hash: row for row in File.query.filter(
+        File.user_id == user_id,
+        File.deleted_at.is_(None),
+        File.content_hash.in_([h for h in hashes if h])
+    ).all()}
+    
+    results = []
+    released = []
+    folders = {}
+    
+    for entry in entries:
+        if not isinstance(entry, dict) or not entry.get('path'):
+            results.append({'path': None, 'status': 'rejected', 'error': 'Path is required'})
+            continue
+        
+        path = entry['path']
+        content_hash = entry.get('hash')
+        
+        if content_hash is not None and not isinstance(content_hash, str):
+            results.append({'path': path, 'status': 'rejected', 'error': 'Invalid hash'})
+            continue
+        
+        try:
+            *dir_parts, name = split_relative_path(path)
+        except ValueError:
+            results.append({'path': path, 'status': 'rejected', 'error': 'Invalid path'})
+            continue
+        
+        if not allowed_file(name, current_app.config['ALLOWED_EXTENSIONS']):
+            results.append({'path': path, 'status': 'rejected', 'error': 'File type not allowed'})
+            continue
+        
+        # Find the target folder
+        dir_key = tuple(dir_parts)
+        if dir_key not in folders:
+            try:
+                folders[dir_key] = resolve_folder_path(user_id, root_folder, dir_parts, create=False)
+            except LookupError:
+                folders[dir_key] = False
+        target = folders[dir_key]
+        
+        filename = secure_filename_custom(name)
+        existing = None
+        if target is not False:
+            existing = File.query.filter_by(
+                user_id=user_id,
+                folder_id=target.id if target else None,
+                filename=filename,
+                deleted_at=None
+            ).first()
+        
+        if existing and content_hash and existing.content_hash == content_hash:
+            results.append({'path': path, 'status': 'unchanged', 'file_id': existing.id})
+            continue
+        
+        # Create missing folders now, so parallel uploads into them don't race
+        if target is False:
+            target = folders[dir_key] = resolve_folder_path(user_id, root_folder, dir_parts)
+        
+        source = owned.get(content_hash)
+        if not source:
+            results.append({'path': path, 'status': 'upload'})
+            continue
+        
+        # Linked content counts against the quota like an upload would
+        size_change = source.file_size - (existing.file_size if existing else 0)
+        try:
+            charge_user(user_id, size_change, 0 if existing else 1)
+        except QuotaExceededError:
+            results.append({'path': path, 'status': 'rejected', 'error': 'Storage quota exceeded'})
+            continue
+        charge_folder(target.id if target else None, size_change, 0 if existing else 1)
+        
+        # Link the already-stored content in place of (or as) this file
+        add_blob_reference(content_hash)
+        if existing:
+            released.append(set_file_content(existing, content_hash, source.file_size))
+            linked = existing
+        else:
+            linked = File(
+                user_id=user_id,
+                folder_id=target.id if target else None,
+                filename=filename,
+                original_filename=name,
+                file_path=blob_relpath(content_hash),
+                content_hash=content_hash,
+                file_size=source.file_size,
+                mime_type=get_mime_type(name)
+            )
+            db.session.add(linked)
+        db.session.flush()
+        results.append({'path': path, 'status': 'linked', 'file_id': linked.id})
+    
+    db.session.commit()
+    collect_garbage([h for h in released if h], delete_previews)
+    
+    summary = {}
+    for result in results:
+        summary[result['status']] = summary.get(result['status'], 0) + 1
+    
+    return jsonify({'results': results, 'summary': summary}), 200
+
+def send_blob_file(file, path, etag):
+    """
+    Send a file's stored content from local disk
+    Conditional response: honours Range/If-Range (206) and If-None-Match (304)
+    """
+    return send_file(
+        path,
+        as_attachment=True,
+        download_name=file.original_filename,
+        mimetype=file.mime_type,
+        conditional=True,
+        etag=etag,
+        last_modified=file.updated_at
+    )
+
+def accel_redirect_uri(path):
+    """Get the nginx internal URI of a blob path (None if it is under no storage root)"""
+    prefix = current_app.config['DOWNLOAD_ACCEL_PREFIX'].rstrip('/')
+    if current_app.config['STORAGE_BACKEND'] == 'sharded':
+        roots = {root: f'{prefix}/{index}' for index, root in enumerate(current_app.config['STORAGE_ROOTS'])}
+    else:
+        roots = {current_app.config['BLOB_FOLDER']: prefix}
+    
+    for root, location in roots.items():
+        relpath = os.path.relpath(path, root)
+        if not relpath.startswith(os.pardir):
+            return f"{location}/{relpath.replace(os.sep, '/')}"
+    return None
+
+def send_blob_offload(file, path, etag):
+    """
+    Hand a file's stored content on local disk to the front proxy to send
+
+    The proxy streams the file with sendfile() and answers Range requests
+    itself; the app only authorizes and answers conditional requests.
+    Returns None if the path cannot be handed over.
+    """
+    mode = current_app.config['DOWNLOAD_OFFLOAD']
+    if 'If-Range' in request.headers:
+        return None  # The proxy would check it against its own ETag, not the content hash
+    if mode == 'x-accel-redirect':
+        header, value = 'X-Accel-Redirect', accel_redirect_uri(path)
+    elif mode == 'x-sendfile':
+        header, value = 'X-Sendfile', os.path.abspath(path)
+    else:
+        return None
+    if value is None:
+        return None
+    
+    response = current_app.response_class(mimetype=file.mime_type)
+    response.headers['Content-Disposition'] = content_disposition(file.original_filename)
+    response.last_modified = file.updated_at
+    response.set_etag(etag)
+    response = response.make_conditional(request)
+    if response.status_code != 304:
+        # Some proxies send the file even with a 304
+        response.headers[header] = value
+    return response
+
+def send_blob_stream(file, body, length, etag):
+    """Send a file's content from an iterable body (length None if not known in advance)"""
+    response = current_app.response_class(body, mimetype=file.mime_type, direct_passthrough=True)
+    response.headers['Content-Disposition'] = content_disposition(file.original_filename)
+    response.last_modified = file.updated_at
+    response.set_etag(etag)
+    if length is not None:
+        response.content_length = length
+    return response.make_conditional(request, accept_ranges=True, complete_length=length)
+
 @file_manager_bp.route('/files/download/<int:file_id>', methods=['GET'])
 @jwt_required()
 def download_file(file_id):
@@ -98,47 +591,227 @@ def download_file(file_id):
     user_id = get_jwt_identity()
     
     # Get file and verify ownership
-    file = File.query.filter_by(id=file_id, user_id=user_id).first()
+    file = File.query.filter_by(id=file_id, user_id=user_id, deleted_at=None).first()
     
     if not file:
         return jsonify({'error': 'File not found or access denied'}), 404
     
-    # Construct full file path
-    user_folder = get_user_base_path(user_id)
-    file_path = os.path.join(user_folder, file.file_path)
+    blob = db.session.get(Blob, file.content_hash) if file.content_hash else None
+    if not blob:
+        return jsonify({'error': 'File not found on disk'}), 404
+    
+    storage = get_storage()
+    
+    # Whole-file responses of compressible types are compressed for clients that accept it
+    encoding = None
+    if current_app.config['TRANSFER_COMPRESSION'] and 'Range' not in request.headers and \
+            file.file_size >= current_app.config['TRANSFER_COMPRESSION_MIN_SIZE'] and is_compressible(file.mime_type):
+        encoding = negotiate_encoding(request.accept_encodings)
+    
+    # Object stores serve the bytes themselves from a short-lived signed URL. A resumed
+    # download whose If-Range no longer matches gets the full body from us instead, and
+    # content compressed at rest is only handed out whole, to clients accepting its coding.
+    if request.method == 'GET' and current_app.config['STORAGE_PRESIGNED_DOWNLOADS'] and \
+            request.headers.get('If-Range', file.content_hash).strip('"') == file.content_hash and \
+            blob.encoding in (None, encoding):
+        url = storage.presigned_url(file.content_hash, file.original_filename, file.mime_type,
+                                    encoding=blob.encoding)
+        if url:
+            response = redirect(url)
+            response.vary.add('Accept-Encoding')
+            return response
     
     # Validate path to prevent directory traversal
     try:
-        file_path = validate_path(user_folder, file.file_path)
+        file_path = storage.local_path(file.content_hash)
     except ValueError:
         return jsonify({'error': 'Invalid file path'}), 400
     
-    if not os.path.exists(file_path):
+    if not (os.path.exists(file_path) if file_path is not None else storage.exists(file.content_hash)):
         return jsonify({'error': 'File not found on disk'}), 404
     
-    return send_file(
-        file_path,
-        as_attachment=True,
-        download_name=file.original_filename,
-        mimetype=file.mime_type
-    )
+    # Content is addressed by hash, so the hash is a strong ETag; each coding gets its own
+    etag = f'{file.content_hash}-{encoding}' if encoding else file.content_hash
+    
+    if encoding and encoding == blob.encoding:
+        # Stored in the negotiated coding already: send the stored bytes as they are
+        if file_path is not None:
+            response = send_blob_file(file, file_path, etag)
+        else:
+            response = send_blob_stream(file, wrap_file(request.environ, storage.open(
+                file.content_hash, size=blob.stored_size)), blob.stored_size, etag)
+        response.content_encoding = encoding
+    elif encoding:
+        response = send_blob_stream(file, compress_stream(open_blob(blob), encoding), None, etag)
+        response.content_encoding = encoding
+    elif blob.encoding or file_path is None:
+        # Decompressed or proxied from remote storage; readers only produce the requested range
+        response = send_blob_stream(file, wrap_file(request.environ, open_blob(blob)), file.file_size, etag)
+    else:
+        # Identity content on local disk: sent by the proxy when offloading, else through wsgi.file_wrapper
+        response = send_blob_offload(file, file_path, etag) or send_blob_file(file, file_path, etag)
+    
+    response.cache_control.private = True
+    response.vary.add('Accept-Encoding')
+    response.headers['Accept-Ranges'] = 'bytes'
+    return response
+
+def encode_list_cursor(kind, sort_value, item_id, sort, order):
+    """Build an opaque keyset cursor pointing just after an item"""
+    if isinstance(sort_value, datetime):
+        sort_value = sort_value.isoformat()
+    payload = json.dumps([kind, sort_value, item_id, sort, order]).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip('=')
+
+def decode_list_cursor(cursor, sort, order):
+    """Parse a keyset cursor; raises ValueError if malformed or for another sort"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        kind, sort_value, item_id, cursor_sort, cursor_order = json.loads(base64.urlsafe_b64decode(padded))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    
+    if kind not in ('folders', 'files') or (cursor_sort, cursor_order) != (sort, order):
+        raise ValueError("Cursor does not match the requested sort")
+    
+    if sort == 'date':
+        sort_value = datetime.fromisoformat(sort_value)
+    return kind, sort_value, item_id
+
+def keyset_page(query, column, id_column, order, after=None):
+    """Order a query by (column, id) and start it after the given (value, id)"""
+    if after is not None:
+        value, item_id = after
+        if order == 'desc':
+            query = query.filter(or_(column < value, and_(column == value, id_column < item_id)))
+        else:
+            query = query.filter(or_(column > value, and_(column == value, id_column > item_id)))
+    
+    if order == 'desc':
+        return query.order_by(column.desc(), id_column.desc())
+    return query.order_by(column.asc(), id_column.asc())
+
+def build_listing(user_id, folder_id, sort, order, position, limit, fields):
+    """Read one page of a folder listing from the database, starting after a decoded cursor `position`"""
+    file_column, folder_column = LIST_SORT_COLUMNS[sort]
+    
+    phase, after = 'folders', None
+    if position:
+        phase, sort_value, item_id = position
+        after = (sort_value, item_id)
+    
+    # Fetch one extra item to learn whether another page follows
+    remaining = limit + 1
+    folders = []
+    if phase == 'folders':
+        folder_query = Folder.query.filter_by(user_id=user_id, parent_folder_id=folder_id, deleted_at=None)
+        folders = keyset_page(folder_query, folder_column, Folder.id, order, after).limit(remaining).all()
+        remaining -= len(folders)
+        after = None
+    
+    files = []
+    if remaining > 0:
+        file_query = File.query.filter_by(user_id=user_id, folder_id=folder_id, deleted_at=None)
+        files = keyset_page(file_query, file_column, File.id, order, after).limit(remaining).all()
+    
+    next_cursor = None
+    if len(folders) + len(files) > limit:
+        if files:
+            files.pop()
+        else:
+            folders.pop()
+        
+        if files:
+            last = files[-1]
+            next_cursor = encode_list_cursor('files', getattr(last, file_column.key), last.id, sort, order)
+        else:
+            last = folders[-1]
+            next_cursor = encode_list_cursor('folders', getattr(last, folder_column.key), last.id, sort, order)
+    
+    # Every listed folder shares the same parent, so derive its path once
+    parent_path = None
+    if folders and folder_id:
+        parent = Folder.query.filter_by(id=folder_id, user_id=user_id, deleted_at=None).first()
+        parent_path = parent.get_path() if parent else None
+    
+    def serialize(item):
+        if isinstance(item, Folder):
+            data = item.to_dict(path=f'{parent_path}/{item.folder_name}' if parent_path else item.folder_name)
+        else:
+            data = item.to_dict()
+        if fields:
+            wanted = set(fields.split(',')) | {'id', 'type'}
+            data = {key: value for key, value in data.items() if key in wanted}
+        return data
+    
+    result = {
+        'files': [serialize(f) for f in files],
+        'folders': [serialize(f) for f in folders],
+        'current_folder_id': folder_id,
+        'next_cursor': next_cursor
+    }
+    
+    if not position:
+        result['total'] = {
+            'files': File.query.filter_by(user_id=user_id, folder_id=folder_id, deleted_at=None).count(),
+            'folders': Folder.query.filter_by(
+                user_id=user_id, parent_folder_id=folder_id, deleted_at=None
+            ).count()
+        }
+    
+    return result
 
 @file_manager_bp.route('/files/list', methods=['GET'])
 @jwt_required()
 def list_files():
-    """List all files and folders for the current user"""
-    user_id = get_jwt_identity()
-    folder_id = request.args.get('folder_id', type=int)
+    """
+    List files and folders in a folder, one page at a time
     
-    # Get files in the specified folder (or root if None)
-    files = File.query.filter_by(user_id=user_id, folder_id=folder_id).all()
-    folders = Folder.query.filter_by(user_id=user_id, parent_folder_id=folder_id).all()
+    Folders come first, then files, both ordered by `sort` (name, size or
+    date) and `order` (asc or desc). Pass the returned `next_cursor` as
+    `cursor` to fetch the next page. `fields` selects a subset of item
+    fields. The first page also carries a `total` count hint.
     
-    return jsonify({
-        'files': [f.to_dict() for f in files],
-        'folders': [f.to_dict() for f in folders],
-        'current_folder_id': folder_id
-    }), 200
+    Pages are cached until the user's next change, so repeated listings
+    don't touch the database, and carry an ETag for conditional requests.
+    """
+    user_id = get_jwt_identity()
+    folder_id = request.args.get('folder_id', type=int)
+    sort = request.args.get('sort', 'name')
+    order = request.args.get('order', 'asc')
+    cursor = request.args.get('cursor')
+    limit = request.args.get('limit', current_app.config['LIST_PAGE_SIZE'], type=int)
+    # Sparse field sets: only serialize the requested fields
+    fields = request.args.get('fields')
+    
+    if sort not in LIST_SORT_COLUMNS or order not in ('asc', 'desc'):
+        return jsonify({'error': 'Invalid sort'}), 400
+    
+    limit = max(1, min(limit, current_app.config['LIST_MAX_PAGE_SIZE']))
+    
+    position = None
+    if cursor:
+        try:
+            position = decode_list_cursor(cursor, sort, order)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+    
+    # The version is read before the database, so a page built from older data is filed under an older version
+    cache = get_cache()
+    cache_key = ':'.join(map(str, (user_id, listing_version(user_id), folder_id, sort, order, limit, cursor, fields)))
+    body = cache.get('listing', cache_key)
+    
+    if body is None:
+        result = build_listing(user_id, folder_id, sort, order, position, limit, fields)
+        body = current_app.json.dumps(result)
+        cache.set('listing', cache_key, body)
+    
+    response = current_app.response_class(body, mimetype=current_app.json.mimetype)
+    # Browsers revalidate every time and get a bodiless 304 while the listing is unchanged
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    response.add_etag()
+    return response.make_conditional(request)
 
 @file_manager_bp.route('/folders/create', methods=['POST'])
 @jwt_required()
@@ -155,39 +828,30 @@ def create_folder():
     
     # Validate parent folder if specified
     parent_folder = None
-    folder_path = folder_name
     
     if parent_folder_id:
-        parent_folder = Folder.query.filter_by(id=parent_folder_id, user_id=user_id).first()
+        parent_folder = Folder.query.filter_by(id=parent_folder_id, user_id=user_id, deleted_at=None).first()
         if not parent_folder:
             return jsonify({'error': 'Parent folder not found'}), 404
-        folder_path = os.path.join(parent_folder.folder_path, folder_name).replace('\\', '/')
     
     # Check if folder already exists
-    existing = Folder.query.filter_by(
-        user_id=user_id,
-        folder_name=folder_name,
-        parent_folder_id=parent_folder_id
-    ).first()
-    
-    if existing:
+    if folder_name_taken(user_id, parent_folder_id, folder_name):
         return jsonify({'error': 'Folder already exists'}), 400
     
-    # Create folder in filesystem
-    user_folder = get_user_base_path(user_id)
-    physical_path = os.path.join(user_folder, folder_path)
-    os.makedirs(physical_path, exist_ok=True)
-    
     # Create database entry
     new_folder = Folder(
         user_id=user_id,
         folder_name=folder_name,
-        parent_folder_id=parent_folder_id,
-        folder_path=folder_path
+        parent_folder_id=parent_folder_id
     )
     
     db.session.add(new_folder)
-    db.session.commit()
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Lost a race with a concurrent create of the same name
+        db.session.rollback()
+        return jsonify({'error': 'Folder already exists'}), 400
     
     return jsonify({
         'message': 'Folder created successfully',
@@ -201,23 +865,20 @@ def delete_file(file_id):
     user_id = get_jwt_identity()
     
     # Get file and verify ownership
-    file = File.query.filter_by(id=file_id, user_id=user_id).first()
+    file = File.query.filter_by(id=file_id, user_id=user_id, deleted_at=None).first()
     
     if not file:
         return jsonify({'error': 'File not found or access denied'}), 404
     
-    # Delete physical file
-    user_folder = get_user_base_path(user_id)
-    file_path = os.path.join(user_folder, file.file_path)
-    
-    if os.path.exists(file_path):
-        os.remove(file_path)
-    
-    # Delete database entry
-    db.session.delete(file)
+    # Hide the file now; the reaper removes the row and releases its content
+    job = soft_delete_file(file)
     db.session.commit()
+    reaper_wakeup.set()
     
-    return jsonify({'message': 'File deleted successfully'}), 200
+    return jsonify({
+        'message': 'File deleted successfully',
+        'job': job.to_dict()
+    }), 202
 
 @file_manager_bp.route('/folders/<int:folder_id>', methods=['DELETE'])
 @jwt_required()
@@ -226,24 +887,20 @@ def delete_folder(folder_id):
     user_id = get_jwt_identity()
     
     # Get folder and verify ownership
-    folder = Folder.query.filter_by(id=folder_id, user_id=user_id).first()
+    folder = Folder.query.filter_by(id=folder_id, user_id=user_id, deleted_at=None).first()
     
     if not folder:
         return jsonify({'error': 'Folder not found or access denied'}), 404
     
-    # Delete physical folder
-    user_folder = get_user_base_path(user_id)
-    folder_path = os.path.join(user_folder, folder.folder_path)
-    
-    if os.path.exists(folder_path):
-        import shutil
-        shutil.rmtree(folder_path)
-    
-    # Delete database entry (cascade will handle files and subfolders)
-    db.session.delete(folder)
+    # Hide the whole tree now; the reaper deletes rows and content in batches
+    job = soft_delete_folder(folder)
     db.session.commit()
+    reaper_wakeup.set()
     
-    return jsonify({'message': 'Folder deleted successfully'}), 200
+    return jsonify({
+        'message': 'Folder scheduled for deletion',
+        'job': job.to_dict()
+    }), 202
 
 @file_manager_bp.route('/files/<int:file_id>/rename', methods=['PUT'])
 @jwt_required()
@@ -256,28 +913,24 @@ def rename_file(file_id):
         return jsonify({'error': 'New name is required'}), 400
     
     # Get file and verify ownership
-    file = File.query.filter_by(id=file_id, user_id=user_id).first()
+    file = File.query.filter_by(id=file_id, user_id=user_id, deleted_at=None).first()
     
     if not file:
         return jsonify({'error': 'File not found or access denied'}), 404
     
     new_name = secure_filename_custom(data['new_name'])
+    new_name = allocate_display_name(user_id, file.folder_id, new_name, exclude_file_id=file.id)
     
-    # Rename physical file
-    user_folder = get_user_base_path(user_id)
-    old_path = os.path.join(user_folder, file.file_path)
-    new_path = os.path.join(os.path.dirname(old_path), new_name)
-    
-    if os.path.exists(old_path):
-        os.rename(old_path, new_path)
-    
-    # Update database entry
+    # Content is stored by hash, so only the database entry changes
     file.filename = new_name
     file.original_filename = data['new_name']
-    file.file_path = os.path.relpath(new_path, user_folder)
     file.mime_type = get_mime_type(new_name)
     
-    db.session.commit()
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({'error': 'File already exists'}), 409
     
     return jsonify({
         'message': 'File renamed successfully',
@@ -295,40 +948,78 @@ def rename_folder(folder_id):
         return jsonify({'error': 'New name is required'}), 400
     
     # Get folder and verify ownership
-    folder = Folder.query.filter_by(id=folder_id, user_id=user_id).first()
+    folder = Folder.query.filter_by(id=folder_id, user_id=user_id, deleted_at=None).first()
     
     if not folder:
         return jsonify({'error': 'Folder not found or access denied'}), 404
     
     new_name = data['new_name']
     
-    # Update folder path
-    old_path = folder.folder_path
-    if folder.parent_folder_id:
-        parent = Folder.query.get(folder.parent_folder_id)
-        new_folder_path = os.path.join(parent.folder_path, new_name).replace('\\', '/')
-    else:
-        new_folder_path = new_name
-    
-    # Rename physical folder
-    user_folder = get_user_base_path(user_id)
-    old_physical_path = os.path.join(user_folder, old_path)
-    new_physical_path = os.path.join(user_folder, new_folder_path)
-    
-    if os.path.exists(old_physical_path):
-        os.rename(old_physical_path, new_physical_path)
+    # Sibling folder names are unique
+    if folder_name_taken(user_id, folder.parent_folder_id, new_name, exclude_folder_id=folder.id):
+        return jsonify({'error': 'Folder already exists'}), 400
     
-    # Update database entry
+    # Paths are derived from the parent chain, so descendants need no update
     folder.folder_name = new_name
-    folder.folder_path = new_folder_path
     
-    db.session.commit()
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({'error': 'Folder already exists'}), 400
     
     return jsonify({
         'message': 'Folder renamed successfully',
         'folder': folder.to_dict()
     }), 200
 
+@file_manager_bp.route('/folders/<int:folder_id>/move', methods=['PUT'])
+@jwt_required()
+def move_folder(folder_id):
+    """Move a folder (with everything in it) under a different parent"""
+    user_id = get_jwt_identity()
+    data = request.get_json()
+    
+    if data is None:
+        return jsonify({'error': 'Target folder is required'}), 400
+    
+    new_parent_id = data.get('parent_folder_id')  # None for root
+    
+    # Get folder and verify ownership
+    folder = Folder.query.filter_by(id=folder_id, user_id=user_id, deleted_at=None).first()
+    
+    if not folder:
+        return jsonify({'error': 'Folder not found or access denied'}), 404
+    
+    # Validate the new parent; a folder can't be moved into its own subtree
+    if new_parent_id:
+        new_parent = Folder.query.filter_by(id=new_parent_id, user_id=user_id, deleted_at=None).first()
+        if not new_parent:
+            return jsonify({'error': 'Target folder not found'}), 404
+        if folder.id in new_parent.get_ancestor_ids():
+            return jsonify({'error': 'Cannot move a folder into itself'}), 400
+    
+    # Sibling folder names are unique
+    if folder_name_taken(user_id, new_parent_id, folder.folder_name, exclude_folder_id=folder.id):
+        return jsonify({'error': 'Folder already exists'}), 400
+    
+    # Only the moved folder's parent changes; its subtree (and its totals) follow implicitly
+    size, count = folder_totals(folder)
+    charge_folder(folder.parent_folder_id, -size, -count)
+    charge_folder(new_parent_id, size, count)
+    folder.parent_folder_id = new_parent_id
+    
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({'error': 'Folder already exists'}), 400
+    
+    return jsonify({
+        'message': 'Folder moved successfully',
+        'folder': folder.to_dict()
+    }), 200
+
 @file_manager_bp.route('/files/<int:file_id>/move', methods=['PUT'])
 @jwt_required()
 def move_file(file_id):
@@ -339,7 +1030,7 @@ def move_file(file_id):
     new_folder_id = data.get('folder_id')  # None for root
     
     # Get file and verify ownership
-    file = File.query.filter_by(id=file_id, user_id=user_id).first()
+    file = File.query.filter_by(id=file_id, user_id=user_id, deleted_at=None).first()
     
     if not file:
         return jsonify({'error': 'File not found or access denied'}), 404
@@ -347,32 +1038,80 @@ def move_file(file_id):
     # Validate new folder if specified
     new_folder = None
     if new_folder_id:
-        new_folder = Folder.query.filter_by(id=new_folder_id, user_id=user_id).first()
+        new_folder = Folder.query.filter_by(id=new_folder_id, user_id=user_id, deleted_at=None).first()
         if not new_folder:
             return jsonify({'error': 'Target folder not found'}), 404
     
-    # Move physical file
-    user_folder = get_user_base_path(user_id)
-    old_path = os.path.join(user_folder, file.file_path)
-    
-    if new_folder:
-        new_dir = os.path.join(user_folder, new_folder.folder_path.lstrip('/'))
-    else:
-        new_dir = user_folder
-    
-    os.makedirs(new_dir, exist_ok=True)
-    new_path = os.path.join(new_dir, file.filename)
-    
-    if os.path.exists(old_path):
-        os.rename(old_path, new_path)
-    
-    # Update database entry
+    # Content is stored by hash, so only the database entry changes
+    file.filename = allocate_display_name(user_id, new_folder_id, file.filename,
+                                          exclude_file_id=file.id)
+    charge_folder(file.folder_id, -file.file_size, -1)
+    charge_folder(new_folder_id, file.file_size, 1)
     file.folder_id = new_folder_id
-    file.file_path = os.path.relpath(new_path, user_folder)
     
-    db.session.commit()
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({'error': 'File already exists'}), 409
     
     return jsonify({
         'message': 'File moved successfully',
         'file': file.to_dict()
     }), 200
+
+@file_manager_bp.route('/files/<int:file_id>/copy', methods=['POST'])
+@jwt_required()
+def copy_file(file_id):
+    """Copy a file (shares stored content with the original)"""
+    user_id = get_jwt_identity()
+    data = request.get_json(silent=True) or {}
+    
+    # Get file and verify ownership
+    file = File.query.filter_by(id=file_id, user_id=user_id, deleted_at=None).first()
+    
+    if not file:
+        return jsonify({'error': 'File not found or access denied'}), 404
+    
+    # Copy into the same folder unless a target is given (None for root)
+    new_folder_id = data.get('folder_id', file.folder_id)
+    if new_folder_id:
+        new_folder = Folder.query.filter_by(id=new_folder_id, user_id=user_id, deleted_at=None).first()
+        if not new_folder:
+            return jsonify({'error': 'Target folder not found'}), 404
+    
+    if not file.content_hash:
+        return jsonify({'error': 'File not found on disk'}), 404
+    
+    # A copy counts against the quota even though its content is shared
+    try:
+        charge_user(user_id, file.file_size, 1)
+    except QuotaExceededError:
+        return jsonify({'error': 'Storage quota exceeded'}), 413
+    charge_folder(new_folder_id, file.file_size, 1)
+    
+    # The copy is just another reference to the same blob
+    add_blob_reference(file.content_hash)
+    
+    new_file = File(
+        user_id=user_id,
+        folder_id=new_folder_id,
+        filename=allocate_display_name(user_id, new_folder_id, file.filename),
+        original_filename=file.original_filename,
+        file_path=file.file_path,
+        content_hash=file.content_hash,
+        file_size=file.file_size,
+        mime_type=file.mime_type
+    )
+    
+    db.session.add(new_file)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({'error': 'File already exists'}), 409
+    
+    return jsonify({
+        'message': 'File copied successfully',
+        'file': new_file.to_dict()
+    }), 201
@@ -13,16 +13,66 @@ import json
 import argparse
 import requests
 import glob
+import time
+import hashlib
+import itertools
+import random
+import threading
+import gzip
+import tarfile
+from urllib.parse import unquote
+from urllib3.filepost import encode_multipart_formdata
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from typing import Optional, List
+from typing import Optional, List, Callable, Tuple
 from datetime import datetime
 
+try:
+    import zstandard
+except ImportError:  # Uploads fall back to gzip
+    zstandard = None
+
 # Configuration
 CONFIG_FILE = os.path.expanduser('~/.filevault_config.json')
 # Use Render URL if set, otherwise default to localhost
 DEFAULT_SERVER = os.environ.get('FILEVAULT_SERVER', 'https://nexussfm.onrender.com')
 VERSION = '1.0.0'
 
+# Files larger than this go through a resumable chunked upload session
+CHUNKED_UPLOAD_THRESHOLD = 8 * 1024 * 1024
+# Local record of unfinished chunked uploads, so an interrupted upload resumes
+UPLOAD_STATE_FILE = os.path.expanduser('~/.filevault_uploads.json')
+# How many times a failed chunk is retried before giving up
+UPLOAD_MAX_RETRIES = 5
+
+# Text-like file types compressed in transit when the server accepts compressed uploads
+COMPRESSIBLE_EXTENSIONS = {'txt', 'csv', 'json', 'xml', 'html', 'css', 'js', 'py', 'java',
+                           'cpp', 'c', 'h', 'md', 'sql'}
+# Upload bodies smaller than this are sent as they are
+UPLOAD_COMPRESSION_MIN_SIZE = 1024
+# A compressed body is only sent if it is at most this fraction of the original
+UPLOAD_COMPRESSION_MAX_RATIO = 0.9
+
+# Number of files transferred concurrently (override with --jobs)
+DEFAULT_JOBS = 4
+# How many times a whole file upload is retried after a transient failure
+FILE_MAX_RETRIES = 3
+
+# Number of entries fetched per /files/list page
+LIST_PAGE_SIZE = 500
+
+# Block size used when streaming downloads to disk
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+# Files smaller than this are never split into parallel range requests
+PARALLEL_DOWNLOAD_MIN_SIZE = 16 * 1024 * 1024
+
+# Per-directory record of pushed files, so unchanged files are not re-hashed or re-sent
+MANIFEST_FILE = '.filevault_manifest.json'
+# Maximum number of manifest entries sent to the server per sync request
+SYNC_BATCH_SIZE = 1000
+# Maximum number of operations sent per /batch request
+BATCH_SIZE = 1000
+
 # ANSI color codes for better terminal output
 class Colors:
     GREEN = '\033[92m'
@@ -54,6 +104,70 @@ def print_progress(message):
     print(f"{Colors.BLUE}⬆ {message}{Colors.RESET}")
 
 
+class TransferProgress:
+    """Thread-safe aggregate progress and throughput display for batch transfers"""
+    
+    # Minimum seconds between redraws of the progress line
+    REFRESH_INTERVAL = 0.2
+    
+    def __init__(self, total_files: int, total_bytes: int, verb: str = 'Uploading',
+                 symbol: str = '⬆'):
+        self.total_files = total_files
+        self.total_bytes = total_bytes
+        self.verb = verb
+        self.symbol = symbol
+        self.files_done = 0
+        self.bytes_done = 0
+        self.started = time.monotonic()
+        self._last_render = 0.0
+        self._lock = threading.Lock()
+    
+    def add_bytes(self, count: int) -> None:
+        """Record transferred bytes (negative to roll back a failed attempt)"""
+        with self._lock:
+            self.bytes_done += count
+            self._render()
+    
+    def file_done(self) -> None:
+        """Record a finished (or abandoned) file"""
+        with self._lock:
+            self.files_done += 1
+            self._render(force=True)
+    
+    def message(self, printer: Callable[[str], None], text: str) -> None:
+        """Print a message above the progress line"""
+        with self._lock:
+            print('\r\033[K', end='')
+            printer(text)
+            self._render(force=True)
+    
+    def rate(self) -> float:
+        """Average throughput so far in bytes per second"""
+        elapsed = time.monotonic() - self.started
+        return self.bytes_done / elapsed if elapsed > 0 else 0.0
+    
+    def finish(self) -> None:
+        """Draw the final state and end the progress line"""
+        with self._lock:
+            self._render(force=True)
+            print()
+    
+    def _render(self, force: bool = False) -> None:
+        now = time.monotonic()
+        if not force and now - self._last_render < self.REFRESH_INTERVAL:
+            return
+        self._last_render = now
+        
+        percent = self.bytes_done * 100 // self.total_bytes if self.total_bytes else 100
+        rate = self.rate()
+        remaining = (self.total_bytes - self.bytes_done) / rate if rate > 0 else 0
+        print(f"\r\033[K{Colors.BLUE}{self.symbol} {self.verb} [{self.files_done}/{self.total_files}] "
+              f"{percent:3d}%  {self.bytes_done / (1024 * 1024):.2f}/"
+              f"{self.total_bytes / (1024 * 1024):.2f} MB  "
+              f"{rate / (1024 * 1024):.2f} MB/s  ETA {remaining:.0f}s{Colors.RESET}",
+              end='', flush=True)
+
+
 class FileVaultError(Exception):
     """Base exception for FileVault errors"""
     pass
@@ -74,11 +188,22 @@ class FileNotFoundError(FileVaultError):
 class FileVaultClient:
     """Professional FileVault API client"""
     
-    def __init__(self, server_url: str = DEFAULT_SERVER):
+    def __init__(self, server_url: str = DEFAULT_SERVER, jobs: int = DEFAULT_JOBS):
         self.server_url = server_url.rstrip('/')
         self.api_url = f"{self.server_url}/api"
         self.token: Optional[str] = None
         self.user_info: Optional[dict] = None
+        self.jobs = max(1, jobs)
+        
+        # Keep-alive connection pool shared by all requests and worker threads
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=self.jobs)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._state_lock = threading.Lock()
+        # Request body coding the server accepts (learnt from its Accept-Encoding header)
+        self.upload_encoding: Optional[str] = None
+        
         self.load_config()
     
     def load_config(self) -> None:
@@ -125,7 +250,10 @@ class FileVaultClient:
         url = f"{self.api_url}{endpoint}"
         
         try:
-            response = requests.request(method, url, timeout=30, **kwargs)
+            response = self.session.request(method, url, timeout=30, **kwargs)
+            accepted = response.headers.get('Accept-Encoding')
+            if accepted is not None:
+                self.upload_encoding = self._pick_upload_encoding(accepted)
             return response
         except requests.exceptions.ConnectionError:
             raise NetworkError(f"Could not connect to server at {self.server_url}")
@@ -134,6 +262,42 @@ class FileVaultClient:
         except requests.exceptions.RequestException as e:
             raise NetworkError(f"Network error: {e}")
     
+    @staticmethod
+    def _pick_upload_encoding(accepted: str) -> Optional[str]:
+        """Choose the best request body coding among those a server accepts"""
+        codings = {coding.split(';')[0].strip().lower() for coding in accepted.split(',')}
+        if 'zstd' in codings and zstandard:
+            return 'zstd'
+        return 'gzip' if 'gzip' in codings else None
+    
+    def _compress_body(self, body: bytes, filename: str) -> Tuple[bytes, Optional[str]]:
+        """Compress an upload body of a text-like file if the server accepts it and it pays off"""
+        encoding = self.upload_encoding
+        extension = Path(filename).suffix.lower().lstrip('.')
+        if not encoding or len(body) < UPLOAD_COMPRESSION_MIN_SIZE or extension not in COMPRESSIBLE_EXTENSIONS:
+            return body, None
+        
+        if encoding == 'zstd':
+            compressed = zstandard.ZstdCompressor().compress(body)
+        else:
+            compressed = gzip.compress(body, compresslevel=6)
+        if len(compressed) > len(body) * UPLOAD_COMPRESSION_MAX_RATIO:
+            return body, None
+        return compressed, encoding
+    
+    def _send_upload(self, method: str, endpoint: str, body: bytes, filename: str,
+                     headers: dict, **kwargs) -> requests.Response:
+        """Send an upload body, compressed (Content-Encoding) when worthwhile"""
+        compressed, encoding = self._compress_body(body, filename)
+        if encoding:
+            response = self._make_request(method, endpoint, data=compressed,
+                                          headers={**headers, 'Content-Encoding': encoding}, **kwargs)
+            if response.status_code != 415:
+                return response
+            # The server no longer accepts this coding; send it as is
+            self.upload_encoding = None
+        return self._make_request(method, endpoint, data=body, headers=headers, **kwargs)
+    
     def login(self, email: str, password: str) -> bool:
         """Login and get JWT token"""
         data = {'email': email, 'password': password}
@@ -166,8 +330,20 @@ class FileVaultClient:
             return False
     
     def upload_file(self, file_path: str, folder_id: Optional[int] = None, 
-                    show_progress: bool = True) -> bool:
-        """Upload a single file to the server"""
+                    show_progress: bool = True, remote_path: Optional[str] = None,
+                    overwrite: bool = False,
+                    on_bytes: Optional[Callable[[int], None]] = None,
+                    extract: bool = False) -> bool:
+        """
+        Upload a single file to the server
+        
+        Args:
+            remote_path: Optional folder path below folder_id (e.g. 'src/utils'),
+                created on the server as needed
+            overwrite: Replace a same-named remote file instead of adding a copy
+            on_bytes: Optional callback receiving the number of bytes sent
+            extract: Unpack a zip archive into folders and files on the server
+        """
         if not self.token:
             raise AuthenticationError("Not logged in. Please login first.")
         
@@ -186,41 +362,200 @@ class FileVaultClient:
             if show_progress:
                 print_progress(f"Uploading {file_path.name} ({size_mb:.2f} MB)...")
             
-            with open(file_path, 'rb') as f:
-                files = {'file': (file_path.name, f)}
-                data = {}
-                
-                if folder_id:
-                    data['folder_id'] = folder_id
-                
-                response = self._make_request(
-                    'POST',
-                    '/files/upload',
-                    headers=self.get_headers(),
-                    files=files,
-                    data=data
-                )
-                
-                if response.status_code == 201:
-                    result = response.json()
-                    file_info = result.get('file', {})
-                    
-                    if show_progress:
-                        print_success(f"Uploaded {file_path.name}")
-                        print_info(f"  File ID: {file_info.get('id')}")
-                    
-                    return True
-                else:
-                    error = response.json().get('error', 'Upload failed')
-                    raise FileVaultError(error)
+            if file_size > CHUNKED_UPLOAD_THRESHOLD:
+                file_info = self._upload_chunked(file_path, folder_id, show_progress,
+                                                 remote_path, overwrite, on_bytes, extract)
+            else:
+                file_info = self._upload_multipart(file_path, folder_id, remote_path, overwrite, extract)
+                if on_bytes:
+                    on_bytes(file_size)
+            
+            if show_progress and extract:
+                print_success(f"Extracted {file_path.name}")
+                print_info(f"  Files: {file_info.get('files')} new, {file_info.get('updated')} updated")
+                print_info(f"  Folders created: {file_info.get('folders')}")
+                for skipped in file_info.get('skipped', []):
+                    print_warning(f"  Skipped {skipped['path']}: {skipped['error']}")
+            elif show_progress:
+                print_success(f"Uploaded {file_path.name}")
+                print_info(f"  File ID: {file_info.get('id')}")
+            
+            return True
                     
         except Exception as e:
             if show_progress:
                 print_error(f"Failed to upload {file_path.name}: {e}")
             raise
     
+    def _upload_multipart(self, file_path: Path, folder_id: Optional[int] = None,
+                          remote_path: Optional[str] = None, overwrite: bool = False,
+                          extract: bool = False) -> dict:
+        """Upload a small file in a single multipart request"""
+        with open(file_path, 'rb') as f:
+            fields = {'file': (file_path.name, f.read())}
+        
+        if folder_id:
+            fields['folder_id'] = str(folder_id)
+        if remote_path:
+            fields['path'] = remote_path
+        if overwrite:
+            fields['overwrite'] = 'true'
+        if extract:
+            fields['extract'] = 'true'
+        
+        body, content_type = encode_multipart_formdata(fields)
+        response = self._send_upload(
+            'POST',
+            '/files/upload',
+            body,
+            file_path.name,
+            {**self.get_headers(), 'Content-Type': content_type}
+        )
+        
+        if response.status_code == 201:
+            return response.json().get('extracted' if extract else 'file', {})
+        if response.status_code >= 500:
+            raise NetworkError(f"Server error {response.status_code}")
+        
+        error = response.json().get('error', 'Upload failed')
+        raise FileVaultError(error)
+    
+    def _load_upload_state(self) -> dict:
+        """Load the record of unfinished chunked uploads"""
+        if os.path.exists(UPLOAD_STATE_FILE):
+            try:
+                with open(UPLOAD_STATE_FILE, 'r') as f:
+                    return json.load(f)
+            except Exception:
+                pass
+        return {}
+    
+    def _save_upload_state(self, state: dict) -> None:
+        """Save the record of unfinished chunked uploads"""
+        try:
+            os.makedirs(os.path.dirname(UPLOAD_STATE_FILE), exist_ok=True)
+            with open(UPLOAD_STATE_FILE, 'w') as f:
+                json.dump(state, f, indent=2)
+        except Exception as e:
+            print_warning(f"Could not save upload state: {e}")
+    
+    def _upload_state_key(self, file_path: Path, folder_id: Optional[int],
+                          remote_path: Optional[str] = None) -> str:
+        """Identify a local file version and destination for resuming"""
+        stat = file_path.stat()
+        return (f"{self.server_url}|{file_path.resolve()}|{stat.st_size}|{stat.st_mtime_ns}|"
+                f"{folder_id or ''}|{remote_path or ''}")
+    
+    def _open_upload_session(self, file_path: Path, folder_id: Optional[int],
+                             state_key: str, remote_path: Optional[str] = None,
+                             overwrite: bool = False, extract: bool = False) -> dict:
+        """Resume a previous upload session for this file, or create a new one"""
+        state = self._load_upload_state()
+        upload_id = state.get(state_key)
+        
+        if upload_id:
+            response = self._make_request('GET', f'/uploads/{upload_id}',
+                                          headers=self.get_headers())
+            if response.status_code == 200:
+                return response.json()['upload']
+        
+        data = {'filename': file_path.name, 'size': file_path.stat().st_size,
+                'overwrite': overwrite, 'extract': extract}
+        if folder_id:
+            data['folder_id'] = folder_id
+        if remote_path:
+            data['path'] = remote_path
+        
+        response = self._make_request('POST', '/uploads', headers=self.get_headers(), json=data)
+        if response.status_code != 201:
+            error = response.json().get('error', 'Could not start upload')
+            raise FileVaultError(error)
+        
+        upload = response.json()['upload']
+        with self._state_lock:
+            state = self._load_upload_state()
+            state[state_key] = upload['upload_id']
+            self._save_upload_state(state)
+        return upload
+    
+    def _upload_chunked(self, file_path: Path, folder_id: Optional[int] = None,
+                        show_progress: bool = True, remote_path: Optional[str] = None,
+                        overwrite: bool = False,
+                        on_bytes: Optional[Callable[[int], None]] = None,
+                        extract: bool = False) -> dict:
+        """Upload a large file in resumable chunks with bounded memory"""
+        state_key = self._upload_state_key(file_path, folder_id, remote_path)
+        if extract:
+            state_key += '|extract'
+        upload = self._open_upload_session(file_path, folder_id, state_key,
+                                           remote_path, overwrite, extract)
+        upload_id = upload['upload_id']
+        chunk_size = upload.get('chunk_size') or CHUNKED_UPLOAD_THRESHOLD
+        total = upload['size']
+        offset = upload['offset']
+        retries = 0
+        
+        if offset and show_progress:
+            print_info(f"  Resuming from {offset / (1024 * 1024):.2f} MB")
+        if offset and on_bytes:
+            on_bytes(offset)
+        
+        with open(file_path, 'rb') as f:
+            while offset < total:
+                f.seek(offset)
+                chunk = f.read(chunk_size)
+                
+                try:
+                    response = self._send_upload(
+                        'PUT',
+                        f'/uploads/{upload_id}',
+                        chunk,
+                        file_path.name,
+                        {**self.get_headers(), 'Content-Type': 'application/octet-stream'},
+                        params={'offset': offset}
+                    )
+                except NetworkError:
+                    response = None
+                
+                if response is not None and response.status_code in (200, 409):
+                    # 409 means the server is elsewhere; continue from its offset
+                    new_offset = response.json()['upload']['offset']
+                    if on_bytes:
+                        on_bytes(new_offset - offset)
+                    offset = new_offset
+                    retries = 0
+                elif response is not None and response.status_code < 500:
+                    error = response.json().get('error', 'Chunk upload failed')
+                    raise FileVaultError(error)
+                else:
+                    retries += 1
+                    if retries > UPLOAD_MAX_RETRIES:
+                        raise NetworkError("Upload interrupted; run the command again to resume")
+                    time.sleep(min(2 ** retries, 30))
+                    continue
+                
+                if show_progress:
+                    percent = offset * 100 // total if total else 100
+                    print(f"\r  {percent:3d}% ({offset / (1024 * 1024):.2f} MB)", end='', flush=True)
+        
+        if show_progress:
+            print()
+        
+        response = self._make_request('POST', f'/uploads/{upload_id}/complete',
+                                      headers=self.get_headers())
+        if response.status_code != 201:
+            error = response.json().get('error', 'Could not complete upload')
+            raise FileVaultError(error)
+        
+        with self._state_lock:
+            state = self._load_upload_state()
+            state.pop(state_key, None)
+            self._save_upload_state(state)
+        
+        return response.json().get('extracted' if extract else 'file', {})
+    
     def upload_files(self, patterns: List[str], folder_id: Optional[int] = None,
-                     recursive: bool = False) -> dict:
+                     recursive: bool = False, extract: bool = False) -> dict:
         """
         Upload multiple files using wildcards
         
@@ -228,6 +563,7 @@ class FileVaultClient:
             patterns: List of file patterns (supports wildcards like *.pdf, *.jpg)
             folder_id: Optional folder ID to upload to
             recursive: If True, search directories recursively
+            extract: Unpack each (zip) file on the server instead of storing it
         
         Returns:
             dict with 'success', 'failed', and 'skipped' counts
@@ -257,19 +593,18 @@ class FileVaultClient:
         
         print_info(f"Found {len(all_files)} file(s) to upload\n")
         
-        results = {'success': 0, 'failed': 0, 'skipped': 0}
+        if extract:
+            # Each archive is one request; they are unpacked one after another
+            failed = []
+            for file_path in sorted(all_files):
+                try:
+                    self.upload_file(file_path, folder_id, extract=True)
+                except Exception:
+                    failed.append(file_path)
+            return {'success': len(all_files) - len(failed), 'failed': len(failed), 'skipped': 0}
         
-        for i, file_path in enumerate(all_files, 1):
-            try:
-                print(f"[{i}/{len(all_files)}] ", end='')
-                self.upload_file(file_path, folder_id, show_progress=True)
-                results['success'] += 1
-            except FileVaultError as e:
-                print_error(f"Error: {e}")
-                results['failed'] += 1
-            except Exception as e:
-                print_error(f"Unexpected error: {e}")
-                results['failed'] += 1
+        failed = self.transfer_files([(file_path, folder_id, None, False) for file_path in all_files])
+        results = {'success': len(all_files) - len(failed), 'failed': len(failed), 'skipped': 0}
         
         # Print summary
         print(f"\n{'='*60}")
@@ -280,6 +615,63 @@ class FileVaultClient:
         
         return results
     
+    def _upload_with_retry(self, task: Tuple, progress: TransferProgress) -> None:
+        """Upload one file, retrying transient failures with exponential backoff"""
+        file_path, folder_id, remote_path, overwrite = task
+        
+        for attempt in range(FILE_MAX_RETRIES + 1):
+            sent = [0]
+            
+            def on_bytes(count):
+                sent[0] += count
+                progress.add_bytes(count)
+            
+            try:
+                self.upload_file(file_path, folder_id, show_progress=False,
+                                 remote_path=remote_path, overwrite=overwrite, on_bytes=on_bytes)
+                return
+            except NetworkError as e:
+                progress.add_bytes(-sent[0])
+                if attempt == FILE_MAX_RETRIES:
+                    raise
+                delay = min(2 ** attempt, 30) + random.uniform(0, 0.5)
+                progress.message(print_warning, f"{Path(file_path).name}: {e}; retrying in {delay:.1f}s")
+                time.sleep(delay)
+    
+    def transfer_files(self, tasks: List[Tuple]) -> List[Tuple]:
+        """
+        Upload many files concurrently over the pooled connection
+        
+        Args:
+            tasks: (local_path, folder_id, remote_path, overwrite) tuples
+        
+        Returns:
+            The tasks that failed after all retries
+        """
+        total_bytes = sum(Path(task[0]).stat().st_size for task in tasks)
+        progress = TransferProgress(len(tasks), total_bytes)
+        failed = []
+        
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            futures = {executor.submit(self._upload_with_retry, task, progress): task
+                       for task in tasks}
+            
+            for future in as_completed(futures):
+                task = futures[future]
+                try:
+                    future.result()
+                except Exception as e:
+                    progress.message(print_error, f"Failed to upload {task[0]}: {e}")
+                    failed.append(task)
+                progress.file_done()
+        
+        progress.finish()
+        rate_mb = progress.rate() / (1024 * 1024)
+        print_info(f"  {len(tasks) - len(failed)} file(s) in "
+                   f"{time.monotonic() - progress.started:.1f}s ({rate_mb:.2f} MB/s, {self.jobs} jobs)")
+        
+        return failed
+    
     def upload_directory(self, dir_path: str, folder_id: Optional[int] = None,
                         recursive: bool = True) -> dict:
         """Upload all files in a directory"""
@@ -303,93 +695,392 @@ class FileVaultClient:
         
         return self.upload_files([str(f) for f in files], folder_id)
     
-    def list_files(self, folder_id: Optional[int] = None) -> bool:
-        """List files and folders"""
+    def iter_listing(self, folder_id: Optional[int] = None, sort: str = 'name',
+                     order: str = 'asc', fields: Optional[str] = None,
+                     page_size: int = LIST_PAGE_SIZE):
+        """Yield listing pages from the server one at a time (folders first, then files)"""
+        cursor = None
+        
+        while True:
+            params = {'sort': sort, 'order': order, 'limit': page_size}
+            if folder_id:
+                params['folder_id'] = folder_id
+            if fields:
+                params['fields'] = fields
+            if cursor:
+                params['cursor'] = cursor
+            
+            response = self._make_request('GET', '/files/list', headers=self.get_headers(),
+                                          params=params)
+            if response.status_code != 200:
+                error = response.json().get('error', 'Failed to list files')
+                raise FileVaultError(error)
+            
+            page = response.json()
+            yield page
+            
+            cursor = page.get('next_cursor')
+            if not cursor:
+                break
+    
+    def list_files(self, folder_id: Optional[int] = None, sort: str = 'name',
+                   order: str = 'asc', limit: Optional[int] = None) -> bool:
+        """List files and folders, fetching pages lazily as they are printed"""
         if not self.token:
             raise AuthenticationError("Not logged in. Please login first.")
         
         try:
-            endpoint = '/files/list'
-            if folder_id:
-                endpoint += f"?folder_id={folder_id}"
+            shown = {'folders': 0, 'files': 0}
+            total = None
             
-            response = self._make_request('GET', endpoint, headers=self.get_headers())
+            pages = self.iter_listing(folder_id, sort, order, fields='name,size')
             
-            if response.status_code == 200:
-                result = response.json()
-                folders = result.get('folders', [])
-                files = result.get('files', [])
-                
-                print(f"\n{Colors.BOLD}📁 Folders:{Colors.RESET}")
-                if folders:
-                    for folder in folders:
-                        print(f"  {Colors.YELLOW}[DIR]{Colors.RESET}  {folder['name']} (ID: {folder['id']})")
+            def items():
+                nonlocal total
+                for page in pages:
+                    if total is None:
+                        total = page.get('total')
+                    for folder in page.get('folders', []):
+                        yield 'folders', folder
+                    for file in page.get('files', []):
+                        yield 'files', file
+            
+            print(f"\n{Colors.BOLD}📁 Folders:{Colors.RESET}")
+            for kind, item in itertools.islice(items(), limit):
+                if kind == 'folders':
+                    print(f"  {Colors.YELLOW}[DIR]{Colors.RESET}  {item['name']} (ID: {item['id']})")
                 else:
+                    # Folders always come before files, so close the folder section once
+                    if not shown['files']:
+                        if not shown['folders']:
+                            print("  (none)")
+                        print(f"\n{Colors.BOLD}📄 Files:{Colors.RESET}")
+                    size_mb = item['size'] / (1024 * 1024)
+                    print(f"  {Colors.GREEN}[FILE]{Colors.RESET} {item['name']:<40} {size_mb:>8.2f} MB  (ID: {item['id']})")
+                shown[kind] += 1
+            
+            if not shown['files']:
+                if not shown['folders']:
                     print("  (none)")
-                
                 print(f"\n{Colors.BOLD}📄 Files:{Colors.RESET}")
-                if files:
-                    for file in files:
-                        size_mb = file['size'] / (1024 * 1024)
-                        print(f"  {Colors.GREEN}[FILE]{Colors.RESET} {file['name']:<40} {size_mb:>8.2f} MB  (ID: {file['id']})")
-                else:
-                    print("  (none)")
-                
-                print()  # Empty line
-                return True
-            else:
-                error = response.json().get('error', 'Failed to list files')
-                raise FileVaultError(error)
+                print("  (none)")
+            
+            if total and (shown['folders'] < total['folders'] or shown['files'] < total['files']):
+                print_info(f"Showing {shown['folders']} of {total['folders']} folders and "
+                           f"{shown['files']} of {total['files']} files")
+            
+            print()  # Empty line
+            return True
                 
         except Exception as e:
             print_error(f"Error listing files: {e}")
             return False
     
-    def download_file(self, file_id: int, output_path: Optional[str] = None) -> bool:
-        """Download a file from the server"""
+    def find(self, query: str = '', filters: Optional[dict] = None, folders: bool = False,
+             limit: Optional[int] = None) -> bool:
+        """Search the whole tree by name and metadata (newest first)"""
         if not self.token:
             raise AuthenticationError("Not logged in. Please login first.")
         
         try:
-            print_progress(f"Downloading file ID {file_id}...")
+            params = {key: value for key, value in (filters or {}).items() if value is not None}
+            params.update(q=query, type='folder' if folders else 'file',
+                          limit=min(limit or LIST_PAGE_SIZE, LIST_PAGE_SIZE))
+            shown = 0
             
-            response = self._make_request(
-                'GET',
-                f'/files/download/{file_id}',
-                headers=self.get_headers()
-            )
-            
-            if response.status_code == 200:
-                # Get filename from Content-Disposition header
-                content_disposition = response.headers.get('Content-Disposition', '')
-                filename = 'download'
-                
-                if 'filename=' in content_disposition:
-                    filename = content_disposition.split('filename=')[1].strip('"')
-                
-                # Use provided output path or default filename
-                save_path = output_path if output_path else filename
+            while True:
+                response = self._make_request('GET', '/search', headers=self.get_headers(), params=params)
+                if response.status_code != 200:
+                    error = response.json().get('error', 'Search failed')
+                    raise FileVaultError(error)
                 
-                with open(save_path, 'wb') as f:
-                    f.write(response.content)
+                page = response.json()
+                for item in page.get('results', []):
+                    if limit and shown >= limit:
+                        break
+                    if folders:
+                        print(f"  {Colors.YELLOW}[DIR]{Colors.RESET}  {item['path']} (ID: {item['id']})")
+                    else:
+                        size_mb = item['size'] / (1024 * 1024)
+                        print(f"  {Colors.GREEN}[FILE]{Colors.RESET} {item['path']:<60} {size_mb:>8.2f} MB  (ID: {item['id']})")
+                    shown += 1
                 
-                size_mb = len(response.content) / (1024 * 1024)
-                print_success("Download complete!")
-                print_info(f"  Saved to: {save_path}")
-                print_info(f"  Size: {size_mb:.2f} MB")
-                return True
+                params['cursor'] = page.get('next_cursor')
+                if not params['cursor'] or (limit and shown >= limit):
+                    break
+            
+            if not shown:
+                print_info("No matches")
+            return True
+        
+        except Exception as e:
+            print_error(f"Error searching: {e}")
+            return False
+    
+    @staticmethod
+    def _filename_from_disposition(content_disposition: str) -> Optional[str]:
+        """Extract the filename from a Content-Disposition header"""
+        for part in content_disposition.split(';'):
+            key, _, value = part.strip().partition('=')
+            if key.lower() == 'filename*' and "''" in value:
+                return unquote(value.split("''", 1)[1])
+        for part in content_disposition.split(';'):
+            key, _, value = part.strip().partition('=')
+            if key.lower() == 'filename':
+                return value.strip('"')
+        return None
+    
+    @staticmethod
+    def _load_json(path: str) -> dict:
+        """Load a small JSON sidecar file, or {} if missing/corrupt"""
+        try:
+            with open(path, 'r') as f:
+                return json.load(f)
+        except Exception:
+            return {}
+    
+    def _get_download(self, endpoint: str, headers: dict) -> requests.Response:
+        """
+        GET a download, following a redirect to object storage by hand
+        
+        The server has already checked If-Range against the file's ETag, so the
+        presigned URL is fetched with just the Range header (it carries its own
+        authorization, and the store's ETags differ from ours).
+        """
+        response = self._make_request('GET', endpoint, headers=headers, stream=True,
+                                      allow_redirects=False)
+        if not response.is_redirect:
+            return response
+        
+        location = response.headers['Location']
+        response.close()
+        range_headers = {'Range': headers['Range']} if 'Range' in headers else {}
+        try:
+            return self.session.get(location, headers=range_headers, stream=True, timeout=30)
+        except requests.exceptions.RequestException as e:
+            raise NetworkError(f"Network error: {e}")
+    
+    def _download_stream(self, endpoint: str, part_path: str, etag: Optional[str],
+                         size: int, progress: TransferProgress) -> None:
+        """Stream a file into part_path, resuming from whatever is already there"""
+        for attempt in range(FILE_MAX_RETRIES + 1):
+            offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+            if offset >= size:
+                return
+            
+            headers = self.get_headers()
+            if offset:
+                headers['Range'] = f'bytes={offset}-'
+                if etag:
+                    headers['If-Range'] = etag
+            
+            try:
+                with self._get_download(endpoint, headers) as response:
+                    if response.status_code == 200:
+                        # Full body: the server ignored or rejected the resume
+                        offset = 0
+                    elif response.status_code != 206:
+                        raise FileVaultError(f"Download failed (HTTP {response.status_code})")
+                    
+                    progress.bytes_done = offset
+                    with open(part_path, 'ab' if offset else 'wb') as f:
+                        for block in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+                            f.write(block)
+                            progress.add_bytes(len(block))
+                return
+            except (NetworkError, requests.exceptions.RequestException) as e:
+                if attempt == FILE_MAX_RETRIES:
+                    raise NetworkError(f"Download interrupted; run the command again to resume ({e})")
+                progress.message(print_warning, f"{e}; resuming in {2 ** attempt}s")
+                time.sleep(min(2 ** attempt, 30))
+    
+    def _download_segment(self, endpoint: str, part_path: str, etag: Optional[str],
+                          start: int, end: int, progress: TransferProgress) -> None:
+        """Fetch bytes start..end (inclusive) into their place in part_path"""
+        for attempt in range(FILE_MAX_RETRIES + 1):
+            headers = {**self.get_headers(), 'Range': f'bytes={start}-{end}'}
+            if etag:
+                headers['If-Range'] = etag
+            received = 0
+            
+            try:
+                with self._get_download(endpoint, headers) as response:
+                    if response.status_code != 206:
+                        raise FileVaultError(
+                            f"Server did not return the requested range (HTTP {response.status_code})"
+                        )
+                    with open(part_path, 'r+b') as f:
+                        f.seek(start)
+                        for block in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+                            f.write(block)
+                            received += len(block)
+                            progress.add_bytes(len(block))
+                if received != end - start + 1:
+                    raise NetworkError("Incomplete range response")
+                return
+            except (NetworkError, requests.exceptions.RequestException) as e:
+                progress.add_bytes(-received)
+                if attempt == FILE_MAX_RETRIES:
+                    raise NetworkError(f"Download interrupted; run the command again to resume ({e})")
+                time.sleep(min(2 ** attempt, 30))
+    
+    def _download_segments(self, endpoint: str, part_path: str, meta_path: str, meta: dict,
+                           parallel: int, progress: TransferProgress) -> None:
+        """Fetch a file over parallel range requests; finished segments survive restarts"""
+        size = meta['size']
+        segment_size = meta.setdefault('segment_size', -(-size // parallel))
+        done = set(meta.setdefault('done', []))
+        segments = [start for start in range(0, size, segment_size) if start not in done]
+        lock = threading.Lock()
+        
+        if not os.path.exists(part_path):
+            with open(part_path, 'wb') as f:
+                f.truncate(size)
+        progress.bytes_done = sum(min(segment_size, size - start) for start in done)
+        
+        def fetch(start):
+            end = min(start + segment_size, size) - 1
+            self._download_segment(endpoint, part_path, meta.get('etag'), start, end, progress)
+            with lock:
+                meta['done'].append(start)
+                with open(meta_path, 'w') as f:
+                    json.dump(meta, f)
+        
+        with ThreadPoolExecutor(max_workers=parallel) as executor:
+            for future in as_completed([executor.submit(fetch, start) for start in segments]):
+                future.result()
+    
+    def download_file(self, file_id: int, output_path: Optional[str] = None,
+                      parallel: int = 1) -> bool:
+        """
+        Download a file from the server
+        
+        The body is streamed to '<output>.part' in fixed-size blocks, so memory
+        use does not grow with file size. An interrupted download resumes from
+        the partial file (validated against the file's ETag). With parallel > 1,
+        large files are fetched over that many concurrent range requests.
+        """
+        if not self.token:
+            raise AuthenticationError("Not logged in. Please login first.")
+        
+        endpoint = f'/files/download/{file_id}'
+        
+        try:
+            print_progress(f"Downloading file ID {file_id}...")
+            
+            # Ask for the plain representation: its Content-Length is the file size
+            head = self._make_request('HEAD', endpoint,
+                                      headers={**self.get_headers(), 'Accept-Encoding': 'identity'})
+            if head.status_code != 200:
+                raise FileVaultError(f"Download failed (HTTP {head.status_code})")
+            
+            filename = self._filename_from_disposition(head.headers.get('Content-Disposition', ''))
+            size = int(head.headers.get('Content-Length', 0))
+            etag = head.headers.get('ETag')
+            
+            # Use provided output path or default filename
+            save_path = output_path if output_path else (filename or 'download')
+            part_path = save_path + '.part'
+            meta_path = part_path + '.json'
+            
+            # Only resume a partial file of the same content and layout
+            segmented = (parallel > 1 and size >= PARALLEL_DOWNLOAD_MIN_SIZE
+                         and head.headers.get('Accept-Ranges') == 'bytes')
+            meta = self._load_json(meta_path)
+            if (meta.get('etag') != etag or meta.get('size') != size
+                    or bool(meta.get('segment_size')) != segmented):
+                if os.path.exists(part_path):
+                    os.remove(part_path)
+                meta = {'etag': etag, 'size': size}
+            with open(meta_path, 'w') as f:
+                json.dump(meta, f)
+            
+            progress = TransferProgress(1, size, verb='Downloading', symbol='⬇')
+            if segmented:
+                self._download_segments(endpoint, part_path, meta_path, meta, parallel, progress)
             else:
-                error_text = response.text
-                try:
-                    error = response.json().get('error', 'Download failed')
-                except:
-                    error = 'Download failed'
-                raise FileVaultError(error)
+                self._download_stream(endpoint, part_path, etag, size, progress)
+            progress.file_done()
+            progress.finish()
+            
+            os.replace(part_path, save_path)
+            os.remove(meta_path)
+            
+            size_mb = size / (1024 * 1024)
+            print_success("Download complete!")
+            print_info(f"  Saved to: {save_path}")
+            print_info(f"  Size: {size_mb:.2f} MB")
+            return True
                 
         except Exception as e:
             print_error(f"Error downloading file: {e}")
             return False
     
+    @staticmethod
+    def _safe_member(member: tarfile.TarInfo, dest: str) -> Optional[tarfile.TarInfo]:
+        """Skip archive members that are not plain files/folders or would land outside dest"""
+        if not (member.isfile() or member.isdir()):
+            return None
+        root = os.path.realpath(dest)
+        target = os.path.realpath(os.path.join(root, member.name))
+        if os.path.commonpath([root, target]) != root:
+            return None
+        return member
+    
+    def pull(self, folder_id: Optional[int] = None, destination: str = '.') -> bool:
+        """
+        Download a remote folder (the whole tree without folder_id) into a directory
+        
+        The server streams the folder as one tar.gz, which is unpacked as it
+        arrives, so nothing but the extracted files is written to disk.
+        """
+        if not self.token:
+            raise AuthenticationError("Not logged in. Please login first.")
+        
+        endpoint = f'/folders/{folder_id}/archive' if folder_id else '/archive'
+        
+        try:
+            print_progress(f"Pulling {'folder ID ' + str(folder_id) if folder_id else 'all files'}...")
+            
+            with self._make_request('GET', endpoint, headers=self.get_headers(),
+                                    params={'format': 'tar'}, stream=True) as response:
+                if response.status_code != 200:
+                    error = response.json().get('error') if response.headers.get(
+                        'Content-Type', '').startswith('application/json') else None
+                    raise FileVaultError(error or f"Pull failed (HTTP {response.status_code})")
+                
+                progress = TransferProgress(int(response.headers.get('X-Archive-Files', 0)),
+                                            int(response.headers.get('X-Archive-Size', 0)),
+                                            verb='Pulling', symbol='⬇')
+                os.makedirs(destination, exist_ok=True)
+                
+                # 'r|gz' reads the archive strictly front to back, straight off the socket
+                with tarfile.open(fileobj=response.raw, mode='r|gz') as archive:
+                    for member in archive:
+                        member = self._safe_member(member, destination)
+                        if member is None:
+                            continue
+                        if hasattr(tarfile, 'data_filter'):
+                            archive.extract(member, destination, filter='data')
+                        else:
+                            archive.extract(member, destination)
+                        if member.isfile():
+                            progress.add_bytes(member.size)
+                            progress.file_done()
+                progress.finish()
+            
+            print_success("Pull complete!")
+            print_info(f"  Files: {progress.files_done}")
+            print_info(f"  Saved to: {os.path.abspath(destination)}")
+            return True
+        
+        except (tarfile.TarError, EOFError, requests.exceptions.RequestException) as e:
+            print_error(f"Pull interrupted: {e}")
+            return False
+        except Exception as e:
+            print_error(f"Error pulling folder: {e}")
+            return False
+    
     def whoami(self) -> bool:
         """Show current user info"""
         if not self.token:
@@ -437,12 +1128,149 @@ class FileVaultClient:
             print_error(f"Error creating folder: {e}")
             return False
 
+    def batch(self, operations: List[dict]) -> List[dict]:
+        """Run file/folder operations through /batch; returns per-operation results"""
+        if not self.token:
+            raise AuthenticationError("Not logged in. Please login first.")
+        
+        results = []
+        for start in range(0, len(operations), BATCH_SIZE):
+            response = self._make_request('POST', '/batch', headers=self.get_headers(),
+                                          json={'operations': operations[start:start + BATCH_SIZE]})
+            if response.status_code != 200:
+                error = response.json().get('error', 'Batch failed')
+                raise FileVaultError(error)
+            results.extend(response.json()['results'])
+        
+        return results
+    
+    def _report_batch(self, results: List[dict], verb: str) -> bool:
+        """Print batch failures and a summary; returns True if everything succeeded"""
+        failures = [result for result in results if result['status'] != 'ok']
+        for failure in failures:
+            print_error(f"Operation {failure['index'] + 1}: {failure.get('error', 'failed')}")
+        
+        succeeded = len(results) - len(failures)
+        if succeeded:
+            print_success(f"{verb} {succeeded} item(s)")
+        return not failures
+    
+    def delete_items(self, ids: List[int], folders: bool = False) -> bool:
+        """Delete several files (or folders) in one request"""
+        item_type = 'folder' if folders else 'file'
+        try:
+            results = self.batch([{'op': 'delete', 'type': item_type, 'id': item_id} for item_id in ids])
+            return self._report_batch(results, 'Deleted')
+        except FileVaultError as e:
+            print_error(f"Error deleting: {e}")
+            return False
+    
+    def move_items(self, ids: List[int], target_id: Optional[int], folders: bool = False) -> bool:
+        """Move several files (or folders) into a folder (None for root) in one request"""
+        if folders:
+            operations = [{'op': 'move', 'type': 'folder', 'id': item_id, 'parent_folder_id': target_id}
+                          for item_id in ids]
+        else:
+            operations = [{'op': 'move', 'type': 'file', 'id': item_id, 'folder_id': target_id}
+                          for item_id in ids]
+        try:
+            results = self.batch(operations)
+            return self._report_batch(results, 'Moved')
+        except FileVaultError as e:
+            print_error(f"Error moving: {e}")
+            return False
+
 
+    def _load_manifest(self, dir_path: Path) -> dict:
+        """Load a directory's push manifest"""
+        manifest_path = dir_path / MANIFEST_FILE
+        if manifest_path.exists():
+            try:
+                with open(manifest_path, 'r') as f:
+                    return json.load(f)
+            except Exception as e:
+                print_warning(f"Could not read manifest, rebuilding it: {e}")
+        return {'files': {}}
+    
+    def _save_manifest(self, dir_path: Path, manifest: dict) -> None:
+        """Save a directory's push manifest"""
+        try:
+            with open(dir_path / MANIFEST_FILE, 'w') as f:
+                json.dump(manifest, f, indent=2, sort_keys=True)
+        except Exception as e:
+            print_warning(f"Could not save manifest: {e}")
+    
+    @staticmethod
+    def _hash_file(file_path: Path) -> str:
+        """Compute a file's SHA-256 hex digest"""
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+        return digest.hexdigest()
+    
+    def _scan_directory(self, dir_path: Path, manifest: dict) -> dict:
+        """
+        Build the current (path -> size, mtime, hash) state of a directory
+        Hashes are reused from the manifest when size and mtime are unchanged
+        """
+        cached = manifest.get('files', {})
+        state = {}
+        
+        for file_path in sorted(dir_path.glob('**/*')):
+            if not file_path.is_file() or file_path.name == MANIFEST_FILE:
+                continue
+            
+            rel_path = file_path.relative_to(dir_path).as_posix()
+            stat = file_path.stat()
+            entry = cached.get(rel_path)
+            
+            if entry and entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime_ns:
+                content_hash = entry['hash']
+            else:
+                content_hash = self._hash_file(file_path)
+            
+            state[rel_path] = {'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'hash': content_hash}
+        
+        return state
+    
+    def sync_manifest(self, entries: List[dict], folder_id: Optional[int] = None) -> List[dict]:
+        """Ask the server which manifest entries need uploading (batched)"""
+        results = []
+        
+        for start in range(0, len(entries), SYNC_BATCH_SIZE):
+            data = {'files': entries[start:start + SYNC_BATCH_SIZE]}
+            if folder_id:
+                data['folder_id'] = folder_id
+            
+            for attempt in range(FILE_MAX_RETRIES + 1):
+                try:
+                    response = self._make_request('POST', '/files/sync',
+                                                  headers=self.get_headers(), json=data)
+                    if response.status_code < 500:
+                        break
+                except NetworkError:
+                    if attempt == FILE_MAX_RETRIES:
+                        raise
+                if attempt < FILE_MAX_RETRIES:
+                    time.sleep(min(2 ** attempt, 30))
+            
+            if response.status_code != 200:
+                error = response.json().get('error', 'Sync failed')
+                raise FileVaultError(error)
+            results.extend(response.json()['results'])
+        
+        return results
+    
     def push(self, directory: str = '.', folder_id: Optional[int] = None) -> bool:
         """
-        Stage and push all project content to the server
-        Acts like 'git push' - scans, stages, and uploads
+        Push new and changed project files to the server
+        Acts like 'git push' - compares against a local manifest and the
+        server's state, uploads only what changed and overwrites in place
         """
+        if not self.token:
+            raise AuthenticationError("Not logged in. Please login first.")
+        
         dir_path = Path(directory)
         if not dir_path.exists():
             print_error(f"Directory not found: {directory}")
@@ -450,27 +1278,52 @@ class FileVaultClient:
 
         print(f"\n{Colors.BOLD}🔍 Assessing project content...{Colors.RESET}")
         
-        # 1. Assess/Stage
-        files = [f for f in dir_path.glob('**/*') if f.is_file()]
-        if not files:
+        # 1. Assess: hash only files whose size/mtime changed since the last push
+        manifest = self._load_manifest(dir_path)
+        state = self._scan_directory(dir_path, manifest)
+        if not state:
             print_warning("No files found to push.")
             return True
 
-        total_size = sum(f.stat().st_size for f in files)
+        total_size = sum(entry['size'] for entry in state.values())
         size_mb = total_size / (1024 * 1024)
-
-        print(f"   Found {len(files)} files ({size_mb:.2f} MB)")
-        print(f"   Staged for upload: {Colors.GREEN}All files{Colors.RESET}")
+        print(f"   Found {len(state)} files ({size_mb:.2f} MB)")
+        
+        # 2. Compare with the server in batched calls
+        entries = [{'path': path, 'hash': entry['hash'], 'size': entry['size']}
+                   for path, entry in state.items()]
+        results = self.sync_manifest(entries, folder_id)
         
-        # 2. Upload
-        print(f"\n{Colors.BOLD}🚀 Pushing to remote server...{Colors.RESET}")
-        results = self.upload_files([str(f) for f in files], folder_id)
+        to_upload = [r['path'] for r in results if r['status'] == 'upload']
+        counts = {}
+        for result in results:
+            counts[result['status']] = counts.get(result['status'], 0) + 1
+            if result['status'] == 'rejected':
+                print_warning(f"Skipping {result['path']}: {result.get('error')}")
         
-        if results['failed'] == 0:
+        print(f"   Unchanged: {counts.get('unchanged', 0)}  "
+              f"Linked: {counts.get('linked', 0)}  "
+              f"Staged for upload: {Colors.GREEN}{len(to_upload)}{Colors.RESET}")
+        
+        # 3. Upload what the server does not have, replacing old versions in place
+        failed = []
+        if to_upload:
+            print(f"\n{Colors.BOLD}🚀 Pushing to remote server...{Colors.RESET}")
+            tasks = [(dir_path / rel_path, folder_id, os.path.dirname(rel_path) or None, True)
+                     for rel_path in to_upload]
+            failed = self.transfer_files(tasks)
+        
+        # 4. Remember what was pushed so the next run can skip re-hashing
+        for task in failed:
+            state.pop(Path(task[0]).relative_to(dir_path).as_posix())
+        manifest['files'] = state
+        self._save_manifest(dir_path, manifest)
+        
+        if not failed:
             print(f"\n{Colors.GREEN}✅ Push complete! All files are safely on the server.{Colors.RESET}")
             return True
         else:
-            print(f"\n{Colors.YELLOW}⚠ Push completed with some errors.{Colors.RESET}")
+            print(f"\n{Colors.YELLOW}⚠ Push completed with {len(failed)} error(s).{Colors.RESET}")
             return False
 
 def main():
@@ -485,14 +1338,20 @@ Commands:
   upload      Upload specific files
   upload-dir  Upload a directory
   list        List files and folders
+  find        Search files by name, type, size or date
   download    Download a file
+  pull        Download a folder (or everything) into a directory
   mkdir       Create a folder
+  rm          Delete files or folders
+  mv          Move files or folders
   whoami      Show current user info
         """)
     
     parser.add_argument('--version', action='version', version=f'FileVault Client v{VERSION}')
     parser.add_argument('--server', default=DEFAULT_SERVER, 
                        help='Server URL (default: http://localhost:5000)')
+    parser.add_argument('--jobs', '-j', type=int, default=DEFAULT_JOBS,
+                       help=f'Number of files to transfer in parallel (default: {DEFAULT_JOBS})')
     
     subparsers = parser.add_subparsers(dest='command', help='Commands')
     
@@ -512,6 +1371,8 @@ Commands:
     upload_parser.add_argument('--folder-id', type=int, help='Folder ID to upload to')
     upload_parser.add_argument('--recursive', '-r', action='store_true', 
                               help='Search directories recursively')
+    upload_parser.add_argument('--extract', '-x', action='store_true',
+                              help='Unpack zip archives into folders on the server')
     
     # Upload directory command
     upload_dir_parser = subparsers.add_parser('upload-dir', help='Upload entire directory')
@@ -523,17 +1384,52 @@ Commands:
     # List files command
     list_parser = subparsers.add_parser('list', help='List files and folders')
     list_parser.add_argument('--folder-id', type=int, help='Folder ID to list')
+    list_parser.add_argument('--sort', choices=['name', 'size', 'date'], default='name',
+                            help='Sort by name, size or date (default: name)')
+    list_parser.add_argument('--desc', action='store_true', help='Sort in descending order')
+    list_parser.add_argument('--limit', type=int, help='Show at most this many entries')
+    
+    # Search command
+    find_parser = subparsers.add_parser('find', help='Search files by name, type, size or date')
+    find_parser.add_argument('query', nargs='?', default='', help='Words the name must contain')
+    find_parser.add_argument('--folder-id', type=int, help='Only search below this folder')
+    find_parser.add_argument('--path', help='Only search below this folder path (e.g. docs/2023)')
+    find_parser.add_argument('--mime', help='MIME type, or a prefix such as image/')
+    find_parser.add_argument('--min-size', type=int, help='Minimum size in bytes')
+    find_parser.add_argument('--max-size', type=int, help='Maximum size in bytes')
+    find_parser.add_argument('--after', help='Created on or after this date (YYYY-MM-DD)')
+    find_parser.add_argument('--before', help='Created before this date (YYYY-MM-DD)')
+    find_parser.add_argument('--folders', action='store_true', help='Search folder names instead')
+    find_parser.add_argument('--limit', type=int, help='Show at most this many matches')
     
     # Download file command
     download_parser = subparsers.add_parser('download', help='Download a file')
     download_parser.add_argument('file_id', type=int, help='File ID to download')
     download_parser.add_argument('--output', '-o', help='Output file path')
+    download_parser.add_argument('--parallel', '-p', type=int, default=1,
+                                 help='Fetch large files over N parallel range requests')
+    
+    # Pull command (whole folder as one streamed archive)
+    pull_parser = subparsers.add_parser('pull', help='Download a folder into a directory')
+    pull_parser.add_argument('directory', nargs='?', default='.', help='Directory to extract into (default: current)')
+    pull_parser.add_argument('--folder-id', type=int, help='Remote folder ID to pull (default: all files)')
     
     # Create folder command
     mkdir_parser = subparsers.add_parser('mkdir', help='Create a new folder')
     mkdir_parser.add_argument('name', help='Folder name')
     mkdir_parser.add_argument('--parent-id', type=int, help='Parent folder ID')
     
+    # Delete command (one batch request for many items)
+    rm_parser = subparsers.add_parser('rm', help='Delete files (or folders with --folders)')
+    rm_parser.add_argument('ids', type=int, nargs='+', help='File IDs (folder IDs with --folders)')
+    rm_parser.add_argument('--folders', action='store_true', help='The IDs are folder IDs')
+    
+    # Move command (one batch request for many items)
+    mv_parser = subparsers.add_parser('mv', help='Move files (or folders with --folders)')
+    mv_parser.add_argument('ids', type=int, nargs='+', help='File IDs (folder IDs with --folders)')
+    mv_parser.add_argument('--to', type=int, help='Target folder ID (omit for root)')
+    mv_parser.add_argument('--folders', action='store_true', help='The IDs are folder IDs')
+    
     # Whoami command
     whoami_parser = subparsers.add_parser('whoami', help='Show current user info')
     
@@ -545,7 +1441,7 @@ Commands:
     
     # Create client
     try:
-        client = FileVaultClient(args.server)
+        client = FileVaultClient(args.server, jobs=args.jobs)
     except Exception as e:
         print_error(f"Failed to initialize client: {e}")
         return 1
@@ -561,7 +1457,7 @@ Commands:
             return 0 if success else 1
             
         elif args.command == 'upload':
-            client.upload_files(args.files, args.folder_id, args.recursive)
+            client.upload_files(args.files, args.folder_id, args.recursive, args.extract)
             return 0
         
         elif args.command == 'upload-dir':
@@ -569,17 +1465,37 @@ Commands:
             return 0
         
         elif args.command == 'list':
-            success = client.list_files(args.folder_id)
+            success = client.list_files(args.folder_id, args.sort,
+                                        'desc' if args.desc else 'asc', args.limit)
+            return 0 if success else 1
+        
+        elif args.command == 'find':
+            filters = {'folder_id': args.folder_id, 'path': args.path, 'mime': args.mime,
+                       'min_size': args.min_size, 'max_size': args.max_size,
+                       'after': args.after, 'before': args.before}
+            success = client.find(args.query, filters, args.folders, args.limit)
             return 0 if success else 1
         
         elif args.command == 'download':
-            success = client.download_file(args.file_id, args.output)
+            success = client.download_file(args.file_id, args.output, args.parallel)
+            return 0 if success else 1
+        
+        elif args.command == 'pull':
+            success = client.pull(args.folder_id, args.directory)
             return 0 if success else 1
         
         elif args.command == 'mkdir':
             success = client.create_folder(args.name, args.parent_id)
             return 0 if success else 1
         
+        elif args.command == 'rm':
+            success = client.delete_items(args.ids, args.folders)
+            return 0 if success else 1
+        
+        elif args.command == 'mv':
+            success = client.move_items(args.ids, args.to, args.folders)
+            return 0 if success else 1
+        
         elif args.command == 'whoami':
             success = client.whoami()
             return 0 if success else 1
@@ -0,0 +1,96 @@
+import os
+import uuid
+import hashlib
+from flask import Request, current_app
+from werkzeug.exceptions import UnsupportedMediaType
+from werkzeug.utils import cached_property
+from werkzeug.wsgi import LimitedStream
+from compression import available_encodings, decoding_reader
+
+# Leading bytes kept from each upload for content-type sniffing
+MIME_SNIFF_BYTES = 512
+
+def new_staging_path():
+    """Reserve a fresh path in the upload staging folder"""
+    staging_folder = current_app.config['UPLOAD_STAGING_FOLDER']
+    os.makedirs(staging_folder, exist_ok=True)
+    return os.path.join(staging_folder, uuid.uuid4().hex)
+
+class StagedUpload:
+    """
+    Writable upload container backed by a staging file
+
+    The multipart parser writes each block of the uploaded file straight
+    into the staging file; the SHA-256 digest, size and leading bytes are
+    taken in the same pass, so the content is never copied or re-read.
+    Closing the container removes the staging file unless it has been
+    moved into the blob store.
+    """
+
+    def __init__(self):
+        self.path = new_staging_path()
+        self.size = 0
+        self.head = b''
+        self._digest = hashlib.sha256()
+        self._file = open(self.path, 'w+b')
+
+    @property
+    def content_hash(self):
+        return self._digest.hexdigest()
+
+    def write(self, data):
+        self._digest.update(data)
+        self.size += len(data)
+        if len(self.head) < MIME_SNIFF_BYTES:
+            self.head += data[:MIME_SNIFF_BYTES - len(self.head)]
+        return self._file.write(data)
+
+    def finish(self):
+        """Flush and close the staging file so it can be renamed into place"""
+        if not self._file.closed:
+            self._file.close()
+
+    def close(self):
+        self.finish()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def __getattr__(self, name):
+        # read/seek/tell/... for consumers that read the upload back
+        return getattr(self._file, name)
+
+class IngestRequest(Request):
+    """
+    Request that streams uploaded files directly into hashed staging files
+
+    Bodies sent with a gzip/zstd Content-Encoding are decoded as they are
+    read; MAX_CONTENT_LENGTH then applies to the decoded size.
+    """
+
+    @cached_property
+    def stream(self):
+        stream = super().stream
+        encoding = self.headers.get('Content-Encoding', 'identity').strip().lower()
+        if encoding == 'identity':
+            return stream
+
+        if encoding not in available_encodings():
+            raise UnsupportedMediaType(f"Unsupported Content-Encoding '{encoding}'")
+
+        decoded = decoding_reader(stream, encoding)
+        if self.max_content_length is None:
+            return decoded
+        return LimitedStream(decoded, self.max_content_length, is_max=True)
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        staged = StagedUpload()
+        self.__dict__.setdefault('staged_uploads', []).append(staged)
+        return staged
+
+    def close(self):
+        # Parsing cut short (a client gone mid-upload, a body over the limit) leaves files out of request.files
+        super().close()
+        for staged in self.__dict__.get('staged_uploads', ()):
+            staged.close()
@@ -0,0 +1,273 @@
+import re
+import hmac
+import time
+import threading
+from collections import Counter as Tally
+from flask import Blueprint, Response, request, g, current_app, has_request_context
+from sqlalchemy import event
+
+metrics_bp = Blueprint('metrics', __name__)
+
+# Upper bounds of the latency buckets, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# Upper bounds of the queries-per-request buckets
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+# How many repeated statements a slow request log line names
+SLOW_REQUEST_TOP_STATEMENTS = 3
+
+def format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+def format_value(value):
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+class Metric:
+    """
+    A named family of samples, one per combination of label values
+
+    Values live in this process only; with several gunicorn workers each
+    scrape sees the worker that happened to answer it.
+    """
+
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.values = {}
+        self.lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def key(self, labels):
+        return tuple(labels[name] for name in self.labels)
+
+    def samples(self):
+        """Yield (suffix, label text, value) for every sample"""
+        with self.lock:
+            values = dict(self.values)
+        for key, value in sorted(values.items()):
+            yield '', format_labels(self.labels, key), value
+
+    def exposition(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        for suffix, labels, value in self.samples():
+            lines.append(f'{self.name}{suffix}{labels} {format_value(value)}')
+        return '\n'.join(lines)
+
+class Counter(Metric):
+    """A total that only goes up"""
+
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+class Gauge(Metric):
+    """A value that goes up and down"""
+
+    kind = 'gauge'
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+class Histogram(Metric):
+    """Observations counted into cumulative buckets, with their count and sum"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        with self.lock:
+            entry = self.values.get(key)
+            if entry is None:
+                entry = self.values[key] = [[0] * len(self.buckets), 0, 0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+                    break
+            entry[1] += 1
+            entry[2] += value
+
+    def samples(self):
+        with self.lock:
+            values = {key: (list(counts), count, total) for key, (counts, count, total) in self.values.items()}
+        for key, (counts, count, total) in sorted(values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                yield '_bucket', format_labels(self.labels, key, [('le', format_value(bound))]), cumulative
+            yield '_bucket', format_labels(self.labels, key, [('le', '+Inf')]), count
+            yield '_count', format_labels(self.labels, key), count
+            yield '_sum', format_labels(self.labels, key), total
+
+REGISTRY = []
+
+REQUEST_SECONDS = Histogram('filevault_http_request_duration_seconds',
+                            'Time taken to handle requests',
+                            labels=('method', 'endpoint'))
+REQUESTS = Counter('filevault_http_requests_total', 'Requests answered',
+                   labels=('method', 'endpoint', 'status'))
+REQUESTS_IN_PROGRESS = Gauge('filevault_http_requests_in_progress', 'Requests being handled',
+                             labels=('method', 'endpoint'))
+REQUEST_BYTES = Counter('filevault_http_request_bytes_total', 'Request body bytes received (as sent on the wire)',
+                        labels=('endpoint',))
+RESPONSE_BYTES = Counter('filevault_http_response_bytes_total', 'Response body bytes sent',
+                         labels=('endpoint',))
+REQUEST_QUERIES = Histogram('filevault_http_request_sql_queries', 'SQL statements executed per request',
+                            labels=('endpoint',), buckets=QUERY_COUNT_BUCKETS)
+REQUEST_SQL_SECONDS = Histogram('filevault_http_request_sql_seconds', 'Time spent in SQL statements per request',
+                                labels=('endpoint',))
+SQL_QUERIES = Counter('filevault_sql_queries_total', 'SQL statements executed, in and out of requests')
+SQL_SECONDS = Counter('filevault_sql_seconds_total', 'Time spent in SQL statements, in and out of requests')
+STORAGE_SECONDS = Histogram('filevault_storage_operation_seconds', 'Time taken by blob storage operations',
+                            labels=('backend', 'operation'))
+STORAGE_ERRORS = Counter('filevault_storage_operation_errors_total', 'Blob storage operations that raised',
+                         labels=('backend', 'operation'))
+CACHE_LOOKUPS = Counter('filevault_cache_lookups_total', 'Metadata cache lookups',
+                        labels=('namespace', 'result'))
+
+def summarize_statement(statement):
+    """Shorten a SQL statement for logging (the column list of a SELECT is dropped)"""
+    statement = ' '.join(statement.split())
+    statement = re.sub(r'^SELECT .*? FROM ', 'SELECT ... FROM ', statement)
+    return statement[:160]
+
+def request_endpoint():
+    """Get the route a request matched, as a low-cardinality label"""
+    if request.url_rule is not None:
+        return request.url_rule.rule
+    return 'unmatched'
+
+class CountingIterable:
+    """Pass a streamed response body through, counting the bytes sent into RESPONSE_BYTES"""
+
+    def __init__(self, iterable, endpoint):
+        self.iterable = iterable
+        self.endpoint = endpoint
+
+    def __iter__(self):
+        sent = 0
+        try:
+            for chunk in self.iterable:
+                sent += len(chunk)
+                yield chunk
+        finally:
+            RESPONSE_BYTES.inc(sent, endpoint=self.endpoint)
+
+    def close(self):
+        # The server closes the body once sent; pass it on so streams release their context
+        close = getattr(self.iterable, 'close', None)
+        if close is not None:
+            close()
+
+def start_request():
+    g.metrics_start = time.perf_counter()
+    g.metrics_endpoint = request_endpoint()
+    g.sql_queries = 0
+    g.sql_seconds = 0.0
+    if current_app.config['SLOW_REQUEST_THRESHOLD'] is not None:
+        g.sql_statements = Tally()
+    REQUESTS_IN_PROGRESS.inc(method=request.method, endpoint=g.metrics_endpoint)
+    if request.content_length:
+        REQUEST_BYTES.inc(request.content_length, endpoint=g.metrics_endpoint)
+
+def finish_request(response):
+    if 'metrics_start' not in g:
+        return response  # An earlier before_request hook answered first
+    endpoint = g.metrics_endpoint
+    REQUESTS.inc(method=request.method, endpoint=endpoint, status=response.status_code)
+
+    if request.method != 'HEAD':
+        if response.content_length is not None:
+            RESPONSE_BYTES.inc(response.content_length, endpoint=endpoint)
+        elif response.is_streamed:
+            response.response = CountingIterable(response.response, endpoint)
+    return response
+
+def end_request(error=None):
+    """Record the request's timings; runs after every request, even one that raised"""
+    start = g.pop('metrics_start', None)
+    if start is None:
+        return
+    elapsed = time.perf_counter() - start
+    endpoint = g.metrics_endpoint
+
+    REQUESTS_IN_PROGRESS.dec(method=request.method, endpoint=endpoint)
+    REQUEST_SECONDS.observe(elapsed, method=request.method, endpoint=endpoint)
+    REQUEST_QUERIES.observe(g.sql_queries, endpoint=endpoint)
+    REQUEST_SQL_SECONDS.observe(g.sql_seconds, endpoint=endpoint)
+
+    threshold = current_app.config['SLOW_REQUEST_THRESHOLD']
+    if threshold is not None and elapsed >= threshold:
+        # Statements run over and over by one request usually point at an N+1 query
+        repeated = '; '.join(f'{count}x {summarize_statement(statement)}'
+                             for statement, count in g.sql_statements.most_common(SLOW_REQUEST_TOP_STATEMENTS)
+                             if count > 1)
+        current_app.logger.warning(
+            f"Slow request: {request.method} {request.path} took {elapsed:.3f}s "
+            f"({g.sql_queries} SQL queries in {g.sql_seconds:.3f}s; repeated: {repeated or 'none'})"
+        )
+
+def instrument_engine(engine):
+    """Time every SQL statement run on an engine, charging it to the current request"""
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('metrics_query_start', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['metrics_query_start'].pop()
+        SQL_QUERIES.inc()
+        SQL_SECONDS.inc(elapsed)
+        if has_request_context() and 'sql_queries' in g:
+            g.sql_queries += 1
+            g.sql_seconds += elapsed
+            if 'sql_statements' in g:
+                g.sql_statements[statement] += 1
+
+def init_metrics(app, engine):
+    """Register the request hooks and SQL timing for an app (for /metrics or the slow request log)"""
+    if not app.config['METRICS_ENABLED'] and app.config['SLOW_REQUEST_THRESHOLD'] is None:
+        return
+    app.before_request(start_request)
+    app.after_request(finish_request)
+    app.teardown_request(end_request)
+    instrument_engine(engine)
+
+@metrics_bp.route('/metrics', methods=['GET'])
+def metrics():
+    """
+    Get this worker's metrics in the Prometheus text format
+
+    Scrapers must send METRICS_TOKEN as a bearer token.
+    """
+    token = current_app.config['METRICS_TOKEN']
+    if not current_app.config['METRICS_ENABLED'] or not token:
+        return {'error': 'Not found'}, 404
+    if not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return {'error': 'Invalid metrics token'}, 401
+
+    body = '\n'.join(metric.exposition() for metric in REGISTRY) + '\n'
+    response = Response(body, mimetype='text/plain')
+    response.headers['Content-Type'] = 'text/plain; version=0.0.4; charset=utf-8'
+    response.cache_control.no_store = True
+    return response
@@ -0,0 +1,276 @@
+import os
+from flask import current_app
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.schema import CreateIndex, CreateTable
+from models import db, User, File, Folder
+from blobstore import blob_relpath, store_blob
+from usage import recalculate_usage
+
+# Indexes created by earlier releases and since replaced by composite ones
+OBSOLETE_INDEXES = ['ix_files_content_hash', 'uq_folders_sibling_name']
+
+# Columns of earlier releases that are no longer stored, by table
+REMOVED_COLUMNS = {
+    'folders': ['folder_path'],  # Folder paths are derived from the parent chain
+}
+
+# Name columns covered by the full-text search index (SQLite FTS5), by table
+SEARCH_INDEXED_COLUMNS = {
+    'files': 'original_filename',
+    'folders': 'folder_name',
+}
+
+def search_index_ddl(table, column):
+    """
+    Statements creating the FTS5 index for one table, its triggers and its initial contents
+
+    The index is an external-content table with trigram tokens, so any
+    substring of a name can be matched; the triggers keep it in step with
+    every insert, rename and delete, including bulk UPDATE/DELETE statements.
+    """
+    fts = f'{table}_fts'
+    insert = f"INSERT INTO {fts}(rowid, {column}) VALUES (new.id, new.{column});"
+    delete = f"INSERT INTO {fts}({fts}, rowid, {column}) VALUES ('delete', old.id, old.{column});"
+    return [
+        f"CREATE VIRTUAL TABLE {fts} USING fts5({column}, content='{table}', content_rowid='id', tokenize='trigram')",
+        f"CREATE TRIGGER {fts}_insert AFTER INSERT ON {table} BEGIN {insert} END",
+        f"CREATE TRIGGER {fts}_delete AFTER DELETE ON {table} BEGIN {delete} END",
+        f"CREATE TRIGGER {fts}_update AFTER UPDATE OF {column} ON {table} BEGIN {delete} {insert} END",
+        f"INSERT INTO {fts}({fts}) VALUES ('rebuild')",
+    ]
+
+def add_missing_columns():
+    """
+    Add columns declared on the models but missing from existing tables
+
+    db.create_all() only creates missing tables, so databases created by an
+    older release need their new (nullable) columns added in place.
+    """
+    inspector = inspect(db.engine)
+    existing_tables = set(inspector.get_table_names())
+
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+
+        existing_columns = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing_columns:
+                continue
+
+            column_type = column.type.compile(dialect=db.engine.dialect)
+            with db.engine.begin() as connection:
+                connection.execute(text(
+                    f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'
+                ))
+
+def drop_removed_columns():
+    """Drop columns that are no longer part of the models"""
+    inspector = inspect(db.engine)
+    existing_tables = set(inspector.get_table_names())
+
+    for table_name, column_names in REMOVED_COLUMNS.items():
+        if table_name not in existing_tables:
+            continue
+
+        existing_columns = {column['name'] for column in inspector.get_columns(table_name)}
+        for column_name in column_names:
+            if column_name not in existing_columns:
+                continue
+
+            try:
+                with db.engine.begin() as connection:
+                    connection.execute(text(f'ALTER TABLE {table_name} DROP COLUMN {column_name}'))
+            except OperationalError as e:
+                # SQLite before 3.35 has no DROP COLUMN; left in place, a NOT NULL column breaks every insert
+                if db.engine.dialect.name != 'sqlite':
+                    raise
+                current_app.logger.info(f"Rebuilding {table_name} to drop {column_name}: {e.orig}")
+                rebuild_table(table_name)
+                break  # The rebuilt table has none of the removed columns
+
+def rebuild_table(table_name):
+    """
+    Recreate a SQLite table as the model declares it, keeping its rows
+
+    The usual SQLite way to change a table: create the new table, copy the
+    rows over, drop the old one and rename. The table's indexes and its
+    search index are dropped with it and recreated later in upgrade_schema.
+    """
+    table = db.metadata.tables[table_name]
+    existing_columns = {column['name'] for column in inspect(db.engine).get_columns(table_name)}
+    columns = ', '.join(column.name for column in table.columns if column.name in existing_columns)
+    create = str(CreateTable(table).compile(dialect=db.engine.dialect)).replace(
+        f'CREATE TABLE {table_name} ', f'CREATE TABLE {table_name}_rebuilt ', 1
+    )
+
+    with db.engine.begin() as connection:
+        connection.execute(text(create))
+        connection.execute(text(f'INSERT INTO {table_name}_rebuilt ({columns}) SELECT {columns} FROM {table_name}'))
+        connection.execute(text(f'DROP TABLE IF EXISTS {table_name}_fts'))
+        connection.execute(text(f'DROP TABLE {table_name}'))
+        connection.execute(text(f'ALTER TABLE {table_name}_rebuilt RENAME TO {table_name}'))
+
+def rename_duplicate_folders():
+    """
+    Give duplicate sibling folders unique names
+
+    Older releases did not enforce unique folder names within a parent, which
+    would keep the unique sibling-name index from being created.
+    """
+    duplicates = db.session.query(Folder.user_id).filter(Folder.deleted_at.is_(None)).group_by(
+        Folder.user_id, Folder.parent_folder_id, Folder.folder_name
+    ).having(db.func.count() > 1).first()
+    if not duplicates:
+        return
+
+    folders = Folder.query.filter(Folder.deleted_at.is_(None)).order_by(Folder.user_id, Folder.parent_folder_id, Folder.id).all()
+    # Every live name is taken up front, so a new `name_<n>` cannot clash with a folder further down the list
+    taken = {(folder.user_id, folder.parent_folder_id, folder.folder_name) for folder in folders}
+    kept = set()
+
+    for folder in folders:
+        key = (folder.user_id, folder.parent_folder_id, folder.folder_name)
+        if key not in kept:
+            kept.add(key)
+            continue
+
+        counter = 1
+        while (folder.user_id, folder.parent_folder_id, f'{folder.folder_name}_{counter}') in taken:
+            counter += 1
+        folder.folder_name = f'{folder.folder_name}_{counter}'
+        taken.add((folder.user_id, folder.parent_folder_id, folder.folder_name))
+        kept.add((folder.user_id, folder.parent_folder_id, folder.folder_name))
+
+    db.session.commit()
+
+def rename_duplicate_files():
+    """
+    Give duplicate file names within a folder unique names
+
+    Concurrent uploads in older releases could store two files under the
+    same name, which would keep the unique file-name index from being created.
+    """
+    duplicates = db.session.query(File.user_id).filter(File.deleted_at.is_(None)).group_by(
+        File.user_id, File.folder_id, File.filename
+    ).having(db.func.count() > 1).first()
+    if not duplicates:
+        return
+
+    files = File.query.filter(File.deleted_at.is_(None)).order_by(File.user_id, File.folder_id, File.id).all()
+    # As for folders, a new `name_<n>` must not clash with any live name, including later ones
+    taken = {(file.user_id, file.folder_id, file.filename) for file in files}
+    kept = set()
+
+    for file in files:
+        key = (file.user_id, file.folder_id, file.filename)
+        if key not in kept:
+            kept.add(key)
+            continue
+
+        base, extension = os.path.splitext(file.filename)
+        counter = 1
+        while (file.user_id, file.folder_id, f'{base}_{counter}{extension}') in taken:
+            counter += 1
+        file.filename = f'{base}_{counter}{extension}'
+        taken.add((file.user_id, file.folder_id, file.filename))
+        kept.add((file.user_id, file.folder_id, file.filename))
+
+    db.session.commit()
+
+def create_missing_indexes():
+    """
+    Create indexes declared on the models but missing from existing tables
+
+    Duplicate names are renamed beforehand, so a unique index that still
+    cannot be created is an error: the name allocator relies on it. Other
+    indexes only speed up queries and are skipped with a warning.
+    """
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            try:
+                with db.engine.begin() as connection:
+                    connection.execute(CreateIndex(index, if_not_exists=True))
+            except (IntegrityError, OperationalError) as e:
+                if index.unique:
+                    raise
+                current_app.logger.warning(f"Could not create index {index.name}: {e.orig}")
+
+def drop_obsolete_indexes():
+    """Drop indexes that have been superseded"""
+    for name in OBSOLETE_INDEXES:
+        with db.engine.begin() as connection:
+            connection.execute(text(f'DROP INDEX IF EXISTS {name}'))
+
+def create_search_index():
+    """
+    Create the SQLite full-text index over file and folder names
+
+    Other databases, and SQLite builds without FTS5 trigram support, are
+    searched with plain LIKE filters instead.
+    """
+    if db.engine.dialect.name != 'sqlite':
+        return
+
+    inspector = inspect(db.engine)
+    for table, column in SEARCH_INDEXED_COLUMNS.items():
+        if inspector.has_table(f'{table}_fts'):
+            continue
+
+        try:
+            with db.engine.begin() as connection:
+                for statement in search_index_ddl(table, column):
+                    connection.execute(text(statement))
+        except OperationalError as e:
+            current_app.logger.warning(f"Could not create search index for {table}: {e.orig}")
+
+def backfill_usage_counters():
+    """Compute storage usage counters that older releases did not maintain"""
+    missing = User.query.filter(User.storage_used.is_(None)).first() or \
+        Folder.query.filter(Folder.total_size.is_(None)).first()
+    if missing:
+        recalculate_usage()
+
+def import_legacy_files():
+    """
+    Move files stored under uploads/user_<id>/ into the blob store
+
+    Older releases kept one physical copy per upload at a path mirroring the
+    folder tree. Files whose content is missing on disk are left untouched.
+    """
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    legacy_files = File.query.filter(File.content_hash.is_(None)).all()
+
+    for file in legacy_files:
+        legacy_path = os.path.join(upload_folder, f'user_{file.user_id}', file.file_path)
+        if not os.path.isfile(legacy_path):
+            continue
+
+        file.content_hash = store_blob(legacy_path, mime_type=file.mime_type)
+        file.file_path = blob_relpath(file.content_hash)
+        db.session.commit()
+
+    # Drop the now-empty legacy directory trees
+    for entry in os.listdir(upload_folder):
+        user_folder = os.path.join(upload_folder, entry)
+        if not entry.startswith('user_') or not os.path.isdir(user_folder):
+            continue
+
+        for dirpath, _, _ in sorted(os.walk(user_folder), key=lambda item: -len(item[0])):
+            try:
+                os.rmdir(dirpath)
+            except OSError:
+                pass
+
+def upgrade_schema():
+    """Bring an existing database and upload folder up to date"""
+    add_missing_columns()
+    drop_removed_columns()
+    drop_obsolete_indexes()
+    rename_duplicate_folders()
+    rename_duplicate_files()
+    create_missing_indexes()
+    create_search_index()
+    backfill_usage_counters()
+    import_legacy_files()
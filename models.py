@@ -12,6 +12,9 @@ class User(db.Model):
     username = db.Column(db.String(80), unique=True, nullable=False, index=True)
     email = db.Column(db.String(120), unique=True, nullable=False, index=True)
     password_hash = db.Column(db.String(255), nullable=False)
+    storage_used = db.Column(db.BigInteger, nullable=False, default=0)  # Bytes in live files
+    file_count = db.Column(db.Integer, nullable=False, default=0)  # Number of live files
+    storage_quota = db.Column(db.BigInteger, nullable=True)  # Bytes; None uses DEFAULT_STORAGE_QUOTA
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Relationships
@@ -39,45 +42,150 @@ class User(db.Model):
 class Folder(db.Model):
     """Folder model for organizing files"""
     __tablename__ = 'folders'
+    __table_args__ = (
+        # Listing children (name/date order) and sibling-name lookups
+        db.Index('ix_folders_user_parent_name', 'user_id', 'parent_folder_id', 'folder_name', 'id'),
+        db.Index('ix_folders_user_parent_created', 'user_id', 'parent_folder_id', 'created_at', 'id'),
+        # Live sibling folder names are unique; COALESCE so root folders (NULL parent) are covered too
+        db.Index('uq_folders_sibling_name_live', 'user_id', db.func.coalesce(db.text('parent_folder_id'), 0),
+                 'folder_name', unique=True,
+                 sqlite_where=db.text('deleted_at IS NULL'), postgresql_where=db.text('deleted_at IS NULL')),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     folder_name = db.Column(db.String(255), nullable=False)
     parent_folder_id = db.Column(db.Integer, db.ForeignKey('folders.id'), nullable=True)
-    folder_path = db.Column(db.String(1000), nullable=False)  # Full path from root
+    total_size = db.Column(db.BigInteger, nullable=False, default=0)  # Bytes in live files of the whole subtree
+    file_count = db.Column(db.Integer, nullable=False, default=0)  # Live files in the whole subtree
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    deleted_at = db.Column(db.DateTime, nullable=True)  # Set when queued for background deletion
     
     # Self-referential relationship for nested folders
     subfolders = db.relationship('Folder', backref=db.backref('parent', remote_side=[id]), 
                                  lazy='dynamic', cascade='all, delete-orphan')
     files = db.relationship('File', backref='folder', lazy='dynamic', cascade='all, delete-orphan')
     
-    def to_dict(self):
-        """Convert folder to dictionary"""
+    def ancestors_cte(self):
+        """Recursive CTE over this folder and its ancestors (depth 0 is the folder itself)"""
+        ancestors = db.select(
+            Folder.id, Folder.parent_folder_id, Folder.folder_name, db.literal(0).label('depth')
+        ).where(Folder.id == self.id).cte('ancestors', recursive=True)
+        
+        return ancestors.union_all(
+            db.select(
+                Folder.id, Folder.parent_folder_id, Folder.folder_name, (ancestors.c.depth + 1).label('depth')
+            ).where(Folder.id == ancestors.c.parent_folder_id)
+        )
+    
+    def subtree_cte(self):
+        """Recursive CTE over this folder and its descendants (depth 0 is the folder itself)"""
+        subtree = db.select(Folder.id, db.literal(0).label('depth')).where(
+            Folder.id == self.id
+        ).cte('subtree', recursive=True)
+        
+        return subtree.union_all(
+            db.select(Folder.id, (subtree.c.depth + 1).label('depth')).where(
+                Folder.user_id == self.user_id,
+                Folder.parent_folder_id == subtree.c.id
+            )
+        )
+    
+    def get_ancestor_ids(self):
+        """Get IDs of this folder and its ancestors, nearest first"""
+        ancestors = self.ancestors_cte()
+        return db.session.execute(
+            db.select(ancestors.c.id).order_by(ancestors.c.depth)
+        ).scalars().all()
+    
+    def get_path(self):
+        """Get the folder's full path from root (derived from the parent chain)"""
+        ancestors = self.ancestors_cte()
+        names = db.session.execute(
+            db.select(ancestors.c.folder_name).order_by(ancestors.c.depth.desc())
+        ).scalars().all()
+        return '/'.join(names)
+    
+    @staticmethod
+    def get_paths(folder_ids):
+        """Get the full paths of several folders with one query, as {folder_id: path}"""
+        if not folder_ids:
+            return {}
+        
+        chain = db.select(
+            Folder.id.label('start_id'), Folder.parent_folder_id, Folder.folder_name, db.literal(0).label('depth')
+        ).where(Folder.id.in_(folder_ids)).cte('chain', recursive=True)
+        chain = chain.union_all(
+            db.select(
+                chain.c.start_id, Folder.parent_folder_id, Folder.folder_name, (chain.c.depth + 1).label('depth')
+            ).where(Folder.id == chain.c.parent_folder_id)
+        )
+        
+        names = {}
+        for start_id, folder_name in db.session.execute(
+            db.select(chain.c.start_id, chain.c.folder_name).order_by(chain.c.start_id, chain.c.depth.desc())
+        ):
+            names.setdefault(start_id, []).append(folder_name)
+        return {folder_id: '/'.join(parts) for folder_id, parts in names.items()}
+    
+    def to_dict(self, path=None):
+        """
+        Convert folder to dictionary
+        Pass `path` when it is already known to avoid walking the parent chain
+        """
         return {
             'id': self.id,
             'name': self.folder_name,
             'parent_folder_id': self.parent_folder_id,
-            'path': self.folder_path,
+            'path': path if path is not None else self.get_path(),
+            'size': self.total_size,
+            'file_count': self.file_count,
             'created_at': self.created_at.isoformat(),
             'type': 'folder'
         }
 
 
+class Blob(db.Model):
+    """Content-addressed file content, shared by every File with the same bytes"""
+    __tablename__ = 'blobs'
+    
+    content_hash = db.Column(db.String(64), primary_key=True)  # SHA-256 hex digest
+    size = db.Column(db.BigInteger, nullable=False)  # Size in bytes
+    encoding = db.Column(db.String(10), nullable=True)  # Compression at rest (gzip/zstd); None if stored as is
+    stored_size = db.Column(db.BigInteger, nullable=True)  # Bytes held in storage when compressed
+    ref_count = db.Column(db.Integer, nullable=False, default=0)  # Number of File rows using it
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
 class File(db.Model):
     """File model for storing file metadata"""
     __tablename__ = 'files'
+    __table_args__ = (
+        # Name lookups within a folder, and listing in each supported sort order
+        db.Index('ix_files_user_folder_filename', 'user_id', 'folder_id', 'filename'),
+        db.Index('ix_files_user_folder_name', 'user_id', 'folder_id', 'original_filename', 'id'),
+        db.Index('ix_files_user_folder_size', 'user_id', 'folder_id', 'file_size', 'id'),
+        db.Index('ix_files_user_folder_created', 'user_id', 'folder_id', 'created_at', 'id'),
+        # "Which of these hashes does the user already store" (/files/sync)
+        db.Index('ix_files_user_hash', 'user_id', 'content_hash'),
+        # Live display names are unique within a folder; COALESCE so root files (NULL folder) are covered too
+        db.Index('uq_files_folder_filename_live', 'user_id', db.func.coalesce(db.text('folder_id'), 0),
+                 'filename', unique=True,
+                 sqlite_where=db.text('deleted_at IS NULL'), postgresql_where=db.text('deleted_at IS NULL')),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     folder_id = db.Column(db.Integer, db.ForeignKey('folders.id'), nullable=True)
     filename = db.Column(db.String(255), nullable=False)  # Stored filename (may be modified for uniqueness)
     original_filename = db.Column(db.String(255), nullable=False)  # Original upload filename
-    file_path = db.Column(db.String(1000), nullable=False)  # Physical file path on disk
+    file_path = db.Column(db.String(1000), nullable=False)  # Physical path, relative to the blob store
+    content_hash = db.Column(db.String(64), db.ForeignKey('blobs.content_hash'), nullable=True)
     file_size = db.Column(db.BigInteger, nullable=False)  # Size in bytes
     mime_type = db.Column(db.String(100))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    deleted_at = db.Column(db.DateTime, nullable=True)  # Set when queued for background deletion
     
     def to_dict(self):
         """Convert file to dictionary"""
@@ -88,7 +196,89 @@ class File(db.Model):
             'folder_id': self.folder_id,
             'size': self.file_size,
             'mime_type': self.mime_type,
+            'hash': self.content_hash,
             'created_at': self.created_at.isoformat(),
             'updated_at': self.updated_at.isoformat(),
             'type': 'file'
         }
+
+
+class NameCounter(db.Model):
+    """Highest `name_<n>` suffix handed out for a display name within a folder"""
+    __tablename__ = 'name_counters'
+    
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    folder_key = db.Column(db.Integer, primary_key=True)  # Folder id, 0 for the root
+    filename = db.Column(db.String(255), primary_key=True)
+    last_suffix = db.Column(db.Integer, nullable=False, default=0)
+
+
+class UploadSession(db.Model):
+    """Resumable chunked upload in progress"""
+    __tablename__ = 'upload_sessions'
+    
+    id = db.Column(db.String(32), primary_key=True)  # Random hex token
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    folder_id = db.Column(db.Integer, db.ForeignKey('folders.id'), nullable=True)
+    original_filename = db.Column(db.String(255), nullable=False)
+    target_path = db.Column(db.String(1000), nullable=True)  # Relative folder path below folder_id
+    on_conflict = db.Column(db.String(10), nullable=False, default='rename')  # On completion: rename, overwrite or reject
+    extract = db.Column(db.Boolean)  # Unpack the uploaded zip archive on completion
+    total_size = db.Column(db.BigInteger, nullable=False)  # Declared size in bytes
+    received_size = db.Column(db.BigInteger, nullable=False, default=0)  # Last acknowledged offset
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+    
+    def to_dict(self):
+        """Convert upload session to dictionary"""
+        return {
+            'upload_id': self.id,
+            'filename': self.original_filename,
+            'folder_id': self.folder_id,
+            'size': self.total_size,
+            'offset': self.received_size,
+            'on_conflict': self.on_conflict,
+            'extract': bool(self.extract),
+            'created_at': self.created_at.isoformat(),
+            'updated_at': self.updated_at.isoformat()
+        }
+
+
+class DeletionJob(db.Model):
+    """Background deletion of a soft-deleted folder tree or file"""
+    __tablename__ = 'deletion_jobs'
+    __table_args__ = (
+        # Reaper picks the oldest pending (or stalled running) job
+        db.Index('ix_deletion_jobs_status_updated', 'status', 'updated_at'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    folder_id = db.Column(db.Integer, nullable=True)  # Root of the deleted tree (row is gone when done)
+    file_id = db.Column(db.Integer, nullable=True)  # Single deleted file
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, running, done, failed
+    files_deleted = db.Column(db.Integer, nullable=False, default=0)
+    folders_deleted = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.Text)  # Why the last attempt failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)  # Failed attempts so far
+    next_attempt_at = db.Column(db.DateTime)  # When a failed job is retried
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+    
+    def to_dict(self):
+        """Convert deletion job to dictionary"""
+        return {
+            'job_id': self.id,
+            'type': 'folder' if self.folder_id else 'file',
+            'target_id': self.folder_id or self.file_id,
+            'status': self.status,
+            'files_deleted': self.files_deleted,
+            'folders_deleted': self.folders_deleted,
+            'error': self.error,
+            'attempts': self.attempts or 0,
+            'next_attempt_at': self.next_attempt_at.isoformat() if self.next_attempt_at else None,
+            'created_at': self.created_at.isoformat(),
+            'updated_at': self.updated_at.isoformat(),
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
@@ -0,0 +1,233 @@
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from flask import Blueprint, request, jsonify, send_file, current_app
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from models import db, File, Blob
+from blobstore import open_blob
+from utils import validate_path
+
+try:
+    from PIL import Image, ImageDraw, ImageFont, ImageOps
+except ImportError:  # Previews are only made when Pillow is installed
+    Image = None
+
+try:
+    import pypdfium2
+except ImportError:  # Only needed for PDF previews
+    pypdfium2 = None
+
+previews_bp = Blueprint('previews', __name__, url_prefix='/api')
+
+# Longest side of each rendering, in pixels
+PREVIEW_SIZES = {'thumbnail': 256, 'preview': 1024}
+
+PREVIEW_JPEG_QUALITY = 80
+
+# How much of a text file is drawn, and the page it is drawn on
+TEXT_PREVIEW_BYTES = 4096
+TEXT_PREVIEW_LINES = 40
+TEXT_PREVIEW_COLUMNS = 80
+TEXT_PREVIEW_PAGE = (640, 800)
+
+# Image types Pillow is trusted to decode (SVG and friends are not raster images)
+IMAGE_MIME_TYPES = {'image/jpeg', 'image/png', 'image/gif', 'image/webp', 'image/bmp', 'image/tiff'}
+
+def preview_kind(mime_type):
+    """Get how a type is rendered ('image', 'pdf' or 'text'), or None if it has no preview"""
+    if not mime_type:
+        return None
+    mime_type = mime_type.split(';')[0].strip().lower()
+    if mime_type in IMAGE_MIME_TYPES:
+        return 'image'
+    if mime_type == 'application/pdf':
+        return 'pdf'
+    if mime_type.startswith('text/') or mime_type in ('application/json', 'application/xml'):
+        return 'text'
+    return None
+
+def can_preview(mime_type):
+    """Check whether previews can be made for a type with the installed libraries"""
+    kind = preview_kind(mime_type)
+    if kind is None or Image is None or not current_app.config['PREVIEWS_ENABLED']:
+        return False
+    return kind != 'pdf' or pypdfium2 is not None
+
+def preview_path(content_hash, size):
+    """Get where a rendering of some content is cached (previews are shared by identical files)"""
+    return validate_path(current_app.config['PREVIEW_FOLDER'],
+                         f'{content_hash[:2]}/{content_hash[2:4]}/{content_hash}-{size}.jpg')
+
+def failure_marker(content_hash):
+    """Get the path recording that some content could not be rendered"""
+    return validate_path(current_app.config['PREVIEW_FOLDER'],
+                         f'{content_hash[:2]}/{content_hash[2:4]}/{content_hash}.failed')
+
+def render_image(source):
+    """Decode an image, upright as its EXIF orientation says"""
+    image = Image.open(source)
+    # Let JPEG decode at a reduced scale instead of at full resolution
+    image.draft('RGB', (PREVIEW_SIZES['preview'],) * 2)
+    image = ImageOps.exif_transpose(image)
+    image.load()
+    return image
+
+def render_pdf(source):
+    """Render the first page of a PDF (pdfium needs a seekable file, so a copy is made)"""
+    with tempfile.TemporaryFile(dir=current_app.config['UPLOAD_STAGING_FOLDER']) as copy:
+        shutil.copyfileobj(source, copy)
+        copy.seek(0)
+        document = pypdfium2.PdfDocument(copy)
+        try:
+            page = document[0]
+            width, height = page.get_size()
+            scale = PREVIEW_SIZES['preview'] / max(width, height, 1)
+            return page.render(scale=scale).to_pil()
+        finally:
+            document.close()
+
+def render_text(source):
+    """Draw the first lines of a text file on a page"""
+    text = source.read(TEXT_PREVIEW_BYTES).decode('utf-8', errors='replace')
+    lines = [line[:TEXT_PREVIEW_COLUMNS] for line in text.expandtabs(4).splitlines()[:TEXT_PREVIEW_LINES]]
+
+    image = Image.new('RGB', TEXT_PREVIEW_PAGE, 'white')
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.load_default()
+    draw.multiline_text((16, 16), '\n'.join(lines), fill='black', font=font, spacing=6)
+    return image
+
+RENDERERS = {'image': render_image, 'pdf': render_pdf, 'text': render_text}
+
+def save_rendering(image, path, size):
+    """Scale a rendering down and write it as JPEG, atomically"""
+    image = image.copy()
+    image.thumbnail((size, size))
+    if image.mode != 'RGB':
+        # Flatten transparency onto white instead of black
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.convert('RGBA').getchannel('A'))
+        image = background
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f'{path}.{threading.get_ident()}.tmp'
+    image.save(temp_path, 'JPEG', quality=PREVIEW_JPEG_QUALITY, optimize=True)
+    os.replace(temp_path, path)
+
+def generate_previews(content_hash, mime_type):
+    """Render every preview size of some content and cache them on disk"""
+    blob = db.session.get(Blob, content_hash)
+    if blob is None:
+        return  # Deleted while queued
+    try:
+        with open_blob(blob) as source:
+            image = RENDERERS[preview_kind(mime_type)](source)
+    finally:
+        db.session.commit()  # Don't hold a transaction open while rendering
+
+    for size, pixels in PREVIEW_SIZES.items():
+        save_rendering(image, preview_path(content_hash, size), pixels)
+
+def delete_previews(content_hash):
+    """Remove the cached renderings of content that is no longer stored"""
+    for path in [preview_path(content_hash, size) for size in PREVIEW_SIZES] + [failure_marker(content_hash)]:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+class PreviewPool:
+    """
+    Background threads rendering previews for this process
+
+    Each piece of content is queued at most once at a time. Pillow and
+    pdfium release the GIL while decoding and scaling, so threads are enough.
+    """
+
+    def __init__(self, app, workers):
+        self.app = app
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='preview')
+        self.pending = set()
+        self.lock = threading.Lock()
+
+    def submit(self, content_hash, mime_type):
+        with self.lock:
+            if content_hash in self.pending:
+                return
+            self.pending.add(content_hash)
+        self.executor.submit(self.run, content_hash, mime_type)
+
+    def run(self, content_hash, mime_type):
+        with self.app.app_context():
+            try:
+                generate_previews(content_hash, mime_type)
+            except FileNotFoundError:
+                current_app.logger.warning(f"Skipping previews of {content_hash}: content not found")
+            except Exception as e:
+                # Don't try again on every request for content that cannot be rendered
+                current_app.logger.warning(f"Could not render previews of {content_hash}: {e}")
+                marker = failure_marker(content_hash)
+                os.makedirs(os.path.dirname(marker), exist_ok=True)
+                open(marker, 'wb').close()
+            finally:
+                with self.lock:
+                    self.pending.discard(content_hash)
+
+def get_preview_pool():
+    """Get the app's preview workers (started on first use)"""
+    pool = current_app.extensions.get('previews')
+    if pool is None:
+        pool = PreviewPool(current_app._get_current_object(), current_app.config['PREVIEW_WORKERS'])
+        current_app.extensions['previews'] = pool
+    return pool
+
+def queue_previews(contents):
+    """Queue previews for newly stored (content hash, MIME type) pairs that don't have them yet"""
+    for content_hash, mime_type in contents:
+        if can_preview(mime_type) and not os.path.exists(preview_path(content_hash, 'thumbnail')):
+            get_preview_pool().submit(content_hash, mime_type)
+
+@previews_bp.route('/files/<int:file_id>/thumbnail', methods=['GET'])
+@jwt_required()
+def get_thumbnail(file_id):
+    """
+    Get a small JPEG rendering of an image, PDF or text file
+
+    `size` is `thumbnail` (default, 256px) or `preview` (1024px). Renderings
+    are made in the background, so until one is ready the answer is 202
+    with Retry-After. Passing the file's `hash` as `v` lets the browser
+    keep the rendering without revalidating.
+    """
+    user_id = get_jwt_identity()
+    size = request.args.get('size', 'thumbnail')
+
+    if size not in PREVIEW_SIZES:
+        return jsonify({'error': "Size must be 'thumbnail' or 'preview'"}), 400
+
+    file = File.query.filter_by(id=file_id, user_id=user_id, deleted_at=None).first()
+    if not file:
+        return jsonify({'error': 'File not found'}), 404
+    if not can_preview(file.mime_type):
+        return jsonify({'error': 'No preview available for this file'}), 404
+
+    path = preview_path(file.content_hash, size)
+    if not os.path.exists(path):
+        if os.path.exists(failure_marker(file.content_hash)):
+            return jsonify({'error': 'Preview could not be generated'}), 404
+        queue_previews([(file.content_hash, file.mime_type)])
+        response = jsonify({'status': 'pending'})
+        response.status_code = 202
+        response.headers['Retry-After'] = '1'
+        return response
+
+    # send_file marks the response no-cache, so it is revalidated against the ETag by default
+    response = send_file(path, mimetype='image/jpeg', etag=f'{file.content_hash}-{size}', conditional=True)
+    response.cache_control.private = True
+    if request.args.get('v') == file.content_hash:
+        # The URL names the content, so it never changes
+        response.cache_control.no_cache = None
+        response.cache_control.max_age = 365 * 24 * 3600
+        response.cache_control.immutable = True
+    return response
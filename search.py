@@ -0,0 +1,149 @@
+from datetime import datetime
+from flask import Blueprint, request, jsonify, current_app
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from sqlalchemy import inspect
+from models import db, File, Folder
+from utils import split_relative_path
+from file_manager import resolve_folder_path
+
+search_bp = Blueprint('search', __name__, url_prefix='/api')
+
+# Shortest term the trigram index can match; shorter terms fall back to LIKE
+MIN_INDEXED_TERM_LENGTH = 3
+
+# FTS5 tables maintained by migrations.create_search_index
+FILES_FTS = db.table('files_fts', db.column('rowid'))
+FOLDERS_FTS = db.table('folders_fts', db.column('rowid'))
+
+def search_index_available():
+    """Check (once per app) whether the FTS5 search index exists"""
+    available = current_app.extensions.get('search_index')
+    if available is None:
+        available = db.engine.dialect.name == 'sqlite' and inspect(db.engine).has_table('files_fts')
+        current_app.extensions['search_index'] = available
+    return available
+
+def match_terms(query, model, name_column, fts_table, terms):
+    """
+    Restrict a query to names containing every term (case-insensitive)
+
+    Terms long enough for the trigram index are matched through FTS5.
+    Returns the query and the ID column to page by: the index's rowid when
+    it is used, so results are read newest first straight from the index
+    and the scan stops as soon as the page is full.
+    """
+    id_column = model.id
+    indexed = [term for term in terms if len(term) >= MIN_INDEXED_TERM_LENGTH]
+
+    if indexed and search_index_available():
+        expression = ' '.join('"{}"'.format(term.replace('"', '""')) for term in indexed)
+        query = query.join(fts_table, fts_table.c.rowid == model.id).filter(
+            db.text(f'{fts_table.name} MATCH :match').bindparams(match=expression)
+        )
+        id_column = fts_table.c.rowid
+        terms = [term for term in terms if term not in indexed]
+
+    for term in terms:
+        query = query.filter(name_column.icontains(term, autoescape=True))
+
+    return query, id_column
+
+def parse_date(value):
+    """Parse an ISO date or datetime query parameter; raises ValueError"""
+    return datetime.fromisoformat(value) if value else None
+
+@search_bp.route('/search', methods=['GET'])
+@jwt_required()
+def search():
+    """
+    Search the user's whole tree by name and metadata
+
+    `q` matches any part of the name (all words must match). Files can be
+    filtered by `mime` (type or prefix such as `image/`), `min_size`/`max_size`
+    and `after`/`before` (creation date), and the search limited to the
+    subtree of `folder_id` or `path`. `type=folder` searches folder names
+    instead. Results come newest first; pass `next_cursor` as `cursor` for
+    the next page.
+    """
+    user_id = get_jwt_identity()
+    q = request.args.get('q', '').strip()
+    item_type = request.args.get('type', 'file')
+    mime = request.args.get('mime')
+    min_size = request.args.get('min_size', type=int)
+    max_size = request.args.get('max_size', type=int)
+    cursor = request.args.get('cursor', type=int)
+    limit = request.args.get('limit', current_app.config['LIST_PAGE_SIZE'], type=int)
+    limit = max(1, min(limit, current_app.config['LIST_MAX_PAGE_SIZE']))
+
+    if item_type not in ('file', 'folder'):
+        return jsonify({'error': "Type must be 'file' or 'folder'"}), 400
+
+    try:
+        after = parse_date(request.args.get('after'))
+        before = parse_date(request.args.get('before'))
+    except ValueError:
+        return jsonify({'error': 'Dates must be in ISO format (YYYY-MM-DD)'}), 400
+
+    # Optional scope: a folder (by ID or path) and everything below it
+    scope = None
+    folder_id = request.args.get('folder_id', type=int)
+    if folder_id:
+        scope = Folder.query.filter_by(id=folder_id, user_id=user_id, deleted_at=None).first()
+        if not scope:
+            return jsonify({'error': 'Folder not found or access denied'}), 404
+    if request.args.get('path'):
+        try:
+            scope = resolve_folder_path(user_id, scope, split_relative_path(request.args['path']), create=False)
+        except (LookupError, ValueError):
+            return jsonify({'error': 'Folder not found'}), 404
+
+    terms = q.split()
+
+    if item_type == 'folder':
+        model, name_column, fts_table = Folder, Folder.folder_name, FOLDERS_FTS
+        query = Folder.query.filter(Folder.user_id == user_id, Folder.deleted_at.is_(None))
+        if scope:
+            query = query.filter(Folder.parent_folder_id.in_(db.select(scope.subtree_cte().c.id)))
+    else:
+        model, name_column, fts_table = File, File.original_filename, FILES_FTS
+        query = File.query.filter(File.user_id == user_id, File.deleted_at.is_(None))
+        if scope:
+            query = query.filter(File.folder_id.in_(db.select(scope.subtree_cte().c.id)))
+        if mime:
+            query = query.filter(File.mime_type.startswith(mime, autoescape=True) if mime.endswith('/')
+                                 else File.mime_type == mime)
+        if min_size is not None:
+            query = query.filter(File.file_size >= min_size)
+        if max_size is not None:
+            query = query.filter(File.file_size <= max_size)
+
+    if after:
+        query = query.filter(model.created_at >= after)
+    if before:
+        query = query.filter(model.created_at < before)
+
+    query, id_column = match_terms(query, model, name_column, fts_table, terms)
+    if cursor:
+        query = query.filter(id_column < cursor)
+
+    # Fetch one extra item to learn whether another page follows
+    items = query.order_by(id_column.desc()).limit(limit + 1).all()
+    next_cursor = None
+    if len(items) > limit:
+        items.pop()
+        next_cursor = items[-1].id
+
+    # Derive the paths of every containing folder with one query
+    if item_type == 'folder':
+        paths = Folder.get_paths([folder.id for folder in items])
+        results = [folder.to_dict(path=paths.get(folder.id)) for folder in items]
+    else:
+        paths = Folder.get_paths({file.folder_id for file in items if file.folder_id})
+        results = []
+        for file in items:
+            data = file.to_dict()
+            folder_path = paths.get(file.folder_id, '')
+            data['path'] = f'{folder_path}/{file.original_filename}' if folder_path else file.original_filename
+            results.append(data)
+
+    return jsonify({'results': results, 'next_cursor': next_cursor}), 200
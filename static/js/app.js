@@ -1,5 +1,12 @@
 // FileVault - File Manager JavaScript Application
 
+// Files larger than this are sent through a resumable chunked upload session
+const CHUNKED_UPLOAD_THRESHOLD = 8 * 1024 * 1024;
+// How many times a failed chunk is retried before giving up
+const UPLOAD_MAX_RETRIES = 5;
+// How many times a thumbnail that is still being rendered is asked for again
+const THUMBNAIL_MAX_POLLS = 5;
+
 class FileManagerAPI {
     constructor() {
         this.baseURL = '/api';
@@ -38,9 +45,111 @@ class FileManagerAPI {
         return await response.json();
     }
 
-    async listFiles(folderId = null) {
-        const url = folderId 
-            ? `${this.baseURL}/files/list?folder_id=${folderId}`
+    uploadStateKey(file, folderId) {
+        return `upload:${file.name}:${file.size}:${file.lastModified}:${folderId || ''}`;
+    }
+
+    async openUploadSession(file, folderId = null) {
+        // Resume a previous session for the same file if the server still has it
+        const stateKey = this.uploadStateKey(file, folderId);
+        const savedId = localStorage.getItem(stateKey);
+
+        if (savedId) {
+            const response = await fetch(`${this.baseURL}/uploads/${savedId}`, {
+                headers: this.getHeaders()
+            });
+            if (response.ok) {
+                return (await response.json()).upload;
+            }
+        }
+
+        const response = await fetch(`${this.baseURL}/uploads`, {
+            method: 'POST',
+            headers: this.getHeaders(),
+            body: JSON.stringify({ filename: file.name, size: file.size, folder_id: folderId })
+        });
+        const result = await response.json();
+
+        if (!response.ok) {
+            throw new Error(result.error || 'Could not start upload');
+        }
+
+        localStorage.setItem(stateKey, result.upload.upload_id);
+        return result.upload;
+    }
+
+    async uploadFileChunked(file, folderId = null, onProgress = null) {
+        const stateKey = this.uploadStateKey(file, folderId);
+        const upload = await this.openUploadSession(file, folderId);
+        const chunkSize = upload.chunk_size || CHUNKED_UPLOAD_THRESHOLD;
+        let offset = upload.offset;
+        let retries = 0;
+
+        while (offset < file.size) {
+            // Only the current slice is read into memory
+            const chunk = file.slice(offset, offset + chunkSize);
+            let response = null;
+
+            try {
+                response = await fetch(`${this.baseURL}/uploads/${upload.upload_id}?offset=${offset}`, {
+                    method: 'PUT',
+                    headers: {
+                        'Authorization': `Bearer ${this.authToken}`,
+                        'Content-Type': 'application/octet-stream'
+                    },
+                    body: chunk
+                });
+            } catch (error) {
+                response = null;
+            }
+
+            if (response && (response.ok || response.status === 409)) {
+                // 409 means the server is elsewhere; continue from its offset
+                offset = (await response.json()).upload.offset;
+                retries = 0;
+            } else if (response && response.status < 500) {
+                const result = await response.json();
+                throw new Error(result.error || 'Chunk upload failed');
+            } else {
+                retries++;
+                if (retries > UPLOAD_MAX_RETRIES) {
+                    throw new Error('Upload interrupted; upload the file again to resume');
+                }
+                await new Promise(resolve => setTimeout(resolve, Math.min(2 ** retries, 30) * 1000));
+                continue;
+            }
+
+            if (onProgress) {
+                onProgress(offset);
+            }
+        }
+
+        const response = await fetch(`${this.baseURL}/uploads/${upload.upload_id}/complete`, {
+            method: 'POST',
+            headers: this.getHeaders()
+        });
+        const result = await response.json();
+
+        if (!response.ok) {
+            throw new Error(result.error || 'Could not complete upload');
+        }
+
+        localStorage.removeItem(stateKey);
+        return result;
+    }
+
+    async listFiles(folderId = null, options = {}) {
+        const params = new URLSearchParams();
+        
+        if (folderId) params.set('folder_id', folderId);
+        if (options.cursor) params.set('cursor', options.cursor);
+        if (options.sort) params.set('sort', options.sort);
+        if (options.order) params.set('order', options.order);
+        if (options.limit) params.set('limit', options.limit);
+        
+        const query = params.toString();
+        const url = query
+            ? `${this.baseURL}/files/list?${query}`
             : `${this.baseURL}/files/list`;
 
         const response = await fetch(url, {
@@ -58,25 +167,68 @@ class FileManagerAPI {
         });
 
         if (response.ok) {
-            const blob = await response.blob();
-            const contentDisposition = response.headers.get('Content-Disposition');
-            const filename = contentDisposition
-                ? contentDisposition.split('filename=')[1].replace(/"/g, '')
-                : 'download';
+            await this.saveDownload(response);
+        } else {
+            throw new Error('Download failed');
+        }
+    }
 
-            const url = window.URL.createObjectURL(blob);
-            const a = document.createElement('a');
-            a.href = url;
-            a.download = filename;
-            document.body.appendChild(a);
-            a.click();
-            a.remove();
-            window.URL.revokeObjectURL(url);
+    // Fetch a file's thumbnail as an image Blob (null if it has none)
+    async getThumbnail(fileId, hash) {
+        for (let attempt = 0; attempt < THUMBNAIL_MAX_POLLS; attempt++) {
+            // Naming the content in the URL lets the browser cache the thumbnail for good
+            const response = await fetch(`${this.baseURL}/files/${fileId}/thumbnail?v=${hash}`, {
+                headers: {
+                    'Authorization': `Bearer ${this.authToken}`
+                }
+            });
+
+            if (response.status === 202) {
+                // Still being rendered in the background
+                const delay = parseInt(response.headers.get('Retry-After') || '1', 10);
+                await new Promise(resolve => setTimeout(resolve, delay * 1000));
+                continue;
+            }
+
+            return response.ok ? await response.blob() : null;
+        }
+        return null;
+    }
+
+    // Download a folder and everything in it as one zip archive
+    async downloadFolder(folderId) {
+        const response = await fetch(`${this.baseURL}/folders/${folderId}/archive?format=zip`, {
+            headers: {
+                'Authorization': `Bearer ${this.authToken}`
+            }
+        });
+
+        if (response.ok) {
+            await this.saveDownload(response);
         } else {
             throw new Error('Download failed');
         }
     }
 
+    // Hand a download response to the browser as a file, named by its Content-Disposition
+    async saveDownload(response) {
+        const blob = await response.blob();
+        const contentDisposition = response.headers.get('Content-Disposition') || '';
+        const encodedName = contentDisposition.match(/filename\*=UTF-8''([^;]+)/i);
+        const plainName = contentDisposition.match(/filename="?([^";]+)"?/i);
+        const filename = encodedName ? decodeURIComponent(encodedName[1])
+            : plainName ? plainName[1] : 'download';
+
+        const url = window.URL.createObjectURL(blob);
+        const a = document.createElement('a');
+        a.href = url;
+        a.download = filename;
+        document.body.appendChild(a);
+        a.click();
+        a.remove();
+        window.URL.revokeObjectURL(url);
+    }
+
     async createFolder(name, parentFolderId = null) {
         const data = {
             name: name,
@@ -139,6 +291,29 @@ class FileManagerAPI {
 
         return await response.json();
     }
+
+    // Run many operations in one request; results are reported per operation
+    async batch(operations, atomic = false) {
+        const response = await fetch(`${this.baseURL}/batch`, {
+            method: 'POST',
+            headers: this.getHeaders(),
+            body: JSON.stringify({ operations: operations, atomic: atomic })
+        });
+
+        return await response.json();
+    }
+
+    async getUsage(folderId = null) {
+        const url = folderId
+            ? `${this.baseURL}/usage?folder_id=${folderId}`
+            : `${this.baseURL}/usage`;
+
+        const response = await fetch(url, {
+            headers: this.getHeaders()
+        });
+
+        return await response.json();
+    }
 }
 
 // Global API instance
@@ -161,6 +336,35 @@ function getFileIcon(mimeType) {
     return 'bi-file-earmark';
 }
 
+// Types the server renders thumbnails for
+const PREVIEWABLE_TYPES = /^(image\/(jpeg|png|gif|webp|bmp|tiff)|application\/(pdf|json|xml)|text\/)/;
+
+// Swap file icons for thumbnails as the files scroll into view
+const thumbnailObserver = new IntersectionObserver(entries => {
+    for (const entry of entries) {
+        if (entry.isIntersecting) {
+            thumbnailObserver.unobserve(entry.target);
+            loadThumbnail(entry.target);
+        }
+    }
+}, { rootMargin: '200px' });
+
+async function loadThumbnail(element) {
+    try {
+        const blob = await api.getThumbnail(element.dataset.fileId, element.dataset.fileHash);
+        if (!blob || !element.isConnected) return;
+        
+        const img = document.createElement('img');
+        img.className = 'file-thumbnail';
+        img.alt = '';
+        img.src = URL.createObjectURL(blob);
+        img.onload = () => URL.revokeObjectURL(img.src);
+        element.querySelector('.file-icon').replaceChildren(img);
+    } catch (error) {
+        console.error('Error loading thumbnail:', error);
+    }
+}
+
 // Format file size
 function formatFileSize(bytes) {
     const units = ['B', 'KB', 'MB', 'GB', 'TB'];
@@ -181,11 +385,91 @@ function formatDate(dateString) {
     return date.toLocaleDateString() + ' ' + date.toLocaleTimeString();
 }
 
-// Load and display files
+// Listing state for lazy paging through the current folder
+const LIST_PAGE_SIZE = 100;
+const listState = {
+    folderId: null,
+    sort: 'name',
+    order: 'asc',
+    nextCursor: null,
+    loading: false,
+    generation: 0
+};
+
+// Multi-select state: "type-id" -> { type, id }
+const BATCH_SIZE = 1000;
+const selection = new Map();
+
+function toggleSelection(type, id, selected) {
+    const key = `${type}-${id}`;
+    if (selected) {
+        selection.set(key, { type: type, id: id });
+    } else {
+        selection.delete(key);
+    }
+    updateSelectionBar();
+}
+
+function clearSelection() {
+    selection.clear();
+    document.querySelectorAll('.select-checkbox').forEach(checkbox => { checkbox.checked = false; });
+    updateSelectionBar();
+}
+
+function updateSelectionBar() {
+    const bar = document.getElementById('selectionBar');
+    if (!bar) return;
+    
+    bar.style.display = selection.size > 0 ? 'flex' : 'none';
+    document.getElementById('selectionCount').textContent = `${selection.size} selected`;
+}
+
+// Send operations through /api/batch in chunks; returns the failed results
+async function runBatch(operations) {
+    const failures = [];
+    
+    for (let start = 0; start < operations.length; start += BATCH_SIZE) {
+        const result = await api.batch(operations.slice(start, start + BATCH_SIZE));
+        if (!result.results) {
+            throw new Error(result.error || 'Batch failed');
+        }
+        failures.push(...result.results.filter(item => item.status === 'error'));
+    }
+    
+    return failures;
+}
+
+// Render a page of folders and files into the grid
+function renderListPage(data) {
+    const fragment = document.createDocumentFragment();
+    
+    // Folders come first, then files
+    data.folders.forEach(folder => fragment.appendChild(createFolderElement(folder)));
+    data.files.forEach(file => fragment.appendChild(createFileElement(file)));
+    
+    document.getElementById('fileGrid').appendChild(fragment);
+}
+
+// Load and display files (first page; later pages load on scroll)
 async function loadFiles(folderId = null) {
+    const generation = ++listState.generation;
+    listState.folderId = folderId;
+    listState.nextCursor = null;
+    listState.loading = true;
+    clearSelection();
+    
     try {
-        const data = await api.listFiles(folderId);
+        const data = await api.listFiles(folderId, {
+            sort: listState.sort,
+            order: listState.order,
+            limit: LIST_PAGE_SIZE
+        });
+        
+        // Ignore responses for a folder we already navigated away from
+        if (generation !== listState.generation) return;
+        
         api.currentFolderId = folderId;
+        listState.nextCursor = data.next_cursor;
         
         const fileGrid = document.getElementById('fileGrid');
         const emptyState = document.getElementById('emptyState');
@@ -201,32 +485,85 @@ async function loadFiles(folderId = null) {
         fileGrid.style.display = 'grid';
         emptyState.style.display = 'none';
         
-        // Render folders first
-        data.folders.forEach(folder => {
-            const folderElement = createFolderElement(folder);
-            fileGrid.appendChild(folderElement);
-        });
+        renderListPage(data);
+        loadUsage();
         
-        // Render files
-        data.files.forEach(file => {
-            const fileElement = createFileElement(file);
-            fileGrid.appendChild(fileElement);
+    } catch (error) {
+        console.error('Error loading files:', error);
+        showToast('Failed to load files', 'danger');
+    } finally {
+        if (generation === listState.generation) {
+            listState.loading = false;
+        }
+    }
+}
+
+// Show the user's storage usage (maintained server-side, so this is cheap)
+async function loadUsage() {
+    try {
+        const usage = await api.getUsage();
+        const label = usage.quota
+            ? `${formatFileSize(usage.used)} of ${formatFileSize(usage.quota)} used`
+            : `${formatFileSize(usage.used)} used`;
+        document.getElementById('storageUsage').textContent = `${label} · ${usage.file_count} files`;
+    } catch (error) {
+        console.error('Error loading usage:', error);
+    }
+}
+
+// Append the next page of the current folder
+async function loadMoreFiles() {
+    if (listState.loading || !listState.nextCursor) return;
+    
+    const generation = listState.generation;
+    listState.loading = true;
+    
+    try {
+        const data = await api.listFiles(listState.folderId, {
+            cursor: listState.nextCursor,
+            sort: listState.sort,
+            order: listState.order,
+            limit: LIST_PAGE_SIZE
         });
         
+        if (generation !== listState.generation) return;
+        
+        listState.nextCursor = data.next_cursor;
+        renderListPage(data);
+        
     } catch (error) {
-        console.error('Error loading files:', error);
+        console.error('Error loading more files:', error);
         showToast('Failed to load files', 'danger');
+    } finally {
+        if (generation === listState.generation) {
+            listState.loading = false;
+        }
     }
 }
 
+// Change sort order and reload the current folder
+function changeSort(value) {
+    const [sort, order] = value.split('-');
+    listState.sort = sort;
+    listState.order = order;
+    loadFiles(listState.folderId);
+}
+
 // Create folder element
 function createFolderElement(folder) {
     const div = document.createElement('div');
     div.className = 'folder-item';
+    div.dataset.folderId = folder.id;
+    div.dataset.folderName = folder.name;
     div.onclick = () => navigateToFolder(folder.id, folder.name);
     
     div.innerHTML = `
+        <input type="checkbox" class="form-check-input select-checkbox" ${selection.has(`folder-${folder.id}`) ? 'checked' : ''}
+            onclick="event.stopPropagation(); toggleSelection('folder', ${folder.id}, this.checked)">
         <div class="action-buttons">
+            <button class="btn btn-sm btn-outline-success" title="Download as zip" onclick="event.stopPropagation(); downloadFolder(${folder.id})">
+                <i class="bi bi-download"></i>
+            </button>
             <button class="btn btn-sm btn-outline-primary" onclick="event.stopPropagation(); showRenameModal(${folder.id}, 'folder', '${folder.name}')">
                 <i class="bi bi-pencil"></i>
             </button>
@@ -238,7 +575,7 @@ function createFolderElement(folder) {
             <i class="bi bi-folder-fill"></i>
         </div>
         <div class="file-name">${folder.name}</div>
-        <div class="file-meta">Folder</div>
+        <div class="file-meta">${formatFileSize(folder.size || 0)} · ${folder.file_count || 0} files</div>
     `;
     
     return div;
@@ -257,6 +594,8 @@ function createFileElement(file) {
                      file.mime_type?.includes('document') ? 'document' : '';
     
     div.innerHTML = `
+        <input type="checkbox" class="form-check-input select-checkbox" ${selection.has(`file-${file.id}`) ? 'checked' : ''}
+            onclick="toggleSelection('file', ${file.id}, this.checked)">
         <div class="action-buttons">
             <button class="btn btn-sm btn-outline-success" onclick="downloadFile(${file.id})">
                 <i class="bi bi-download"></i>
@@ -275,6 +614,12 @@ function createFileElement(file) {
         <div class="file-meta">${formatFileSize(file.size)}</div>
     `;
     
+    if (PREVIEWABLE_TYPES.test(file.mime_type || '')) {
+        div.dataset.fileId = file.id;
+        div.dataset.fileHash = file.hash;
+        thumbnailObserver.observe(div);
+    }
+    
     return div;
 }
 
@@ -347,20 +692,33 @@ async function uploadFiles(files) {
     uploadZone.appendChild(progressContainer);
     
     let completed = 0;
+    let uploadedBytes = 0;
+    const totalBytes = Array.from(files).reduce((sum, file) => sum + file.size, 0);
+    
+    const updateProgress = (bytes) => {
+        const percentage = totalBytes ? Math.round((bytes / totalBytes) * 100) : 100;
+        document.getElementById('uploadProgressBar').style.width = `${percentage}%`;
+        document.getElementById('uploadStatus').textContent = `${percentage}%`;
+    };
     
     for (const file of files) {
         try {
-            await api.uploadFile(file, api.currentFolderId);
+            if (file.size > CHUNKED_UPLOAD_THRESHOLD) {
+                const startBytes = uploadedBytes;
+                await api.uploadFileChunked(file, api.currentFolderId,
+                    (offset) => updateProgress(startBytes + offset));
+            } else {
+                await api.uploadFile(file, api.currentFolderId);
+            }
             completed++;
             
-            const percentage = Math.round((completed / files.length) * 100);
-            document.getElementById('uploadProgressBar').style.width = `${percentage}%`;
-            document.getElementById('uploadStatus').textContent = `${percentage}%`;
-            
         } catch (error) {
             console.error('Upload error:', error);
             showToast(`Failed to upload ${file.name}`, 'danger');
         }
+        
+        uploadedBytes += file.size;
+        updateProgress(uploadedBytes);
     }
     
     setTimeout(() => {
@@ -462,6 +820,73 @@ async function deleteFolder(folderId) {
     }
 }
 
+// Delete every selected file and folder
+async function deleteSelected() {
+    if (!confirm(`Delete ${selection.size} selected item(s) and all their contents?`)) {
+        return;
+    }
+    
+    const operations = [...selection.values()].map(item => ({ op: 'delete', type: item.type, id: item.id }));
+    
+    try {
+        const failures = await runBatch(operations);
+        if (failures.length > 0) {
+            showToast(`${failures.length} item(s) could not be deleted`, 'danger');
+        } else {
+            showToast('Deleted successfully', 'success');
+        }
+        await loadFiles(api.currentFolderId);
+    } catch (error) {
+        console.error('Batch delete error:', error);
+        showToast('Failed to delete items', 'danger');
+    }
+}
+
+// Move modal: targets are Home, the folders on the breadcrumb path and the current folder's subfolders
+function showMoveModal() {
+    const select = document.getElementById('moveTarget');
+    select.innerHTML = '<option value="">Home</option>';
+    
+    const targets = breadcrumbPath.map(item => ({ id: item.id, name: item.name }));
+    document.querySelectorAll('#fileGrid .folder-item').forEach(element => {
+        targets.push({ id: parseInt(element.dataset.folderId), name: element.dataset.folderName });
+    });
+    
+    targets
+        .filter(target => !selection.has(`folder-${target.id}`) && target.id !== api.currentFolderId)
+        .forEach(target => {
+            const option = document.createElement('option');
+            option.value = target.id;
+            option.textContent = target.name;
+            select.appendChild(option);
+        });
+    
+    new bootstrap.Modal(document.getElementById('moveModal')).show();
+}
+
+async function moveSelected() {
+    const value = document.getElementById('moveTarget').value;
+    const targetId = value ? parseInt(value) : null;
+    
+    const operations = [...selection.values()].map(item => item.type === 'file'
+        ? { op: 'move', type: 'file', id: item.id, folder_id: targetId }
+        : { op: 'move', type: 'folder', id: item.id, parent_folder_id: targetId });
+    
+    try {
+        const failures = await runBatch(operations);
+        bootstrap.Modal.getInstance(document.getElementById('moveModal')).hide();
+        if (failures.length > 0) {
+            showToast(`${failures.length} item(s) could not be moved: ${failures[0].error}`, 'danger');
+        } else {
+            showToast('Moved successfully', 'success');
+        }
+        await loadFiles(api.currentFolderId);
+    } catch (error) {
+        console.error('Batch move error:', error);
+        showToast('Failed to move items', 'danger');
+    }
+}
+
 // Download file
 async function downloadFile(fileId) {
     try {
@@ -473,6 +898,18 @@ async function downloadFile(fileId) {
     }
 }
 
+// Download folder as a zip archive
+async function downloadFolder(folderId) {
+    try {
+        showToast('Preparing folder download...', 'info');
+        await api.downloadFolder(folderId);
+        showToast('Download started', 'success');
+    } catch (error) {
+        console.error('Download error:', error);
+        showToast('Failed to download folder', 'danger');
+    }
+}
+
 // Rename modal
 function showRenameModal(itemId, itemType, currentName) {
     const modal = new bootstrap.Modal(document.getElementById('renameModal'));
@@ -518,5 +955,15 @@ async function performRename() {
 document.addEventListener('DOMContentLoaded', () => {
     if (window.location.pathname === '/dashboard') {
         loadFiles();
+        
+        // Fetch the next page when the end of the grid scrolls into view
+        const sentinel = document.getElementById('loadMoreSentinel');
+        if (sentinel && 'IntersectionObserver' in window) {
+            new IntersectionObserver(entries => {
+                if (entries.some(entry => entry.isIntersecting)) {
+                    loadMoreFiles();
+                }
+            }, { rootMargin: '400px' }).observe(sentinel);
+        }
     }
 });
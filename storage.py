@@ -0,0 +1,329 @@
+import io
+import os
+import time
+import uuid
+import errno
+import shutil
+from flask import current_app
+from utils import validate_path, content_disposition
+from metrics import STORAGE_SECONDS, STORAGE_ERRORS
+
+try:
+    import boto3
+    from botocore.exceptions import ClientError
+except ImportError:  # Only needed for STORAGE_BACKEND=s3
+    boto3 = None
+
+STORAGE_BACKENDS = ('local', 'sharded', 's3')
+
+def blob_relpath(content_hash):
+    """Get a blob's path relative to a storage root (sharded by hash prefix)"""
+    return '/'.join((content_hash[:2], content_hash[2:4], content_hash))
+
+class StorageDriver:
+    """
+    Where blob content is kept
+
+    Blobs are immutable and addressed by their SHA-256 hash. Uploads are
+    always staged on local disk first and handed over with put().
+    """
+
+    def put(self, content_hash, source_path):
+        """Move a finished local file into storage; the source file is consumed"""
+        raise NotImplementedError
+
+    def exists(self, content_hash):
+        raise NotImplementedError
+
+    def open(self, content_hash, size=None):
+        """
+        Open a blob for binary reading; raises FileNotFoundError if missing
+
+        Passing the blob's `size` (when known) lets remote drivers skip a lookup.
+        """
+        raise NotImplementedError
+
+    def delete(self, content_hash):
+        """Remove a blob (no-op if it is already gone)"""
+        raise NotImplementedError
+
+    def local_path(self, content_hash):
+        """Get the blob's path on local disk, or None if it does not live on one"""
+        return None
+
+    def presigned_url(self, content_hash, filename, mime_type, encoding=None):
+        """
+        Get a short-lived URL the client can download from directly, if supported
+        `encoding` is the Content-Encoding to serve the stored bytes with.
+        """
+        return None
+
+class LocalStorage(StorageDriver):
+    """Blobs in a directory tree on local disk"""
+
+    def __init__(self, root):
+        self.root = root
+
+    def local_path(self, content_hash):
+        return validate_path(self.root, blob_relpath(content_hash))
+
+    def put(self, content_hash, source_path):
+        blob_path = self.local_path(content_hash)
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        try:
+            os.replace(source_path, blob_path)
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+            # The staging folder is on another mount: copy beside the blob, then rename into place atomically
+            temp_path = f'{blob_path}.{uuid.uuid4().hex}.tmp'
+            try:
+                shutil.copyfile(source_path, temp_path)
+                os.replace(temp_path, blob_path)
+            except BaseException:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                raise
+            os.remove(source_path)
+
+    def exists(self, content_hash):
+        return os.path.exists(self.local_path(content_hash))
+
+    def open(self, content_hash, size=None):
+        return open(self.local_path(content_hash), 'rb')
+
+    def delete(self, content_hash):
+        try:
+            os.remove(self.local_path(content_hash))
+        except FileNotFoundError:
+            pass
+
+class ShardedStorage(StorageDriver):
+    """
+    Blobs spread over several local roots (e.g. one per disk) by hash
+
+    Each blob has a home root picked from its hash. Lookups fall back to
+    the other roots, so roots can be added without moving existing blobs.
+    """
+
+    def __init__(self, roots):
+        self.shards = [LocalStorage(root) for root in roots]
+
+    def home(self, content_hash):
+        return self.shards[int(content_hash[:8], 16) % len(self.shards)]
+
+    def find(self, content_hash):
+        """Get the shard holding a blob (None if no shard has it)"""
+        home = self.home(content_hash)
+        if home.exists(content_hash):
+            return home
+        for shard in self.shards:
+            if shard is not home and shard.exists(content_hash):
+                return shard
+        return None
+
+    def local_path(self, content_hash):
+        return (self.find(content_hash) or self.home(content_hash)).local_path(content_hash)
+
+    def put(self, content_hash, source_path):
+        self.home(content_hash).put(content_hash, source_path)
+
+    def exists(self, content_hash):
+        return self.find(content_hash) is not None
+
+    def open(self, content_hash, size=None):
+        return open(self.local_path(content_hash), 'rb')
+
+    def delete(self, content_hash):
+        for shard in self.shards:
+            shard.delete(content_hash)
+
+class S3ObjectReader(io.RawIOBase):
+    """
+    Seekable reader over an S3 object
+
+    The object is fetched lazily from the current position with a ranged
+    GET, so seeking to serve a Range request does not transfer skipped bytes.
+    """
+
+    def __init__(self, client, bucket, key, size=None):
+        self.client = client
+        self.bucket = bucket
+        self.key = key
+        self.size = size
+        self.position = 0
+        self.body = None
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            if self.size is None:
+                self.size = self.client.head_object(Bucket=self.bucket, Key=self.key)['ContentLength']
+            offset += self.size
+        if offset != self.position:
+            self.close_body()
+            self.position = offset
+        return self.position
+
+    def readinto(self, buffer):
+        if self.body is None:
+            try:
+                self.body = self.client.get_object(
+                    Bucket=self.bucket, Key=self.key, Range=f'bytes={self.position}-'
+                )['Body']
+            except ClientError as e:
+                if e.response['Error']['Code'] in ('InvalidRange', '416'):
+                    return 0  # Positioned at the end of the object
+                raise
+        data = self.body.read(len(buffer))
+        buffer[:len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+    def close_body(self):
+        if self.body is not None:
+            self.body.close()
+            self.body = None
+
+    def close(self):
+        self.close_body()
+        super().close()
+
+class S3Storage(StorageDriver):
+    """Blobs as objects in an S3-compatible bucket (AWS S3, MinIO, ...)"""
+
+    def __init__(self, bucket, prefix='', endpoint_url=None, region=None,
+                 access_key_id=None, secret_access_key=None, presign_expiry=300):
+        if boto3 is None:
+            raise RuntimeError('The s3 storage backend requires boto3 (pip install boto3)')
+        if not bucket:
+            raise ValueError('S3_BUCKET is required for the s3 storage backend')
+
+        self.bucket = bucket
+        self.prefix = prefix
+        self.presign_expiry = presign_expiry
+        # Credentials fall back to boto3's usual chain (environment, config files, instance role)
+        self.client = boto3.client(
+            's3',
+            endpoint_url=endpoint_url,
+            region_name=region,
+            aws_access_key_id=access_key_id,
+            aws_secret_access_key=secret_access_key
+        )
+
+    def key(self, content_hash):
+        return self.prefix + blob_relpath(content_hash)
+
+    def put(self, content_hash, source_path):
+        # upload_file switches to a multipart upload for large files
+        self.client.upload_file(source_path, self.bucket, self.key(content_hash))
+        os.remove(source_path)
+
+    def exists(self, content_hash):
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self.key(content_hash))
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+        return True
+
+    def open(self, content_hash, size=None):
+        if size is None and not self.exists(content_hash):
+            raise FileNotFoundError(content_hash)
+        return io.BufferedReader(S3ObjectReader(self.client, self.bucket, self.key(content_hash), size))
+
+    def delete(self, content_hash):
+        self.client.delete_object(Bucket=self.bucket, Key=self.key(content_hash))
+
+    def presigned_url(self, content_hash, filename, mime_type, encoding=None):
+        params = {
+            'Bucket': self.bucket,
+            'Key': self.key(content_hash),
+            'ResponseContentDisposition': content_disposition(filename),
+            'ResponseContentType': mime_type or 'application/octet-stream'
+        }
+        if encoding:
+            params['ResponseContentEncoding'] = encoding
+        return self.client.generate_presigned_url('get_object', Params=params, ExpiresIn=self.presign_expiry)
+
+class TimedStorage(StorageDriver):
+    """
+    A driver whose operations are timed into the storage metrics
+
+    Reads from an opened blob are streamed to the client after the
+    request's handler returns, so only the open itself is timed.
+    """
+
+    def __init__(self, driver, backend):
+        self.driver = driver
+        self.backend = backend
+
+    def timed(self, operation, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return getattr(self.driver, operation)(*args, **kwargs)
+        except Exception:
+            STORAGE_ERRORS.inc(backend=self.backend, operation=operation)
+            raise
+        finally:
+            STORAGE_SECONDS.observe(time.perf_counter() - start, backend=self.backend, operation=operation)
+
+    def put(self, content_hash, source_path):
+        return self.timed('put', content_hash, source_path)
+
+    def exists(self, content_hash):
+        return self.timed('exists', content_hash)
+
+    def open(self, content_hash, size=None):
+        return self.timed('open', content_hash, size=size)
+
+    def delete(self, content_hash):
+        return self.timed('delete', content_hash)
+
+    def local_path(self, content_hash):
+        return self.driver.local_path(content_hash)
+
+    def presigned_url(self, content_hash, filename, mime_type, encoding=None):
+        return self.driver.presigned_url(content_hash, filename, mime_type, encoding=encoding)
+
+def create_storage(config):
+    """Build the storage driver selected by STORAGE_BACKEND"""
+    backend = config['STORAGE_BACKEND']
+
+    if backend == 'local':
+        return LocalStorage(config['BLOB_FOLDER'])
+    if backend == 'sharded':
+        return ShardedStorage(config['STORAGE_ROOTS'])
+    if backend == 's3':
+        return S3Storage(
+            config['S3_BUCKET'],
+            prefix=config['S3_KEY_PREFIX'],
+            endpoint_url=config['S3_ENDPOINT_URL'],
+            region=config['S3_REGION'],
+            access_key_id=config['S3_ACCESS_KEY_ID'],
+            secret_access_key=config['S3_SECRET_ACCESS_KEY'],
+            presign_expiry=int(config['STORAGE_PRESIGNED_EXPIRY'].total_seconds())
+        )
+
+    raise ValueError(f"Unknown STORAGE_BACKEND '{backend}' (expected one of {', '.join(STORAGE_BACKENDS)})")
+
+def get_storage():
+    """Get the app's storage driver (created on first use)"""
+    storage = current_app.extensions.get('storage')
+    if storage is None:
+        storage = create_storage(current_app.config)
+        if current_app.config['METRICS_ENABLED']:
+            storage = TimedStorage(storage, current_app.config['STORAGE_BACKEND'])
+        current_app.extensions['storage'] = storage
+    return storage
@@ -0,0 +1,55 @@
+import io
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+from app import create_app
+
+class AppTestCase(unittest.TestCase):
+    """Test case with a fresh app on a temporary SQLite database and blob folder, and one registered user"""
+
+    config = {}
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp, ignore_errors=True)
+
+        self.app = create_app(self.build_config(**self.config))
+        self.client = self.app.test_client()
+        response = self.client.post('/api/auth/register', json={'username': 'user', 'email': 'user@example.com',
+                                                                'password': 'password'})
+        self.headers = {'Authorization': 'Bearer ' + response.get_json()['access_token']}
+        self.user_id = response.get_json()['user']['id']
+
+        self.context = self.app.app_context()
+        self.context.push()
+        self.addCleanup(self.context.pop)
+
+    def build_config(self, **overrides):
+        """Build a config class using the test's temporary folder"""
+        uploads = os.path.join(self.tmp, 'uploads')
+
+        class TestConfig(Config):
+            SQLALCHEMY_DATABASE_URI = f"sqlite:///{os.path.join(self.tmp, 'test.db')}"
+            UPLOAD_FOLDER = uploads
+            UPLOAD_STAGING_FOLDER = os.path.join(uploads, '.staging')
+            BLOB_FOLDER = os.path.join(uploads, 'blobs')
+            STORAGE_ROOTS = [os.path.join(uploads, 'blobs')]
+            PREVIEW_FOLDER = os.path.join(uploads, 'previews')
+            PREVIEWS_ENABLED = False
+            DELETION_REAPER_THREAD = False
+            CACHE_BACKEND = 'none'
+
+        for name, value in overrides.items():
+            setattr(TestConfig, name, value)
+        return TestConfig
+
+    def upload(self, name, content, **form):
+        """Upload a file through the API and return the response"""
+        return self.client.post('/api/files/upload', headers=self.headers, content_type='multipart/form-data',
+                                data={'file': (io.BytesIO(content), name), **form})
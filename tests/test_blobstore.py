@@ -0,0 +1,168 @@
+import os
+import unittest
+from unittest import mock
+
+from support import AppTestCase
+
+import blobstore
+from blobstore import hash_file, store_blob, store_blobs, release_blob, collect_garbage
+from deletion import run_pending_jobs
+from ingest import new_staging_path
+from models import db, Blob, File
+from storage import get_storage
+
+class BlobStoreTestCase(AppTestCase):
+    def staged(self, content):
+        """Write content to a staging file, as an upload would"""
+        path = new_staging_path()
+        with open(path, 'wb') as f:
+            f.write(content)
+        return path
+
+    def blob(self, content):
+        """Get the Blob row holding some content, or None"""
+        path = self.staged(content)
+        content_hash, _ = hash_file(path)
+        os.remove(path)
+        db.session.expire_all()
+        return db.session.get(Blob, content_hash)
+
+class ReferenceFallbackTest(BlobStoreTestCase):
+    """Blob references taken without ON CONFLICT, as on databases that lack it"""
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(blobstore, 'UPSERT_INSERTS', {})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_store_blob_inserts_then_updates(self):
+        store_blob(self.staged(b'one'))
+        store_blob(self.staged(b'one'))
+        db.session.commit()
+
+        blob = self.blob(b'one')
+        self.assertEqual(blob.ref_count, 2)
+        self.assertTrue(get_storage().exists(blob.content_hash))
+
+    def test_store_blobs_counts_repeated_hashes(self):
+        entries = []
+        for content in (b'a', b'b', b'a'):
+            path = self.staged(content)
+            content_hash, size = hash_file(path)
+            entries.append((path, content_hash, size, (None, size)))
+        store_blobs(entries)
+        db.session.commit()
+
+        self.assertEqual((self.blob(b'a').ref_count, self.blob(b'b').ref_count), (2, 1))
+
+    def test_lost_insert_race_retries_update(self):
+        path = self.staged(b'raced')
+        content_hash, size = hash_file(path)
+        real_execute = db.session.execute
+        raced = []
+
+        def execute(statement, *args, **kwargs):
+            result = real_execute(statement, *args, **kwargs)
+            # Another upload inserts the row between our UPDATE and INSERT
+            if getattr(statement, 'is_update', False) and not raced:
+                raced.append(True)
+                real_execute(db.insert(Blob), {'content_hash': content_hash, 'size': size, 'ref_count': 1})
+            return result
+
+        with mock.patch.object(db.session, 'execute', side_effect=execute):
+            store_blob(path, content_hash, size)
+        db.session.commit()
+
+        self.assertEqual(self.blob(b'raced').ref_count, 2)
+
+class ReferenceCountTest(BlobStoreTestCase):
+    def test_duplicate_uploads_share_one_blob(self):
+        first = self.upload('a.txt', b'same').get_json()['file']
+        self.upload('b.txt', b'same')
+        blob = self.blob(b'same')
+        self.assertEqual((Blob.query.count(), blob.ref_count), (1, 2))
+
+        self.client.delete(f"/api/files/{first['id']}", headers=self.headers)
+        run_pending_jobs()
+        blob = self.blob(b'same')
+        self.assertEqual(blob.ref_count, 1)
+        self.assertTrue(get_storage().exists(blob.content_hash))
+
+    def test_overwrite_releases_replaced_content(self):
+        self.upload('a.txt', b'old')
+        old_hash = self.blob(b'old').content_hash
+        self.upload('a.txt', b'new', on_conflict='overwrite')
+
+        self.assertIsNone(self.blob(b'old'))
+        self.assertFalse(get_storage().exists(old_hash))
+        self.assertEqual(self.blob(b'new').ref_count, 1)
+        self.assertEqual(File.query.one().content_hash, self.blob(b'new').content_hash)
+
+    def test_overwrite_keeps_content_used_elsewhere(self):
+        self.upload('a.txt', b'shared')
+        self.upload('b.txt', b'shared')
+        self.upload('a.txt', b'new', on_conflict='overwrite')
+
+        blob = self.blob(b'shared')
+        self.assertEqual(blob.ref_count, 1)
+        self.assertTrue(get_storage().exists(blob.content_hash))
+
+class GarbageCollectionTest(BlobStoreTestCase):
+    def unreferenced(self, content):
+        path = self.staged(content)
+        content_hash, size = hash_file(path)
+        store_blob(path, content_hash, size)
+        release_blob(content_hash)
+        db.session.commit()
+        return content_hash
+
+    def test_rows_are_committed_before_content_is_removed(self):
+        content_hash = self.unreferenced(b'garbage')
+        storage = get_storage()
+        real_delete = storage.delete
+        committed_rows = []
+
+        def delete(key):
+            # Seen from another connection, as a concurrent request would
+            with db.engine.connect() as connection:
+                committed_rows.append(connection.execute(
+                    db.select(Blob.ref_count).where(Blob.content_hash == key)).all())
+            real_delete(key)
+
+        on_delete = mock.Mock()
+        with mock.patch.object(storage, 'delete', side_effect=delete):
+            self.assertEqual(collect_garbage([content_hash], on_delete), 1)
+
+        self.assertEqual(committed_rows, [[]])
+        on_delete.assert_called_once_with(content_hash)
+        self.assertFalse(storage.exists(content_hash))
+        self.assertIsNone(self.blob(b'garbage'))
+
+    def test_content_uploaded_again_is_kept(self):
+        content_hash = self.unreferenced(b'again')
+        real_claim = blobstore.claim_removed_blob
+
+        def claim(*args):
+            # The same content is uploaded after the row is deleted
+            store_blob(self.staged(b'again'))
+            db.session.commit()
+            return real_claim(*args)
+
+        with mock.patch.object(blobstore, 'claim_removed_blob', side_effect=claim):
+            collect_garbage([content_hash])
+
+        self.assertEqual(self.blob(b'again').ref_count, 1)
+        self.assertTrue(get_storage().exists(content_hash))
+
+    def test_referenced_blobs_are_kept(self):
+        path = self.staged(b'used')
+        content_hash, size = hash_file(path)
+        store_blob(path, content_hash, size)
+        db.session.commit()
+
+        self.assertEqual(collect_garbage([content_hash]), 0)
+        self.assertTrue(get_storage().exists(content_hash))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+import os
+import sys
+import unittest
+from datetime import timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cache import MemoryCache, NullCache, create_cache, server_workers
+
+CONFIG = {'CACHE_TTL': timedelta(minutes=5), 'CACHE_MAX_ENTRIES': 2}
+
+class ServerWorkersTest(unittest.TestCase):
+    def test_reads_worker_options(self):
+        self.assertEqual(server_workers(['gunicorn', 'wsgi:app'], {}), 1)
+        self.assertEqual(server_workers(['gunicorn', '-w', '4', 'wsgi:app'], {}), 4)
+        self.assertEqual(server_workers(['gunicorn', '-w3', 'wsgi:app'], {}), 3)
+        self.assertEqual(server_workers(['uvicorn', 'asgi:app', '--workers=2'], {}), 2)
+        self.assertEqual(server_workers(['gunicorn', 'wsgi:app'], {'WEB_CONCURRENCY': '5'}), 5)
+        self.assertEqual(server_workers(['gunicorn', 'wsgi:app'], {'GUNICORN_CMD_ARGS': '--workers 6'}), 6)
+
+class CreateCacheTest(unittest.TestCase):
+    def test_memory_refused_with_several_workers(self):
+        argv = sys.argv
+        sys.argv = ['gunicorn', '-w', '4', 'wsgi:app']
+        try:
+            with self.assertRaises(ValueError):
+                create_cache({**CONFIG, 'CACHE_BACKEND': 'memory'})
+        finally:
+            sys.argv = argv
+
+    def test_backends(self):
+        self.assertIsInstance(create_cache({**CONFIG, 'CACHE_BACKEND': 'none'}).backend, NullCache)
+        with self.assertRaises(ValueError):
+            create_cache({**CONFIG, 'CACHE_BACKEND': 'memcached'})
+
+    def test_memory_cache_evicts_least_recently_used(self):
+        cache = MemoryCache(max_entries=2)
+        cache.set('a', '1')
+        cache.set('b', '2')
+        cache.get('a')
+        cache.set('c', '3')
+        self.assertEqual((cache.get('a'), cache.get('b'), cache.get('c')), ('1', None, '3'))
+
+if __name__ == '__main__':
+    unittest.main()
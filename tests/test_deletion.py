@@ -0,0 +1,83 @@
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+
+from support import AppTestCase
+
+import deletion
+from deletion import run_pending_jobs
+from models import db, Blob, File, Folder, DeletionJob, User
+from storage import get_storage
+
+class ReaperTest(AppTestCase):
+    def create_folder(self, name, parent_id=None):
+        response = self.client.post('/api/folders/create', headers=self.headers,
+                                    json={'name': name, 'parent_folder_id': parent_id})
+        return response.get_json()['folder']['id']
+
+    def test_reaps_deleted_file_and_its_blob(self):
+        file = self.upload('a.txt', b'only copy').get_json()['file']
+        content_hash = db.session.get(File, file['id']).content_hash
+
+        response = self.client.delete(f"/api/files/{file['id']}", headers=self.headers)
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(run_pending_jobs(), 1)
+
+        db.session.expire_all()
+        self.assertIsNone(db.session.get(File, file['id']))
+        self.assertIsNone(db.session.get(Blob, content_hash))
+        self.assertFalse(get_storage().exists(content_hash))
+        self.assertEqual(DeletionJob.query.one().status, 'done')
+
+    def test_reaps_folder_tree_keeping_shared_content(self):
+        parent = self.create_folder('parent')
+        child = self.create_folder('child', parent)
+        self.upload('a.txt', b'shared', folder_id=str(child))
+        kept = self.upload('b.txt', b'shared').get_json()['file']
+
+        self.client.delete(f'/api/folders/{parent}', headers=self.headers)
+        self.assertEqual(run_pending_jobs(), 1)
+
+        db.session.expire_all()
+        job = DeletionJob.query.one()
+        self.assertEqual((job.status, job.files_deleted, job.folders_deleted), ('done', 1, 2))
+        self.assertEqual(Folder.query.count(), 0)
+        self.assertEqual(Blob.query.one().ref_count, 1)
+        self.assertTrue(get_storage().exists(db.session.get(File, kept['id']).content_hash))
+        self.assertEqual(db.session.get(User, self.user_id).file_count, 1)
+
+    def test_failed_job_is_retried_after_backoff(self):
+        file = self.upload('a.txt', b'content').get_json()['file']
+        self.client.delete(f"/api/files/{file['id']}", headers=self.headers)
+
+        with mock.patch.object(deletion, 'reap_file', side_effect=RuntimeError('storage unavailable')):
+            self.assertEqual(run_pending_jobs(), 1)
+
+        job = DeletionJob.query.one()
+        self.assertEqual((job.status, job.attempts, job.error), ('failed', 1, 'storage unavailable'))
+        self.assertGreater(job.next_attempt_at, datetime.utcnow() + timedelta(seconds=30))
+        self.assertEqual(run_pending_jobs(), 0)  # Not due yet
+
+        # A second failure waits twice as long
+        job.next_attempt_at = datetime.utcnow() - timedelta(seconds=1)
+        db.session.commit()
+        with mock.patch.object(deletion, 'reap_file', side_effect=RuntimeError('storage unavailable')):
+            self.assertEqual(run_pending_jobs(), 1)
+        db.session.expire_all()
+        job = DeletionJob.query.one()
+        self.assertEqual(job.attempts, 2)
+        self.assertGreater(job.next_attempt_at, datetime.utcnow() + timedelta(seconds=90))
+
+        # Retrying on request runs it at the next poll
+        response = self.client.post(f'/api/jobs/{job.id}/retry', headers=self.headers)
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(run_pending_jobs(), 1)
+
+        db.session.expire_all()
+        job = DeletionJob.query.one()
+        self.assertEqual((job.status, job.error), ('done', None))
+        self.assertIsNone(db.session.get(File, file['id']))
+        self.assertEqual(self.client.post(f'/api/jobs/{job.id}/retry', headers=self.headers).status_code, 409)
+
+if __name__ == '__main__':
+    unittest.main()
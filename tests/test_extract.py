@@ -0,0 +1,108 @@
+import io
+import os
+import stat
+import zipfile
+import unittest
+
+from support import AppTestCase
+
+from models import db, File, Folder, User
+
+def make_zip(entries, links=(), compression=zipfile.ZIP_DEFLATED):
+    """Build a zip archive from (name, content) pairs and symlink names"""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', compression) as archive:
+        for name, content in entries:
+            archive.writestr(name, content)
+        for name in links:
+            info = zipfile.ZipInfo(name)
+            info.external_attr = (stat.S_IFLNK | 0o777) << 16
+            archive.writestr(info, 'target.txt')
+    return buffer.getvalue()
+
+class ExtractTest(AppTestCase):
+    def extract(self, archive, **form):
+        return self.upload('archive.zip', archive, extract='true', **form)
+
+    def usage(self):
+        db.session.expire_all()
+        user = db.session.get(User, self.user_id)
+        return user.storage_used, user.file_count
+
+    def staging_files(self):
+        return os.listdir(self.app.config['UPLOAD_STAGING_FOLDER'])
+
+    def test_extracts_tree(self):
+        response = self.extract(make_zip([('docs/a.txt', b'a'), ('docs/sub/b.txt', b'bb'), ('top.txt', b'top')]))
+        self.assertEqual(response.status_code, 201, response.get_json())
+        self.assertEqual(response.get_json()['extracted']['files'], 3)
+
+        paths = sorted((file.folder.get_path() if file.folder else '', file.filename) for file in File.query)
+        self.assertEqual(paths, [('', 'top.txt'), ('docs', 'a.txt'), ('docs/sub', 'b.txt')])
+        self.assertEqual(self.usage(), (6, 3))
+
+    def test_escaping_paths_and_links_are_skipped(self):
+        response = self.extract(make_zip([('../evil.txt', b'x'), ('/abs.txt', b'y'), ('a/../../esc.txt', b'z'),
+                                          ('ok.txt', b'ok')], links=['link.txt']))
+        self.assertEqual(response.status_code, 201, response.get_json())
+
+        skipped = {entry['path']: entry['error'] for entry in response.get_json()['extracted']['skipped']}
+        self.assertEqual(skipped, {'../evil.txt': 'Invalid path', '/abs.txt': 'Invalid path',
+                                   'a/../../esc.txt': 'Invalid path', 'link.txt': 'Links are not extracted'})
+        self.assertEqual([file.filename for file in File.query], ['ok.txt'])
+
+    def test_member_limit(self):
+        self.app.config['EXTRACT_MAX_MEMBERS'] = 2
+        response = self.extract(make_zip([(f'{i}.txt', b'.') for i in range(3)]))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('more than 2 entries', response.get_json()['error'])
+        self.assertEqual(File.query.count(), 0)
+
+    def test_size_limit(self):
+        self.app.config['EXTRACT_MAX_SIZE'] = 1000
+        response = self.extract(make_zip([('big.txt', os.urandom(1001))]))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('size limit', response.get_json()['error'])
+
+    def test_ratio_limit(self):
+        response = self.extract(make_zip([('zeros.txt', b'\0' * 1_000_000)]))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('compression ratio', response.get_json()['error'])
+        self.assertEqual(self.staging_files(), [])
+
+    def test_corrupt_archive(self):
+        archive = bytearray(make_zip([('a.txt', bytes(range(256)) * 20)]))
+        archive[30 + len('a.txt')] = 0xFF  # Invalid deflate block type
+        response = self.extract(bytes(archive))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('could not be read', response.get_json()['error'])
+        self.assertEqual(self.staging_files(), [])
+
+    def test_quota_refusal_leaves_nothing_behind(self):
+        user = db.session.get(User, self.user_id)
+        user.storage_quota = 100
+        db.session.commit()
+
+        response = self.extract(make_zip([('q/a.txt', b'a' * 60), ('q/b.txt', b'b' * 60)]))
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual((File.query.count(), Folder.query.count()), (0, 0))
+        self.assertEqual(self.usage(), (0, 0))
+        self.assertEqual(self.staging_files(), [])
+
+    def test_quota_counts_overwrites_net(self):
+        self.assertEqual(self.extract(make_zip([('a.txt', b'a' * 60)])).status_code, 201)
+        user = db.session.get(User, self.user_id)
+        user.storage_quota = 100
+        db.session.commit()
+
+        # Replacing 60 bytes with 70 only adds 10, and the rejected clash adds nothing
+        response = self.extract(make_zip([('a.txt', b'b' * 70), ('c.txt', b'c' * 20)]), on_conflict='overwrite')
+        self.assertEqual(response.status_code, 201, response.get_json())
+        self.assertEqual(self.usage(), (90, 2))
+
+        response = self.extract(make_zip([('a.txt', b'd' * 90), ('e.txt', b'e' * 5)]), on_conflict='reject')
+        self.assertEqual(response.status_code, 201, response.get_json())
+        self.assertEqual(self.usage(), (95, 3))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,29 @@
+import unittest
+
+from support import AppTestCase
+
+from app import create_app
+
+class MetricsDisabledTest(AppTestCase):
+    def test_not_served_by_default(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 404)
+
+    def test_enabling_without_token_refused_at_startup(self):
+        with self.assertRaises(ValueError):
+            create_app(self.build_config(METRICS_ENABLED=True, METRICS_TOKEN=None))
+
+class MetricsEnabledTest(AppTestCase):
+    config = {'METRICS_ENABLED': True, 'METRICS_TOKEN': 'secret'}
+
+    def test_requires_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        self.assertEqual(self.client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code, 401)
+
+        self.client.get('/api/files/list', headers=self.headers)
+        response = self.client.get('/metrics', headers={'Authorization': 'Bearer secret'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('filevault_http_requests_total{method="GET",endpoint="/api/files/list",status="200"}',
+                      response.get_data(as_text=True))
+
+if __name__ == '__main__':
+    unittest.main()
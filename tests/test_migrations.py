@@ -0,0 +1,51 @@
+import unittest
+
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+
+from support import AppTestCase
+
+from migrations import rename_duplicate_files, rename_duplicate_folders, create_missing_indexes
+from models import db, File, Folder
+
+class DuplicateNamesTest(AppTestCase):
+    """Databases from releases without unique name indexes can hold duplicate names"""
+
+    def setUp(self):
+        super().setUp()
+        with db.engine.begin() as connection:
+            connection.execute(text('DROP INDEX uq_folders_sibling_name_live'))
+            connection.execute(text('DROP INDEX uq_files_folder_filename_live'))
+
+    def add_files(self, *names):
+        for name in names:
+            db.session.add(File(user_id=self.user_id, filename=name, original_filename=name,
+                                file_path='legacy', file_size=1))
+        db.session.commit()
+
+    def test_renamed_files_skip_names_used_later(self):
+        # The existing x_1.txt sorts after the duplicate that needs a new name
+        self.add_files('x.txt', 'x.txt', 'x_1.txt', 'x.txt')
+        rename_duplicate_files()
+        create_missing_indexes()
+
+        names = [file.filename for file in File.query.order_by(File.id)]
+        self.assertEqual(names, ['x.txt', 'x_2.txt', 'x_1.txt', 'x_3.txt'])
+
+    def test_renamed_folders_skip_names_used_later(self):
+        for name in ('docs', 'docs', 'docs_1'):
+            db.session.add(Folder(user_id=self.user_id, folder_name=name))
+        db.session.commit()
+        rename_duplicate_folders()
+        create_missing_indexes()
+
+        names = [folder.folder_name for folder in Folder.query.order_by(Folder.id)]
+        self.assertEqual(names, ['docs', 'docs_2', 'docs_1'])
+
+    def test_unique_index_failure_raises(self):
+        self.add_files('y.txt', 'y.txt')
+        with self.assertRaises(IntegrityError):
+            create_missing_indexes()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,191 @@
+import io
+import os
+import sys
+import errno
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+from urllib.parse import urlencode
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import storage
+from storage import LocalStorage, ShardedStorage, S3Storage, blob_relpath
+
+CONTENT = b'hello blob store ' * 100
+CONTENT_HASH = 'ab' * 32
+
+class FakeClientError(Exception):
+    """Stands in for botocore's ClientError, carrying the S3 error code"""
+
+    def __init__(self, code):
+        super().__init__(code)
+        self.response = {'Error': {'Code': code}}
+
+class FakeS3Client:
+    """In-memory stand-in for the boto3 S3 client calls S3Storage makes"""
+
+    def __init__(self):
+        self.objects = {}
+        self.ranges = []
+
+    def upload_file(self, path, bucket, key):
+        with open(path, 'rb') as f:
+            self.objects[(bucket, key)] = f.read()
+
+    def head_object(self, Bucket, Key):
+        if (Bucket, Key) not in self.objects:
+            raise FakeClientError('404')
+        return {'ContentLength': len(self.objects[(Bucket, Key)])}
+
+    def get_object(self, Bucket, Key, Range=None):
+        if (Bucket, Key) not in self.objects:
+            raise FakeClientError('NoSuchKey')
+        data = self.objects[(Bucket, Key)]
+        self.ranges.append(Range)
+        start = int(Range[len('bytes='):-1]) if Range else 0
+        if start >= len(data):
+            raise FakeClientError('InvalidRange')
+        return {'Body': io.BytesIO(data[start:])}
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop((Bucket, Key), None)
+
+    def generate_presigned_url(self, operation, Params, ExpiresIn):
+        return f'https://s3.test/{operation}?{urlencode(Params)}&expires={ExpiresIn}'
+
+class StorageTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp, ignore_errors=True)
+
+    def staged(self, content=CONTENT):
+        """Write content to a fresh staging file, as an upload would"""
+        path = os.path.join(self.tmp, f'staged-{len(os.listdir(self.tmp))}')
+        with open(path, 'wb') as f:
+            f.write(content)
+        return path
+
+class LocalStorageTest(StorageTestCase):
+    def test_put_open_delete(self):
+        driver = LocalStorage(os.path.join(self.tmp, 'blobs'))
+        source = self.staged()
+        driver.put(CONTENT_HASH, source)
+
+        self.assertFalse(os.path.exists(source))
+        self.assertTrue(driver.exists(CONTENT_HASH))
+        self.assertEqual(driver.local_path(CONTENT_HASH), os.path.join(self.tmp, 'blobs', blob_relpath(CONTENT_HASH)))
+        with driver.open(CONTENT_HASH) as f:
+            self.assertEqual(f.read(), CONTENT)
+
+        driver.delete(CONTENT_HASH)
+        self.assertFalse(driver.exists(CONTENT_HASH))
+        driver.delete(CONTENT_HASH)  # Already gone
+
+    def test_put_across_mounts_copies(self):
+        driver = LocalStorage(os.path.join(self.tmp, 'blobs'))
+        source = self.staged()
+        replace = os.replace
+
+        def cross_device_replace(src, dst):
+            # Only the move out of the staging file crosses a mount
+            if src == source:
+                raise OSError(errno.EXDEV, os.strerror(errno.EXDEV))
+            return replace(src, dst)
+
+        with mock.patch.object(storage.os, 'replace', side_effect=cross_device_replace):
+            driver.put(CONTENT_HASH, source)
+
+        self.assertFalse(os.path.exists(source))
+        with driver.open(CONTENT_HASH) as f:
+            self.assertEqual(f.read(), CONTENT)
+        blob_dir = os.path.dirname(driver.local_path(CONTENT_HASH))
+        self.assertEqual(os.listdir(blob_dir), [CONTENT_HASH])
+
+    def test_put_other_errors_raise(self):
+        driver = LocalStorage(os.path.join(self.tmp, 'blobs'))
+        with mock.patch.object(storage.os, 'replace', side_effect=OSError(errno.EACCES, 'denied')):
+            with self.assertRaises(OSError):
+                driver.put(CONTENT_HASH, self.staged())
+
+    def test_rejects_traversal(self):
+        driver = LocalStorage(os.path.join(self.tmp, 'blobs'))
+        with self.assertRaises(ValueError):
+            driver.local_path('../../../../etc/passwd')
+
+class ShardedStorageTest(StorageTestCase):
+    def test_put_goes_home_and_lookups_fall_back(self):
+        roots = [os.path.join(self.tmp, 'disk1'), os.path.join(self.tmp, 'disk2')]
+        driver = ShardedStorage(roots)
+        driver.put(CONTENT_HASH, self.staged())
+
+        home = driver.home(CONTENT_HASH)
+        self.assertTrue(home.exists(CONTENT_HASH))
+
+        # A blob written before a root was added is still found in its old root
+        grown = ShardedStorage(roots + [os.path.join(self.tmp, 'disk3')])
+        self.assertTrue(grown.exists(CONTENT_HASH))
+        with grown.open(CONTENT_HASH) as f:
+            self.assertEqual(f.read(), CONTENT)
+
+        grown.delete(CONTENT_HASH)
+        self.assertFalse(driver.exists(CONTENT_HASH))
+
+class S3StorageTest(StorageTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = FakeS3Client()
+        fake_boto3 = mock.Mock()
+        fake_boto3.client.return_value = self.client
+        for name, value in (('boto3', fake_boto3), ('ClientError', FakeClientError)):
+            patcher = mock.patch.object(storage, name, value, create=True)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.driver = S3Storage('bucket', prefix='blobs/', presign_expiry=60)
+
+    def test_requires_bucket(self):
+        with self.assertRaises(ValueError):
+            S3Storage('')
+
+    def test_put_uploads_and_consumes_source(self):
+        source = self.staged()
+        self.driver.put(CONTENT_HASH, source)
+
+        self.assertFalse(os.path.exists(source))
+        self.assertEqual(self.client.objects[('bucket', 'blobs/' + blob_relpath(CONTENT_HASH))], CONTENT)
+        self.assertTrue(self.driver.exists(CONTENT_HASH))
+        self.assertIsNone(self.driver.local_path(CONTENT_HASH))
+
+    def test_open_reads_and_seeks_with_ranged_gets(self):
+        self.driver.put(CONTENT_HASH, self.staged())
+
+        with self.driver.open(CONTENT_HASH, size=len(CONTENT)) as f:
+            self.assertEqual(f.read(), CONTENT)
+            f.seek(100)
+            self.assertEqual(f.read(20), CONTENT[100:120])
+            f.seek(0, io.SEEK_END)
+            self.assertEqual(f.read(), b'')
+        self.assertIn('bytes=100-', self.client.ranges)
+
+    def test_open_missing_raises(self):
+        with self.assertRaises(FileNotFoundError):
+            self.driver.open(CONTENT_HASH)
+
+    def test_delete(self):
+        self.driver.put(CONTENT_HASH, self.staged())
+        self.driver.delete(CONTENT_HASH)
+        self.assertFalse(self.driver.exists(CONTENT_HASH))
+
+    def test_presigned_url(self):
+        url = self.driver.presigned_url(CONTENT_HASH, 'report.pdf', 'application/pdf', encoding='gzip')
+
+        self.assertTrue(url.startswith('https://s3.test/get_object?'))
+        self.assertIn('Key=blobs%2F' + blob_relpath(CONTENT_HASH).replace('/', '%2F'), url)
+        self.assertIn('ResponseContentType=application%2Fpdf', url)
+        self.assertIn('ResponseContentEncoding=gzip', url)
+        self.assertIn('report.pdf', url)
+        self.assertTrue(url.endswith('expires=60'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+import unittest
+
+from support import AppTestCase
+
+from models import db, User
+from usage import recalculate_usage
+
+class QuotaTest(AppTestCase):
+    def set_quota(self, quota):
+        user = db.session.get(User, self.user_id)
+        user.storage_quota = quota
+        db.session.commit()
+
+    def usage(self):
+        """Get the user's counters, checking them against a recount"""
+        db.session.expire_all()
+        user = db.session.get(User, self.user_id)
+        counters = (user.storage_used, user.file_count)
+        recalculate_usage(self.user_id)
+        db.session.expire_all()
+        user = db.session.get(User, self.user_id)
+        self.assertEqual(counters, (user.storage_used, user.file_count))
+        return counters
+
+    def test_upload_over_quota_refused(self):
+        self.set_quota(100)
+        self.assertEqual(self.upload('a.txt', b'a' * 60).status_code, 201)
+        self.assertEqual(self.upload('b.txt', b'b' * 60).status_code, 413)
+        self.assertEqual(self.usage(), (60, 1))
+
+    def test_overwrite_charges_only_the_growth(self):
+        self.set_quota(100)
+        self.assertEqual(self.upload('a.txt', b'a' * 90).status_code, 201)
+
+        response = self.upload('a.txt', b'b' * 95, on_conflict='overwrite')
+        self.assertEqual(response.status_code, 201, response.get_json())
+        self.assertEqual(self.usage(), (95, 1))
+
+        # Shrinking is always allowed, growing past the quota is not
+        self.assertEqual(self.upload('a.txt', b'c' * 10, on_conflict='overwrite').status_code, 201)
+        self.assertEqual(self.upload('a.txt', b'd' * 101, on_conflict='overwrite').status_code, 413)
+        self.assertEqual(self.usage(), (10, 1))
+
+if __name__ == '__main__':
+    unittest.main()
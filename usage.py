@@ -0,0 +1,149 @@
+from flask import Blueprint, request, jsonify, current_app
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from models import db, User, File, Folder
+from cache import mark_user_changed
+
+usage_bp = Blueprint('usage', __name__, url_prefix='/api')
+
+class QuotaExceededError(Exception):
+    """Raised when a change would take a user over their storage quota"""
+
+def get_quota(user):
+    """Get the user's storage quota in bytes (None for unlimited)"""
+    if user.storage_quota is not None:
+        return user.storage_quota
+    return current_app.config['DEFAULT_STORAGE_QUOTA']
+
+def check_quota(user_id, size):
+    """Raise QuotaExceededError if storing `size` more bytes would exceed the user's quota"""
+    user = db.session.get(User, user_id)
+    quota = get_quota(user)
+    if quota is not None and user.storage_used + size > quota:
+        raise QuotaExceededError()
+
+def charge_user(user_id, size, count, enforce=True):
+    """
+    Add to the user's usage counters with one atomic UPDATE
+
+    With `enforce`, the update only applies while the result stays within
+    the quota, so concurrent uploads cannot overshoot it together.
+    """
+    query = User.query.filter_by(id=user_id)
+    if enforce and size > 0:
+        quota = get_quota(db.session.get(User, user_id))
+        if quota is not None:
+            query = query.filter(User.storage_used + size <= quota)
+
+    updated = query.update({
+        'storage_used': User.storage_used + size,
+        'file_count': User.file_count + count
+    }, synchronize_session=False)
+
+    if not updated:
+        raise QuotaExceededError()
+    # Every change to a user's files goes through here, including bulk ones the ORM doesn't see
+    mark_user_changed(user_id)
+
+def charge_folder(folder_id, size, count):
+    """Add to the subtree totals of a folder and all of its ancestors (no-op for root)"""
+    if not folder_id or not (size or count):
+        return
+
+    ancestors = db.session.get(Folder, folder_id).ancestors_cte()
+    Folder.query.filter(Folder.id.in_(db.select(ancestors.c.id))).update({
+        'total_size': Folder.total_size + size,
+        'file_count': Folder.file_count + count
+    }, synchronize_session=False)
+
+def folder_totals(folder):
+    """Read a folder's current subtree totals as (size, file count)"""
+    return db.session.query(Folder.total_size, Folder.file_count).filter_by(id=folder.id).one()
+
+def recalculate_usage(user_id=None):
+    """
+    Rebuild usage counters from the live file rows
+
+    Used to backfill the counters for databases created by older releases
+    and to repair them; normal operation keeps them up to date incrementally.
+    """
+    users = User.query if user_id is None else User.query.filter_by(id=user_id)
+    file_filter = [File.deleted_at.is_(None)]
+    folder_filter = [Folder.deleted_at.is_(None)]
+    if user_id is not None:
+        file_filter.append(File.user_id == user_id)
+        folder_filter.append(Folder.user_id == user_id)
+
+    user_totals = dict((uid, (size, count)) for uid, size, count in db.session.query(
+        File.user_id, db.func.sum(File.file_size), db.func.count()
+    ).filter(*file_filter).group_by(File.user_id))
+
+    for user in users:
+        user.storage_used, user.file_count = user_totals.get(user.id, (0, 0))
+
+    # Each folder's own files, then rolled up into every ancestor
+    totals = {folder_id: [size, count] for folder_id, size, count in db.session.query(
+        File.folder_id, db.func.sum(File.file_size), db.func.count()
+    ).filter(*file_filter, File.folder_id.isnot(None)).group_by(File.folder_id)}
+
+    parents = dict(db.session.query(Folder.id, Folder.parent_folder_id).filter(*folder_filter))
+    rollup = {folder_id: [0, 0] for folder_id in parents}
+    # Folders awaiting deletion hold nothing
+    Folder.query.filter(Folder.total_size.is_(None)).update(
+        {'total_size': 0, 'file_count': 0}, synchronize_session=False
+    )
+
+    for folder_id, (size, count) in totals.items():
+        while folder_id in rollup:
+            rollup[folder_id][0] += size
+            rollup[folder_id][1] += count
+            folder_id = parents[folder_id]
+
+    if rollup:
+        db.session.execute(db.update(Folder), [
+            {'id': folder_id, 'total_size': size, 'file_count': count}
+            for folder_id, (size, count) in rollup.items()
+        ])
+    db.session.commit()
+
+def usage_summary(user):
+    """Serialize a user's usage and quota"""
+    quota = get_quota(user)
+    return {
+        'used': user.storage_used,
+        'file_count': user.file_count,
+        'quota': quota,
+        'remaining': max(quota - user.storage_used, 0) if quota is not None else None
+    }
+
+@usage_bp.route('/usage', methods=['GET'])
+@jwt_required()
+def get_usage():
+    """
+    Get the user's storage usage and quota, with size rollups of a folder
+
+    Totals are maintained as files change, so this is a handful of indexed
+    lookups however large the tree. `folder_id` selects the folder whose
+    subfolders are rolled up (root if omitted).
+    """
+    user_id = get_jwt_identity()
+    user = db.session.get(User, user_id)
+    folder_id = request.args.get('folder_id', type=int)
+
+    result = usage_summary(user)
+
+    if folder_id:
+        folder = Folder.query.filter_by(id=folder_id, user_id=user_id, deleted_at=None).first()
+        if not folder:
+            return jsonify({'error': 'Folder not found or access denied'}), 404
+        result['folder'] = {'id': folder.id, 'name': folder.folder_name,
+                            'size': folder.total_size, 'file_count': folder.file_count}
+
+    subfolders = Folder.query.filter_by(
+        user_id=user_id, parent_folder_id=folder_id, deleted_at=None
+    ).order_by(Folder.total_size.desc()).limit(current_app.config['LIST_MAX_PAGE_SIZE']).all()
+    result['folders'] = [
+        {'id': f.id, 'name': f.folder_name, 'size': f.total_size, 'file_count': f.file_count}
+        for f in subfolders
+    ]
+
+    return jsonify(result), 200
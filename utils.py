@@ -1,6 +1,9 @@
 import os
 import re
 import mimetypes
+import unicodedata
+from urllib.parse import quote
+from werkzeug.http import dump_options_header
 from werkzeug.utils import secure_filename as werkzeug_secure_filename
 
 def secure_filename_custom(filename):
@@ -19,6 +22,50 @@ def get_mime_type(filename):
     mime_type, _ = mimetypes.guess_type(filename)
     return mime_type or 'application/octet-stream'
 
+# Leading-byte signatures of binary formats, checked before trusting the extension
+MIME_SIGNATURES = [
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+    (b'%PDF-', 'application/pdf'),
+    (b'Rar!\x1a\x07', 'application/vnd.rar'),
+    (b'ID3', 'audio/mpeg'),
+    (b'\xff\xfb', 'audio/mpeg'),
+]
+
+# Container formats shared by several file types; the extension picks the exact type
+ZIP_SIGNATURE = b'PK\x03\x04'
+OLE_SIGNATURE = b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'
+
+def sniff_mime_type(head, filename):
+    """
+    Detect a file's MIME type from its leading bytes, falling back to the filename
+    
+    Binary signatures win over the extension, so e.g. a PNG uploaded as
+    `notes.txt` is recorded as image/png.
+    """
+    guessed = get_mime_type(filename)
+    
+    for signature, mime_type in MIME_SIGNATURES:
+        if head.startswith(signature):
+            return mime_type
+    
+    if head[4:8] == b'ftyp':
+        return 'video/quicktime' if head[8:12] == b'qt  ' else 'video/mp4'
+    if head.startswith(b'RIFF') and head[8:12] == b'AVI ':
+        return 'video/x-msvideo'
+    if head.startswith(ZIP_SIGNATURE):
+        # docx/xlsx/pptx/jar... are zip archives too
+        return guessed if guessed != 'application/octet-stream' and 'text' not in guessed else 'application/zip'
+    if head.startswith(OLE_SIGNATURE):
+        return guessed if 'ms' in guessed else 'application/octet-stream'
+    
+    # Text keeps its extension-based type; other binary content is generic
+    if b'\x00' in head:
+        return 'application/octet-stream'
+    return guessed if guessed != 'application/octet-stream' else 'text/plain'
+
 def format_file_size(bytes_size):
     """Format bytes to human-readable size"""
     for unit in ['B', 'KB', 'MB', 'GB', 'TB']:
@@ -35,12 +82,44 @@ def validate_path(base_path, user_path):
     base = os.path.abspath(base_path)
     target = os.path.abspath(os.path.join(base_path, user_path))
     
-    # Check if target path starts with base path
-    if not target.startswith(base):
+    # Compare whole components, so a sibling like '/base-other' is not taken for '/base'
+    if os.path.commonpath([base, target]) != base:
         raise ValueError("Invalid path detected")
     
     return target
 
+def content_disposition(filename):
+    """
+    Build an attachment Content-Disposition header for a download name
+    Non-ASCII names get an RFC 5987 `filename*` with an ASCII fallback
+    """
+    try:
+        filename.encode('ascii')
+    except UnicodeEncodeError:
+        fallback = unicodedata.normalize('NFKD', filename).encode('ascii', 'ignore').decode('ascii')
+        return dump_options_header('attachment', {
+            'filename': fallback,
+            'filename*': "UTF-8''" + quote(filename, safe="!#$&+^`|~")
+        })
+    
+    return dump_options_header('attachment', {'filename': filename})
+
+def split_relative_path(path):
+    """
+    Split a client-supplied relative folder path into folder names
+    Rejects parent-directory components to prevent traversal
+    """
+    parts = [part for part in (path or '').replace('\\', '/').split('/') if part and part != '.']
+    
+    if any(part == '..' for part in parts):
+        raise ValueError("Invalid path detected")
+    
+    return parts
+
+def str_to_bool(value):
+    """Interpret a form/query string value as a boolean flag"""
+    return str(value).strip().lower() in ('1', 'true', 'yes', 'on')
+
 def create_user_directory(base_upload_folder, user_id):
     """Create user-specific storage folder"""
     user_folder = os.path.join(base_upload_folder, f'user_{user_id}')
@@ -52,18 +131,6 @@ def allowed_file(filename, allowed_extensions):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in allowed_extensions
 
-def get_unique_filename(directory, filename):
-    """Generate unique filename if file already exists"""
-    base, extension = os.path.splitext(filename)
-    counter = 1
-    new_filename = filename
-    
-    while os.path.exists(os.path.join(directory, new_filename)):
-        new_filename = f"{base}_{counter}{extension}"
-        counter += 1
-    
-    return new_filename
-
 def get_file_icon_class(mime_type):
     """Return CSS class for file icon based on MIME type"""
     if not mime_type: